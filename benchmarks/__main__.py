@@ -0,0 +1,125 @@
+from benchmarks.compare import compare_results, format_comparison
+from benchmarks.load_test import format_summary, run_load_test
+from benchmarks.query_overhead import (
+    format_query_overhead,
+    run_query_overhead
+)
+from benchmarks.suite import SIZES, run_suite
+import click
+import json
+import os
+import sys
+
+
+@click.group()
+def benchmarks():
+    """
+    Benchmarks of the generators and the transaction endpoints
+    """
+    pass
+
+@benchmarks.command("run")
+@click.option("--database",
+              default=os.environ.get('BENCHMARK_DATABASE_URI',
+                                     'postgresql:///portfoliobench'),
+              help="Database to seed, every table in it is dropped")
+@click.option("--sizes", default="small,medium",
+              help="Comma separated dataset sizes: %s" % ', '.join(SIZES))
+@click.option("--repeat", default=3, help="Runs of each benchmark")
+@click.option("--output", default="benchmark_results.json",
+              help="File the results are written to")
+@click.option("--baseline", default=None,
+              help="Results of a previous run to compare against")
+@click.option("--threshold", default=0.1,
+              help="Extra wall time that counts as a regression")
+def run(database, sizes, repeat, output, baseline, threshold):
+    """
+    Runs the benchmarks and writes the results to a JSON file
+    """
+    sizes = [size.strip() for size in sizes.split(',') if size.strip()]
+    for size in sizes:
+        if size not in SIZES:
+            raise click.BadParameter("Unknown size %s" % size,
+                                     param_hint="--sizes")
+    results = run_suite(database, sizes, repeat, click.echo)
+    with open(output, 'w') as output_file:
+        json.dump(results, output_file, indent=2)
+    click.echo("Wrote %s" % output)
+    if baseline is not None:
+        compare_files(baseline, output, threshold)
+
+@benchmarks.command("compare")
+@click.argument("baseline")
+@click.argument("current")
+@click.option("--threshold", default=0.1,
+              help="Extra wall time that counts as a regression")
+def compare(baseline, current, threshold):
+    """
+    Compares two results files, exits with 1 if a benchmark regressed
+    """
+    compare_files(baseline, current, threshold)
+
+@benchmarks.command("load")
+@click.option("--database",
+              default=os.environ.get('BENCHMARK_DATABASE_URI',
+                                     'postgresql:///portfoliobench'),
+              help="Database seeded with flask perf seed")
+@click.option("--threads", default=4, help="Waitress worker threads")
+@click.option("--users", default=16, help="Simulated users")
+@click.option("--duration", default=30, help="Seconds to measure for")
+@click.option("--warmup", default=5, help="Seconds to run before measuring")
+@click.option("--think-time", default=0.0,
+              help="Mean seconds a user waits between calls")
+@click.option("--password", default="password",
+              help="Password of the seeded users")
+@click.option("--port", default=8765, help="Port the server listens on")
+@click.option("--pool-size", default=None, type=int,
+              help="Database connections the server keeps open")
+@click.option("--max-overflow", default=None, type=int,
+              help="Extra database connections the server may open")
+@click.option("--output", default=None,
+              help="File the summary is written to as JSON")
+def load(database, threads, users, duration, warmup, think_time, password,
+         port, pool_size, max_overflow, output):
+    """
+    Runs simulated dashboard users against the app under waitress and reports
+    throughput, latency percentiles and error rates
+    """
+    summary = run_load_test(database, threads, users, duration, warmup,
+                            think_time, password, port, pool_size,
+                            max_overflow)
+    click.echo(format_summary(summary))
+    if output is not None:
+        with open(output, 'w') as output_file:
+            json.dump(summary, output_file, indent=2)
+        click.echo("Wrote %s" % output)
+
+@benchmarks.command("queries")
+@click.option("--database",
+              default=os.environ.get('BENCHMARK_DATABASE_URI',
+                                     'postgresql:///portfoliobench'),
+              help="Database to query, missing tables are created")
+@click.option("--user", "user_id", default=0,
+              help="Id of the user the queries are made for")
+@click.option("--calls", default=1000, help="Calls of each query")
+def queries(database, user_id, calls):
+    """
+    Compares the per-call time of the hot ledger queries when they are rebuilt
+    on every call and when they are baked
+    """
+    click.echo(format_query_overhead(
+        run_query_overhead(database, user_id, calls)))
+
+def compare_files(baseline, current, threshold):
+    with open(baseline) as baseline_file:
+        baseline_results = json.load(baseline_file)
+    with open(current) as current_file:
+        current_results = json.load(current_file)
+    rows = compare_results(baseline_results, current_results, threshold)
+    click.echo(format_comparison(rows))
+    if any(row['regressed'] for row in rows):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    benchmarks()
@@ -0,0 +1,46 @@
+def compare_results(baseline, current, threshold=0.1):
+    """
+    Returns a row for every benchmark of current that baseline also ran, with
+    how much slower or faster it ran and whether it regressed
+
+    Keyword arguments:
+    baseline -- results of a previous run
+    current -- results of this run
+    threshold -- the fraction of extra wall time that counts as a regression
+    """
+    previous = dict(((result['size'], result['benchmark']), result)
+                    for result in baseline['results'])
+    rows = []
+    for result in current['results']:
+        key = (result['size'], result['benchmark'])
+        if key not in previous:
+            continue
+        old_wall = previous[key]['wall_seconds']
+        new_wall = result['wall_seconds']
+        change = (new_wall - old_wall) / old_wall if old_wall > 0 else 0.0
+        rows.append(dict(
+            size = result['size'],
+            benchmark = result['benchmark'],
+            baseline_seconds = old_wall,
+            current_seconds = new_wall,
+            change = change,
+            memory_change = result['peak_memory_bytes'] -
+                previous[key]['peak_memory_bytes'],
+            regressed = change > threshold
+        ))
+    return rows
+
+def format_comparison(rows):
+    lines = ['%-8s %-20s %12s %12s %8s %14s' % (
+        'size', 'benchmark', 'baseline', 'current', 'change', 'memory')]
+    for row in rows:
+        lines.append('%-8s %-20s %11.4fs %11.4fs %+7.1f%% %+13dB%s' % (
+            row['size'],
+            row['benchmark'],
+            row['baseline_seconds'],
+            row['current_seconds'],
+            row['change'] * 100,
+            row['memory_change'],
+            ' REGRESSED' if row['regressed'] else ''
+        ))
+    return '\n'.join(lines)
@@ -0,0 +1,332 @@
+from sqlalchemy import create_engine, text
+import http.client
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+
+REQUEST_MIX = (
+    ('investment_account_all', 25),
+    ('investment_account_stats', 25),
+    ('investment_account_acb', 15),
+    ('transaction_stats', 15),
+    ('transaction_all', 18),
+    ('transaction_import', 2)
+)
+"""Calls a simulated user makes and how often, a dashboard load mix"""
+
+IMPORT_ROWS = 5
+"""Transactions in each simulated csv import"""
+
+SERVER_CONFIG = '''
+SECRET_KEY = %(secret_key)r
+SQLALCHEMY_DATABASE_URI = %(database_uri)r
+SQLALCHEMY_TRACK_MODIFICATIONS = False
+SQLALCHEMY_ENGINE_OPTIONS = %(engine_options)r
+'''
+
+
+class Server(object):
+    """
+    The app running under waitress in a child process, so the simulated users
+    do not compete with it for the interpreter lock
+    """
+    def __init__(self, database_uri, threads, port, pool_size=None,
+                 max_overflow=None):
+        self.database_uri = database_uri
+        self.threads = threads
+        self.port = port
+        engine_options = {}
+        if pool_size is not None:
+            engine_options['pool_size'] = pool_size
+        if max_overflow is not None:
+            engine_options['max_overflow'] = max_overflow
+        self.engine_options = engine_options
+        self.process = None
+        self.config_path = None
+
+    def start(self, timeout=30):
+        fd, self.config_path = tempfile.mkstemp(suffix='.py')
+        with os.fdopen(fd, 'w') as config_file:
+            config_file.write(SERVER_CONFIG % dict(
+                secret_key = uuid.uuid4().hex,
+                database_uri = self.database_uri,
+                engine_options = self.engine_options
+            ))
+        env = dict(os.environ, PORTFOLIO_CONFIG_FILE=self.config_path)
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'waitress',
+             '--threads=%d' % self.threads,
+             '--listen=127.0.0.1:%d' % self.port,
+             '--call', 'flaskr:create_app'],
+            env=env,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        )
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError('waitress exited with %d'
+                                   % self.process.returncode)
+            try:
+                socket.create_connection(('127.0.0.1', self.port), 1).close()
+                return
+            except OSError:
+                time.sleep(0.1)
+        self.stop()
+        raise RuntimeError('waitress did not start in %ds' % timeout)
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait()
+            self.process = None
+        if self.config_path is not None:
+            os.remove(self.config_path)
+            self.config_path = None
+
+
+class VirtualUser(threading.Thread):
+    """
+    A simulated user that logs in with an api token and makes one call after
+    another, each as soon as the previous one answered (a closed loop)
+    """
+    def __init__(self, index, port, email, password, start_at, stop_at,
+                 think_time=0.0, seed=0):
+        super(VirtualUser, self).__init__(daemon=True)
+        self.port = port
+        self.email = email
+        self.password = password
+        self.start_at = start_at
+        self.stop_at = stop_at
+        self.think_time = think_time
+        self.rng = random.Random('%s:%s' % (seed, index))
+        self.samples = []
+        self.connection = None
+        self.headers = {}
+        self.account_ids = []
+
+    def run(self):
+        names = [name for name, weight in REQUEST_MIX]
+        weights = [weight for name, weight in REQUEST_MIX]
+        try:
+            self.login()
+        except Exception:
+            self.samples.append(('login', 0.0, False))
+            return
+        while time.time() < self.stop_at:
+            name = self.rng.choices(names, weights)[0]
+            start = time.perf_counter()
+            started_at = time.time()
+            try:
+                ok = getattr(self, name)()
+            except Exception:
+                ok = False
+                self.reconnect()
+            if started_at >= self.start_at:
+                self.samples.append((name, time.perf_counter() - start, ok))
+            if self.think_time > 0:
+                time.sleep(self.rng.expovariate(1.0 / self.think_time))
+
+    def reconnect(self):
+        if self.connection is not None:
+            self.connection.close()
+        self.connection = http.client.HTTPConnection('127.0.0.1', self.port,
+                                                     timeout=60)
+
+    def request(self, method, url, body=None, headers=None):
+        if self.connection is None:
+            self.reconnect()
+        all_headers = dict(self.headers)
+        all_headers.update(headers or {})
+        self.connection.request(method, url, body, all_headers)
+        response = self.connection.getresponse()
+        return response.status, response.read()
+
+    def login(self):
+        status, body = self.request(
+            'POST', '/auth/token',
+            json.dumps(dict(email=self.email, password=self.password)),
+            {'Content-Type': 'application/json'}
+        )
+        if status != 200:
+            raise RuntimeError('Login failed for %s' % self.email)
+        token = json.loads(body)['token']
+        self.headers = {'Authorization': 'Bearer %s' % token}
+        status, body = self.request('GET', '/investment_account/all')
+        self.account_ids = [account['id'] for account in json.loads(body)]
+
+    def get(self, url):
+        status, body = self.request('GET', url)
+        return status == 200
+
+    def account_url(self, path):
+        return '/investment_account/%d/%s' % (
+            self.rng.choice(self.account_ids), path)
+
+    def investment_account_all(self):
+        return self.get('/investment_account/all')
+
+    def investment_account_stats(self):
+        if not self.account_ids:
+            return self.get('/transaction/stats')
+        return self.get(self.account_url('stats'))
+
+    def investment_account_acb(self):
+        if not self.account_ids:
+            return self.get('/transaction/stats')
+        return self.get(self.account_url('acb'))
+
+    def transaction_stats(self):
+        return self.get('/transaction/stats')
+
+    def transaction_all(self):
+        return self.get('/transaction/all')
+
+    def transaction_import(self):
+        body, content_type = multipart_csv(import_csv(self.rng))
+        status, body = self.request('POST', '/transaction/import', body,
+                                    {'Content-Type': content_type})
+        return status == 200
+
+
+def run_load_test(database_uri, threads, users, duration, warmup=5,
+                  think_time=0.0, password='password', port=8765,
+                  pool_size=None, max_overflow=None, seed=0):
+    """
+    Starts the server, runs the simulated users against it and returns the
+    summary of every call they made after the warmup
+
+    Keyword arguments:
+    database_uri -- a database seeded with flask perf seed
+    threads -- waitress worker threads
+    users -- simulated users, they take turns logging in as the seeded users
+    duration -- seconds the calls are measured for
+    warmup -- seconds of calls before the measurement starts
+    think_time -- mean seconds a user waits between calls
+    password -- password of the seeded users
+    """
+    emails = seeded_emails(database_uri)
+    if len(emails) == 0:
+        raise RuntimeError('No seeded users, run flask perf seed first')
+    server = Server(database_uri, threads, port, pool_size, max_overflow)
+    server.start()
+    try:
+        start_at = time.time() + warmup
+        stop_at = start_at + duration
+        virtual_users = [
+            VirtualUser(i, port, emails[i % len(emails)], password,
+                        start_at, stop_at, think_time, seed)
+            for i in range(users)
+        ]
+        for virtual_user in virtual_users:
+            virtual_user.start()
+        for virtual_user in virtual_users:
+            virtual_user.join()
+    finally:
+        server.stop()
+    samples = [sample for virtual_user in virtual_users
+               for sample in virtual_user.samples]
+    summary = summarize(samples, duration)
+    summary.update(threads=threads, users=users, think_time=think_time,
+                   pool_size=pool_size, max_overflow=max_overflow)
+    return summary
+
+def seeded_emails(database_uri):
+    engine = create_engine(database_uri)
+    try:
+        return [row[0] for row in engine.execute(text(
+            "SELECT email FROM portfolio_user WHERE email LIKE :pattern "
+            "ORDER BY id"
+        ), pattern='seed-%')]
+    finally:
+        engine.dispose()
+
+def summarize(samples, duration):
+    """
+    Returns the throughput, latency percentiles and error rate of all the
+    samples and of each kind of call
+
+    Keyword arguments:
+    samples -- (call name, seconds, succeeded) tuples
+    duration -- seconds the samples were taken over
+    """
+    by_name = {}
+    for name, seconds, ok in samples:
+        by_name.setdefault(name, []).append((seconds, ok))
+    calls = dict((name, summarize_calls(name_samples, duration))
+                 for name, name_samples in by_name.items())
+    overall = summarize_calls([(seconds, ok)
+                               for name, seconds, ok in samples], duration)
+    return dict(duration = duration, overall = overall, calls = calls)
+
+def summarize_calls(samples, duration):
+    latencies = sorted(seconds for seconds, ok in samples)
+    errors = sum(1 for seconds, ok in samples if not ok)
+    return dict(
+        requests = len(samples),
+        errors = errors,
+        error_rate = float(errors) / len(samples) if samples else 0.0,
+        throughput = len(samples) / duration if duration > 0 else 0.0,
+        p50 = percentile(latencies, 0.50),
+        p95 = percentile(latencies, 0.95),
+        p99 = percentile(latencies, 0.99)
+    )
+
+def percentile(sorted_values, fraction):
+    """
+    Returns the nearest-rank percentile of the sorted values, None if empty
+    """
+    if not sorted_values:
+        return None
+    rank = max(1, int(math.ceil(fraction * len(sorted_values))))
+    return sorted_values[rank - 1]
+
+def format_summary(summary):
+    lines = ['%-26s %9s %7s %9s %9s %9s %9s' % (
+        'call', 'requests', 'errors', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms')]
+    rows = sorted(summary['calls'].items()) + [('overall', summary['overall'])]
+    for name, calls in rows:
+        lines.append('%-26s %9d %6.1f%% %9.1f %9s %9s %9s' % (
+            name,
+            calls['requests'],
+            calls['error_rate'] * 100,
+            calls['throughput'],
+            format_ms(calls['p50']),
+            format_ms(calls['p95']),
+            format_ms(calls['p99'])
+        ))
+    return '\n'.join(lines)
+
+def format_ms(seconds):
+    return '-' if seconds is None else '%.1f' % (seconds * 1000)
+
+def import_csv(rng):
+    lines = ['transaction_type,stock_symbol,cost_per_unit,quantity,'
+             'trade_fee,trade_date']
+    for i in range(IMPORT_ROWS):
+        lines.append('buy,AAA.TO,%d.%02d,%d,9.99,2019-%02d-%02d' % (
+            rng.randint(10, 99), rng.randint(0, 99), rng.randint(1, 50),
+            rng.randint(1, 12), rng.randint(1, 28)))
+    return '\n'.join(lines) + '\n'
+
+def multipart_csv(csv_text):
+    """
+    Returns the body and content type of a form posting csv_text as the file
+    field
+    """
+    boundary = uuid.uuid4().hex
+    body = ('--%s\r\n'
+            'Content-Disposition: form-data; name="file"; '
+            'filename="import.csv"\r\n'
+            'Content-Type: text/csv\r\n\r\n'
+            '%s\r\n'
+            '--%s--\r\n') % (boundary, csv_text, boundary)
+    return body.encode('utf-8'), 'multipart/form-data; boundary=%s' % boundary
@@ -0,0 +1,86 @@
+from flaskr import create_app, db
+from flaskr.ledger import (
+    DATA_VERSION_QUERY,
+    LATEST_PRICE_QUERY,
+    LEDGER_QUERY,
+    VERSIONS_QUERY,
+    data_version_query,
+    latest_price_query,
+    ledger_query,
+    versions_query
+)
+import time
+
+
+QUERIES = (
+    ('ledger', ledger_query, LEDGER_QUERY, True),
+    ('versions', versions_query, VERSIONS_QUERY, True),
+    ('data_version', data_version_query, DATA_VERSION_QUERY, True),
+    ('latest_prices', latest_price_query, LATEST_PRICE_QUERY, False)
+)
+"""The baked ledger queries, the function that builds each one and whether it
+takes a user_id"""
+
+
+def measure_query_overhead(session, user_id, calls):
+    """
+    Returns the mean microseconds per call of each hot ledger query when it is
+    rebuilt and compiled on every call and when it is baked. Use a user with
+    few transactions so the time is the per-call overhead and not the rows.
+
+    Keyword arguments:
+    session -- the session the queries run in
+    user_id -- the user the queries are made for
+    calls -- times each query runs, after one warm up call
+    """
+    results = []
+    for name, build, baked_query, takes_user in QUERIES:
+        params = dict(user_id=user_id) if takes_user else {}
+        rebuilt = time_calls(
+            lambda: build(session).params(**params).all(), calls)
+        baked = time_calls(
+            lambda: baked_query(session).params(**params).all(), calls)
+        results.append(dict(
+            query = name,
+            rebuilt_us = rebuilt * 1e6,
+            baked_us = baked * 1e6,
+            speedup = rebuilt / baked if baked > 0 else None
+        ))
+    return results
+
+def time_calls(call, calls):
+    call()
+    start = time.perf_counter()
+    for _ in range(calls):
+        call()
+    return (time.perf_counter() - start) / calls
+
+def run_query_overhead(database_uri, user_id, calls):
+    """
+    Measures the query overhead against a database, its tables are created if
+    they do not exist
+    """
+    app = create_app({
+        'TESTING': True,
+        'SECRET_KEY': 'benchmark',
+        'SQLALCHEMY_DATABASE_URI': database_uri,
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False
+    })
+    with app.app_context():
+        db.create_all()
+        try:
+            return measure_query_overhead(db.session(), user_id, calls)
+        finally:
+            db.session.remove()
+
+def format_query_overhead(results):
+    lines = ['%-14s %12s %12s %8s' % ('query', 'rebuilt us', 'baked us',
+                                      'speedup')]
+    for row in results:
+        lines.append('%-14s %12.1f %12.1f %7.2fx' % (
+            row['query'],
+            row['rebuilt_us'],
+            row['baked_us'],
+            row['speedup'] or 0
+        ))
+    return '\n'.join(lines)
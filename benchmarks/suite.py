@@ -0,0 +1,263 @@
+from datetime import date, datetime
+from flaskr import create_app, db, fetch_all_prices, seed_portfolios
+from flaskr.generators.adjust_cost_base import get_adjust_cost_base
+from flaskr.generators.book_cost import get_book_cost
+from flaskr.generators.market_value import get_market_value
+from flaskr.ledger import Ledger, build_latest_price_query
+from flaskr.model import (
+    InvestmentAccount,
+    StockMarker,
+    StockTransaction,
+    User
+)
+from flaskr.utils.synthetic_data import PortfolioGenerator
+from sqlalchemy import event
+import io
+import platform
+import subprocess
+import time
+import tracemalloc
+
+
+SIZES = {
+    'small': dict(users=2, accounts=2, transactions=250, symbols=20,
+                  years=2),
+    'medium': dict(users=4, accounts=3, transactions=2000, symbols=100,
+                   years=5),
+    'large': dict(users=8, accounts=4, transactions=10000, symbols=200,
+                  years=10)
+}
+"""Arguments of the PortfolioGenerator for each dataset size"""
+
+END_DATE = date(2020, 1, 31)
+"""Date of the latest generated price, fixed so runs are comparable"""
+
+FETCHED_DAYS = 100
+"""Days of prices the stub provider returns, as many as a compact fetch"""
+
+IMPORT_EMAIL = 'benchmark-import@example.com'
+
+
+class QueryTimer(object):
+    """
+    Counts the statements executed on an engine and the time spent in them
+    """
+    def __init__(self, engine):
+        self.statements = 0
+        self.seconds = 0.0
+        self.starts = []
+        event.listen(engine, 'before_cursor_execute', self.before_execute)
+        event.listen(engine, 'after_cursor_execute', self.after_execute)
+
+    def reset(self):
+        self.statements = 0
+        self.seconds = 0.0
+
+    def before_execute(self, conn, cursor, statement, parameters, context,
+                       executemany):
+        self.starts.append(time.perf_counter())
+
+    def after_execute(self, conn, cursor, statement, parameters, context,
+                      executemany):
+        self.seconds += time.perf_counter() - self.starts.pop()
+        self.statements += 1
+
+
+class Case(object):
+    """
+    One benchmark, run returns the number of rows it processed and reset
+    undoes its changes outside of the measured time
+    """
+    def __init__(self, name, run, reset=None):
+        self.name = name
+        self.run = run
+        self.reset = reset
+
+
+def run_suite(database_uri, sizes, repeat, log=print):
+    """
+    Seeds a dataset of each size into the database, which is emptied first,
+    and returns the results of every benchmark on it
+
+    Keyword arguments:
+    database_uri -- SQLAlchemy uri of a database the suite may drop
+    sizes -- names of the dataset sizes to run
+    repeat -- times each benchmark runs, the fastest run is reported
+    log -- called with progress messages
+    """
+    app = create_app({
+        'TESTING': True,
+        'SECRET_KEY': 'benchmark',
+        'SQLALCHEMY_DATABASE_URI': database_uri,
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'RESPONSE_CACHE_BACKEND': None,
+        'LEDGER_CACHE_MAX_BYTES': 0
+    })
+    results = []
+    with app.app_context():
+        timer = QueryTimer(db.engine)
+        for size in sizes:
+            log('Seeding %s dataset' % size)
+            generator = seed_dataset(SIZES[size])
+            for case in build_cases(app, generator):
+                result = measure(case, repeat, timer)
+                result['size'] = size
+                results.append(result)
+                log('%-8s %-20s %10.4fs %10.0f rows/s' % (
+                    size,
+                    case.name,
+                    result['wall_seconds'],
+                    result['rows_per_second']
+                ))
+    return dict(
+        created_at = datetime.utcnow().isoformat(),
+        git_commit = git_commit(),
+        python = platform.python_version(),
+        repeat = repeat,
+        results = results
+    )
+
+def seed_dataset(size_args):
+    db.drop_all()
+    db.create_all()
+    generator = PortfolioGenerator(end=END_DATE, **size_args)
+    seed_portfolios(generator, 'password')
+    db.session.add(User(email=IMPORT_EMAIL, password_hash=''))
+    db.session.commit()
+    return generator
+
+def build_cases(app, generator):
+    """
+    Returns the benchmarks of the dataset, they run as its first user
+    """
+    user_id = User.query.filter_by(email=generator.email(0)).one().id
+    import_user_id = User.query.filter_by(email=IMPORT_EMAIL).one().id
+    account_id = InvestmentAccount.query \
+        .filter_by(user_id=user_id, taxable=True) \
+        .order_by(InvestmentAccount.id) \
+        .first().id
+    ledger = Ledger.load(user_id)
+    prices = dict(build_latest_price_query())
+
+    login = dict(user_id=user_id)
+    @app.login_manager.request_loader
+    def load_user_from_request(request):
+        return User.query.get(login['user_id'])
+    client = app.test_client()
+
+    export = client.get('/transaction/export').data
+
+    def run_import():
+        login['user_id'] = import_user_id
+        try:
+            client.post('/transaction/import', data=dict(
+                file=(io.BytesIO(export), 'export.csv')
+            ))
+        finally:
+            login['user_id'] = user_id
+        return len(ledger)
+
+    def reset_import():
+        StockTransaction.query \
+            .filter(StockTransaction.user_id == import_user_id) \
+            .delete()
+        db.session.commit()
+
+    def run_fetch():
+        fetch_all_prices(stub_provider(generator), 0)
+        return len(generator.symbols) * FETCHED_DAYS
+
+    def run_request(url):
+        def run():
+            response = client.get(url)
+            assert response.status_code == 200
+            return len(ledger)
+        return run
+
+    db.session.bulk_save_objects([
+        StockMarker(stock_symbol=symbol, exists=True)
+        for symbol in generator.symbols
+    ])
+    db.session.commit()
+    return [
+        Case('ledger_load', lambda: len(Ledger.load(user_id))),
+        Case('adjust_cost_base', counted(
+            lambda: get_adjust_cost_base(ledger, account_id),
+            len(ledger.indexes(account_id))
+        )),
+        Case('book_cost', counted(lambda: get_book_cost(ledger),
+                                  len(ledger))),
+        Case('market_value', counted(lambda: get_market_value(ledger, prices),
+                                     len(ledger))),
+        Case('transaction_all', run_request('/transaction/all')),
+        Case('transaction_export', run_request('/transaction/export')),
+        Case('transaction_import', run_import, reset_import),
+        Case('fetch_prices', run_fetch)
+    ]
+
+def counted(function, rows):
+    """
+    Returns a case's run that calls function and reports rows
+    """
+    def run():
+        function()
+        return rows
+    return run
+
+def stub_provider(generator):
+    """
+    Returns a price provider that answers like Alpha Vantage's compact daily
+    time series with the generator's prices
+    """
+    days = generator.prices.days[-FETCHED_DAYS:]
+    def provider(stock_symbol):
+        closes = generator.prices.closes[stock_symbol][-FETCHED_DAYS:]
+        return {
+            'Time Series (Daily)': {
+                day.isoformat(): {'4. close': '%.2f' % (close / 100.0)}
+                for day, close in zip(days, closes)
+            }
+        }
+    return provider
+
+def measure(case, repeat, timer):
+    """
+    Returns the fastest of repeat runs of the case with the database time of
+    that run, and the peak memory of one more run traced by tracemalloc
+    """
+    best = None
+    for i in range(repeat):
+        timer.reset()
+        start = time.perf_counter()
+        rows = case.run()
+        wall = time.perf_counter() - start
+        if best is None or wall < best['wall_seconds']:
+            best = dict(
+                benchmark = case.name,
+                rows = rows,
+                wall_seconds = wall,
+                db_seconds = timer.seconds,
+                statements = timer.statements,
+                rows_per_second = rows / wall if wall > 0 else 0.0
+            )
+        if case.reset is not None:
+            case.reset()
+
+    tracemalloc.start()
+    try:
+        case.run()
+        best['peak_memory_bytes'] = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+        if case.reset is not None:
+            case.reset()
+    return best
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            stderr=subprocess.DEVNULL
+        ).decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
@@ -1,19 +1,56 @@
 import os
 
-from flask import Flask
+from flask import Flask, current_app
 from flask.cli import with_appcontext, AppGroup
 from flask_login import LoginManager, current_user
-from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate, MigrateCommand
+from flaskr.utils.api_tokens import ApiTokenSerializer
+from flaskr.utils.database import StatementTimeouts, apply_pool_options
+from flaskr.utils.dialects import (
+    SqlitePragmas,
+    apply_sqlite_options,
+    is_sqlite
+)
+from flaskr.utils.ledger_cache import LedgerCache
+from flaskr.utils.metrics import Metrics
+from flaskr.utils.password_hasher import PasswordHasher
+from flaskr.utils.price_table import PriceTable
+from flaskr.utils.profiler import RequestProfiler
+from flaskr.utils.replicas import ReplicaRouter
+from flaskr.utils.routing import RoutingSQLAlchemy
+from flaskr.utils.request_timing import RequestTiming
+from flaskr.utils.response_cache import ResponseCache
+from flaskr.utils.shards import ShardRouter
+from flaskr.utils.single_flight import SingleFlight
+from flaskr.utils.slow_queries import SlowQueryRecorder
+from flaskr.utils.user_cache import UserCache
 import click
 import json
 import logging
 import traceback
 
 
-db = SQLAlchemy()
+db = RoutingSQLAlchemy()
 login_manager = LoginManager()
+user_cache = UserCache()
+api_tokens = ApiTokenSerializer()
+password_hasher = PasswordHasher()
+ledger_cache = LedgerCache()
+response_cache = ResponseCache()
+single_flight = SingleFlight()
+price_table = PriceTable()
+request_timing = RequestTiming()
+metrics = Metrics()
+slow_queries = SlowQueryRecorder()
+request_profiler = RequestProfiler()
+statement_timeouts = StatementTimeouts()
+replica_router = ReplicaRouter()
+shard_router = ShardRouter()
+sqlite_pragmas = SqlitePragmas()
 stock_cli = AppGroup("stock")
+perf_cli = AppGroup("perf")
+shard_cli = AppGroup("shard")
+snapshot_cli = AppGroup("snapshot")
 
 def create_app(test_config=None):
     # create and configure the app
@@ -29,13 +66,34 @@ def create_app(test_config=None):
         else:
             # load the test config if passed in
             app.config.from_mapping(test_config)
+        apply_pool_options(app.config)
+        apply_sqlite_options(app.config)
         db.init_app(app)
+        sqlite_pragmas.init_app(app, db)
+        replica_router.init_app(app, db)
+        shard_router.init_app(app, db)
+        user_cache.init_app(app)
+        api_tokens.init_app(app)
+        password_hasher.init_app(app)
+        ledger_cache.init_app(app)
+        response_cache.init_app(app)
+        single_flight.init_app(app)
+        price_table.init_app(app)
+        request_timing.init_app(app, db)
+        metrics.init_app(app)
+        slow_queries.init_app(app, db)
+        request_profiler.init_app(app)
+        statement_timeouts.init_app(app, db)
         app.url_map.strict_slashes = False
 
         # add command line commands
-        migrate = Migrate(app, db)
+        migrate = Migrate(app, db, render_as_batch=is_sqlite(
+            app.config.get('SQLALCHEMY_DATABASE_URI')))
         app.cli.add_command(migrate_command)
         app.cli.add_command(stock_cli)
+        app.cli.add_command(perf_cli)
+        app.cli.add_command(shard_cli)
+        app.cli.add_command(snapshot_cli)
 
         # register routes
         from flaskr.routes.investment_accounts import investment_accounts
@@ -46,6 +104,11 @@ def create_app(test_config=None):
         app.register_blueprint(auth_bp)
         from flaskr.routes.index import index_bp
         app.register_blueprint(index_bp)
+        from flaskr.routes.metrics import metrics_bp
+        app.register_blueprint(metrics_bp)
+
+        from flaskr.ledger import clear_request_ledgers
+        app.teardown_request(clear_request_ledgers)
     except Exception as e:
         logging.error(e)
     login_manager.init_app(app)
@@ -66,21 +129,23 @@ def migrate_command():
 def generate_markers():
     """
     Creates new StockMarker entries for stocks in StockTransaction's table that
-    do not have an existing StockMarker
+    do not have an existing StockMarker, the transactions of every shard are
+    scanned and the markers are written to the main database
     """
     try:
         from flaskr.model import StockTransaction, StockMarker
-        from sqlalchemy import func
-        stock_symbols = db.session.query(
-            func.upper(StockTransaction.stock_symbol),
-            func.upper(StockMarker.stock_symbol)
-        ).outerjoin(StockMarker,
-                    func.upper(StockTransaction.stock_symbol) == \
-                    func.upper(StockMarker.stock_symbol)) \
-            .filter(StockMarker.stock_symbol == None) \
-            .distinct()
+        from sqlalchemy import func, select
+        table = StockTransaction.__table__
+        stock_symbols = set()
+        for shard in shard_router.names():
+            stock_symbols.update(
+                r[0] for r in shard_router.engine(shard).execute(
+                    select([func.upper(table.c.stock_symbol)]).distinct()))
+        markers = db.session.query(func.upper(StockMarker.stock_symbol))
+        stock_symbols.difference_update(r[0] for r in markers)
         db.session.bulk_save_objects([
-            StockMarker(stock_symbol=r[0], exists=None) for r in stock_symbols
+            StockMarker(stock_symbol=stock_symbol, exists=None)
+            for stock_symbol in sorted(stock_symbols)
         ])
         db.session.commit()
     except Exception as e:
@@ -89,20 +154,77 @@ def generate_markers():
         db.session.rollback()
         raise e
 
+@stock_cli.command("publish")
+@with_appcontext
+def publish_prices():
+    """
+    Writes the latest stock prices to the shared price table
+    """
+    try:
+        publish_latest_prices()
+    except Exception as e:
+        logging.error(e)
+        logging.error(traceback.format_exc())
+        db.session.rollback()
+        raise e
+
+def publish_latest_prices():
+    from flaskr.ledger import publish_price_table
+    if price_table.path is not None:
+        publish_price_table()
+
 DAILY_KEY = 'Time Series (Daily)'
 CLOSE_KEY = '4. close'
 ERROR_KEY = 'Error Message'
+FETCH_SYMBOLS = 'portfolio_price_fetch_symbols'
+FETCH_COMPLETED = 'portfolio_price_fetch_completed_symbols'
+FETCH_LAST_SUCCESS = 'portfolio_price_fetch_last_success_timestamp_seconds'
+metrics.describe(FETCH_SYMBOLS, 'gauge',
+                 'Stocks the running or last price fetch is fetching')
+metrics.describe(FETCH_COMPLETED, 'gauge',
+                 'Stocks the running or last price fetch has fetched')
+metrics.describe(FETCH_LAST_SUCCESS, 'gauge',
+                 'Time the last stock prices were saved')
 @stock_cli.command("fetch")
 @with_appcontext
 def fetch_prices():
     """
     Fetches stock prices for stocks that are known to have data or may have data
     """
+    api_key = os.environ['ALPHA_VANTAGE_API_KEY']
+    fetch_all_prices(
+        lambda stock_symbol: alpha_vantage_prices(stock_symbol, api_key),
+        current_app.config.get('PRICE_FETCH_INTERVAL', 15)
+    )
+
+def alpha_vantage_prices(stock_symbol, api_key):
+    """
+    Returns Alpha Vantage's compact daily time series json for the stock
+    """
+    from urllib import request
+    from urllib import parse
+    params = parse.urlencode({
+        'symbol': stock_symbol,
+        'apikey': api_key,
+        'function': 'TIME_SERIES_DAILY',
+        'outputsize': 'compact'
+    })
+    url = 'https://www.alphavantage.co/query?%s' % params
+    with request.urlopen(url) as f:
+        return json.loads(f.read().decode('utf-8'))
+
+def fetch_all_prices(provider, interval):
+    """
+    Replaces the stock prices of every stock that is known to have data or may
+    have data with the prices from the provider
+
+    Keyword arguments:
+    provider -- called with a stock symbol, returns the daily time series json
+    interval -- seconds to wait between stocks to respect the provider's limit
+    """
     try:
         from flaskr.model import StockPrice, StockMarker
         from sqlalchemy import func, or_
-        from urllib import request
-        from urllib import parse
         from datetime import date
         from decimal import Decimal
         import time
@@ -112,45 +234,447 @@ def fetch_prices():
                     StockMarker.exists == None,
                     StockMarker.exists == True
                 ))
-        api_key = os.environ['ALPHA_VANTAGE_API_KEY']
 
-        for stock_marker in stock_symbols.all():
+        stock_markers = stock_symbols.all()
+        metrics.name = 'fetch'
+        metrics.set(FETCH_SYMBOLS, len(stock_markers))
+        metrics.set(FETCH_COMPLETED, 0)
+        metrics.flush()
+        for completed, stock_marker in enumerate(stock_markers, 1):
             stock_symbol = stock_marker.stock_symbol
-            params = parse.urlencode({
-                'symbol': stock_symbol,
-                'apikey': api_key,
-                'function': 'TIME_SERIES_DAILY',
-                'outputsize': 'compact'
-            })
-            url = 'https://www.alphavantage.co/query?%s' % params
-            with request.urlopen(url) as f:
-                json_data = json.loads(f.read().decode('utf-8'))
-                if ERROR_KEY in json_data:
-                    stock_marker.exists = False
-                    logging.error(json_data[ERROR_KEY])
-                    db.session.commit()
-                elif DAILY_KEY in json_data:
-                    stock_marker.exists = True
-                    prices = json_data[DAILY_KEY]
-                    StockPrice.query \
-                        .filter(StockPrice.stock_symbol == stock_symbol) \
-                        .delete()
-
-                    new_prices = []
-                    for key, price in prices.items():
-                        stock_price = StockPrice(
-                            stock_symbol = stock_symbol,
-                            price_date = date.fromisoformat(key),
-                            close_price = int(Decimal(price[CLOSE_KEY]) * 100)
-                        )
-                        new_prices.append(stock_price)
-                    db.session.bulk_save_objects(new_prices)
-                    db.session.commit()
-            time.sleep(15)
+            json_data = provider(stock_symbol)
+            if ERROR_KEY in json_data:
+                stock_marker.exists = False
+                logging.error(json_data[ERROR_KEY])
+                db.session.commit()
+            elif DAILY_KEY in json_data:
+                stock_marker.exists = True
+                prices = json_data[DAILY_KEY]
+                StockPrice.query \
+                    .filter(StockPrice.stock_symbol == stock_symbol) \
+                    .delete()
+
+                new_prices = []
+                for key, price in prices.items():
+                    stock_price = StockPrice(
+                        stock_symbol = stock_symbol,
+                        price_date = date.fromisoformat(key),
+                        close_price = int(Decimal(price[CLOSE_KEY]) * 100)
+                    )
+                    new_prices.append(stock_price)
+                db.session.bulk_save_objects(new_prices)
+                db.session.commit()
+                publish_latest_prices()
+                response_cache.clear_shared()
+                metrics.set(FETCH_LAST_SUCCESS, time.time())
+            metrics.set(FETCH_COMPLETED, completed)
+            metrics.flush()
+            time.sleep(interval)
+
+    except Exception as e:
+        logging.error(e)
+        logging.error(traceback.format_exc())
+        db.session.rollback()
+        raise e
+
+
+@perf_cli.command("slow-queries")
+@click.option("--limit", default=20, help="Number of queries to show")
+@click.option("--sort", type=click.Choice(["recent", "duration"]),
+              default="recent", help="Show the newest or the slowest first")
+@click.option("--plans/--no-plans", default=False,
+              help="Show the captured query plans")
+@with_appcontext
+def show_slow_queries(limit, sort, plans):
+    """
+    Lists the statements the slow query recorder has logged
+    """
+    records = slow_queries.read()
+    if sort == "duration":
+        records.sort(key=lambda record: record['duration_ms'], reverse=True)
+    else:
+        records.reverse()
+    for record in records[:limit]:
+        click.echo("%s %10.2fms %s" % (record['recorded_at'],
+                                       record['duration_ms'],
+                                       record['route'] or '-'))
+        click.echo("    %s" % " ".join(record['statement'].split()))
+        click.echo("    parameters: %s" % json.dumps(record['parameters']))
+        if plans and record['plan'] is not None:
+            for line in record['plan'].splitlines():
+                click.echo("    | %s" % line)
+
+@perf_cli.command("profile")
+@click.argument("route")
+@click.option("--user", "user_id", required=True, type=int,
+              help="Id of the user the request is made as")
+@click.option("--method", default="GET", help="HTTP method of the request")
+@click.option("--memory/--no-memory", default=False,
+              help="Also trace memory allocations")
+@click.option("--top", default=25, help="Number of functions to show")
+@with_appcontext
+def profile_route(route, user_id, method, memory, top):
+    """
+    Profiles one request to the route as the user with the test client and
+    saves the captures to PROFILE_DIR
+    """
+    from flaskr.model import User
+    from flaskr.utils.profiler import Profile
+    import pstats
+    user = User.query.get(user_id)
+    if user is None:
+        raise click.BadParameter("No user %d" % user_id, param_hint="--user")
+    token = api_tokens.dumps(user.id, user.data_version)
+    client = current_app.test_client()
+    profile = Profile(memory=memory)
+    response = client.open(route, method=method, headers={
+        'Authorization': 'Bearer %s' % token
+    })
+    path = profile.finish(request_profiler.directory,
+                          '%s-%s' % (route, user_id), top)
+    click.echo("%s %s returned %s" % (method, route, response.status))
+    pstats.Stats(path, stream=click.get_text_stream('stdout')) \
+        .sort_stats('cumulative') \
+        .print_stats(top)
+    click.echo("Saved %s" % path)
+
+@perf_cli.command("seed")
+@click.option("--users", default=10, help="Number of users")
+@click.option("--accounts", default=2, help="Investment accounts per user")
+@click.option("--transactions", default=100,
+              help="Stock transactions per account")
+@click.option("--symbols", default=100, help="Number of stocks traded")
+@click.option("--years", default=5, help="Years of stock price history")
+@click.option("--end", default=None,
+              help="ISO date of the latest price, defaults to today")
+@click.option("--seed", default=0, help="Seeds the generated data")
+@click.option("--password", default="password",
+              help="Password of every generated user")
+@with_appcontext
+def seed_data(users, accounts, transactions, symbols, years, end, seed,
+              password):
+    """
+    Bulk loads generated users, accounts, transactions and stock prices for
+    benchmarking, users are named seed-<seed>-<n>@example.com
+    """
+    try:
+        from flaskr.utils.synthetic_data import PortfolioGenerator
+        from datetime import date
+        generator = PortfolioGenerator(
+            users, accounts, transactions, symbols, years,
+            date.fromisoformat(end) if end is not None else None,
+            seed
+        )
+        account_count, transaction_count, price_count = \
+            seed_portfolios(generator, password)
+        click.echo("Seeded %d users, %d accounts, %d transactions and %d "
+                   "prices" % (users, account_count, transaction_count,
+                               price_count))
+    except Exception as e:
+        logging.error(e)
+        logging.error(traceback.format_exc())
+        db.session.rollback()
+        raise e
+
+def seed_portfolios(generator, password):
+    """
+    Loads the generator's users, accounts, transactions and prices and returns
+    how many accounts, transactions and prices were loaded
+
+    Keyword arguments:
+    generator -- a PortfolioGenerator
+    password -- the password of every generated user
+    """
+    from flaskr.model import InvestmentAccount, StockPrice, User
+    load_rows('portfolio_user',
+              ('email', 'password_hash', 'data_version'),
+              generator.user_rows(password_hasher.hash(password)))
+    emails = [generator.email(i) for i in range(generator.users)]
+    user_ids = dict(db.session.query(User.email, User.id)
+                    .filter(User.email.in_(emails)))
+    user_ids = [user_ids[email] for email in emails]
+
+    load_rows('investment_account',
+              ('name', 'taxable', 'user_id'),
+              generator.account_rows(user_ids))
+    account_ids = db.session.query(InvestmentAccount.id,
+                                   InvestmentAccount.user_id) \
+        .filter(InvestmentAccount.user_id.in_(user_ids)) \
+        .order_by(InvestmentAccount.id) \
+        .all()
+    user_order = dict((user_id, i) for i, user_id in enumerate(user_ids))
+    account_ids.sort(key=lambda account: (user_order[account[1]],
+                                          account[0]))
+
+    transaction_count = load_rows(
+        'stock_transaction',
+        ('transaction_type', 'stock_symbol', 'cost_per_unit', 'quantity',
+         'trade_fee', 'trade_date', 'account_id', 'user_id'),
+        generator.transaction_rows(account_ids)
+    )
+
+    StockPrice.query \
+        .filter(StockPrice.stock_symbol.in_(generator.symbols)) \
+        .delete(synchronize_session=False)
+    price_count = load_rows(
+        'stock_price',
+        ('stock_symbol', 'price_date', 'close_price'),
+        generator.prices.rows()
+    )
+    db.session.commit()
+    for table in ('portfolio_user', 'investment_account',
+                  'stock_transaction', 'stock_price'):
+        db.session.execute('ANALYZE %s' % table)
+    db.session.commit()
+    publish_latest_prices()
+    response_cache.clear_shared()
+    return len(account_ids), transaction_count, price_count
+
+def load_rows(table, columns, rows):
+    """
+    Loads the rows into the table in the session's transaction and returns
+    how many were loaded, with COPY on postgres and batched inserts elsewhere
+    """
+    connection = db.session.connection()
+    if connection.dialect.name == 'postgresql':
+        return copy_rows(connection.connection.cursor(), table, columns, rows)
+    return insert_rows(connection, table, columns, rows)
+
+def insert_rows(connection, table, columns, rows, batch_size=1000):
+    """
+    Inserts the rows into the table in batches and returns how many were
+    inserted. ISO date strings are converted for DateTime columns.
+    """
+    from datetime import datetime
+    from sqlalchemy import DateTime
+    table = db.metadata.tables[table]
+    dates = set(column for column in columns
+                if isinstance(table.c[column].type, DateTime))
+    count = 0
+    batch = []
+    for row in rows:
+        values = dict(zip(columns, row))
+        for column in dates:
+            if isinstance(values[column], str):
+                values[column] = datetime.fromisoformat(values[column])
+        batch.append(values)
+        if len(batch) == batch_size:
+            connection.execute(table.insert(), batch)
+            count += len(batch)
+            batch = []
+    if len(batch) > 0:
+        connection.execute(table.insert(), batch)
+        count += len(batch)
+    return count
+
+def copy_rows(cursor, table, columns, rows):
+    """
+    Loads the rows into the table with COPY and returns how many were loaded
+    """
+    from flaskr.utils.synthetic_data import RowStream
+    cursor.copy_expert(
+        'COPY %s (%s) FROM STDIN WITH (FORMAT csv)' % (table,
+                                                       ', '.join(columns)),
+        RowStream(rows)
+    )
+    return cursor.rowcount
+
+@shard_cli.command("init")
+@click.argument("shard")
+@with_appcontext
+def init_shard(shard):
+    """
+    Creates the user scoped tables on a shard listed in SQLALCHEMY_SHARD_URIS
+    """
+    from flaskr.model import (
+        HoldingSnapshot,
+        HoldingSnapshotState,
+        InvestmentAccount,
+        StockTransaction,
+        User
+    )
+    try:
+        engine = shard_router.engine(shard)
+    except KeyError as e:
+        raise click.BadParameter(str(e), param_hint="shard")
+    db.Model.metadata.create_all(bind=engine, tables=[
+        User.__table__,
+        InvestmentAccount.__table__,
+        StockTransaction.__table__,
+        HoldingSnapshot.__table__,
+        HoldingSnapshotState.__table__
+    ])
+    click.echo("Created the tables on %s" % shard)
 
+@shard_cli.command("move-user")
+@click.argument("user_id", type=int)
+@click.argument("shard")
+@click.option("--wait", default=None, type=float,
+              help="Seconds to wait for every process to stop writing the "
+                   "user's data, defaults to SHARD_MAP_TTL")
+@with_appcontext
+def move_user(user_id, shard, wait):
+    """
+    Moves a user's accounts and transactions to another shard. Their data can
+    be read throughout, writes are answered with a 503 until the move is done.
+    The moved accounts and transactions get new ids, urls holding the old ids
+    stop working.
+    """
+    from flaskr.model import User
+    if User.query.get(user_id) is None:
+        raise click.BadParameter("No user %d" % user_id,
+                                 param_hint="user_id")
+    if shard not in shard_router.names():
+        raise click.BadParameter("Unknown shard %s" % shard,
+                                 param_hint="shard")
+    try:
+        account_count, transaction_count = move_user_to_shard(
+            user_id, shard, shard_router.ttl if wait is None else wait)
+        click.echo("Moved %d accounts and %d transactions of user %d to %s"
+                   % (account_count, transaction_count, user_id, shard))
     except Exception as e:
         logging.error(e)
         logging.error(traceback.format_exc())
         db.session.rollback()
         raise e
 
+def move_user_to_shard(user_id, shard, wait):
+    """
+    Copies the user's accounts and transactions to the shard, points the shard
+    map at it and, once every cached shard map has seen the new shard, deletes
+    them from the old shard. Returns how many accounts and transactions were
+    moved. Moved rows get new ids on the shard, so the user's holding snapshots
+    are dropped for the next build to recreate.
+
+    Keyword arguments:
+    user_id -- the id of the user to move
+    shard -- the name of the shard to move the user to
+    wait -- seconds cached shard maps take to expire, waited between blocking
+            writes and copying and again before deleting the old rows
+    """
+    from flaskr.model import (
+        HoldingSnapshot,
+        HoldingSnapshotState,
+        InvestmentAccount,
+        StockTransaction,
+        User,
+        UserShard
+    )
+    from flaskr.utils.shards import DEFAULT_SHARD
+    import time
+    entry = UserShard.query.get(user_id)
+    if entry is None:
+        entry = UserShard(user_id=user_id, shard=DEFAULT_SHARD)
+        db.session.add(entry)
+    source = entry.shard
+    if source == shard:
+        entry.moving_to = None
+        db.session.commit()
+        shard_router.invalidate(user_id)
+        return 0, 0
+
+    entry.moving_to = shard
+    db.session.commit()
+    shard_router.invalidate(user_id)
+    time.sleep(wait)
+
+    accounts = InvestmentAccount.__table__
+    transactions = StockTransaction.__table__
+    users = User.__table__
+    snapshot_tables = (HoldingSnapshot.__table__, HoldingSnapshotState.__table__)
+    with shard_router.engine(source).connect() as source_connection:
+        account_rows = source_connection.execute(
+            accounts.select().where(accounts.c.user_id == user_id)
+                .order_by(accounts.c.id)
+        ).fetchall()
+        transaction_rows = source_connection.execute(
+            transactions.select().where(transactions.c.user_id == user_id)
+                .order_by(transactions.c.id)
+        ).fetchall()
+
+    with shard_router.engine(shard).begin() as target_connection:
+        # rows left behind by an earlier move that did not finish
+        for table in snapshot_tables:
+            target_connection.execute(table.delete()
+                                      .where(table.c.user_id == user_id))
+        target_connection.execute(transactions.delete()
+                                  .where(transactions.c.user_id == user_id))
+        target_connection.execute(accounts.delete()
+                                  .where(accounts.c.user_id == user_id))
+        if shard != DEFAULT_SHARD:
+            user = db.session.execute(
+                users.select().where(users.c.id == user_id)).first()
+            target_connection.execute(users.delete()
+                                      .where(users.c.id == user_id))
+            target_connection.execute(users.insert(), dict(user))
+        account_ids = {}
+        for row in account_rows:
+            values = dict(row)
+            del values['id']
+            account_ids[row['id']] = target_connection.execute(
+                accounts.insert(), values).inserted_primary_key[0]
+        new_transactions = []
+        for row in transaction_rows:
+            values = dict(row)
+            del values['id']
+            if values['account_id'] is not None:
+                values['account_id'] = account_ids[values['account_id']]
+            new_transactions.append(values)
+        if len(new_transactions) > 0:
+            target_connection.execute(transactions.insert(), new_transactions)
+
+    entry.shard = shard
+    entry.moving_to = None
+    User.bump_data_version(user_id)
+    db.session.commit()
+    shard_router.invalidate(user_id)
+    # processes with a cached shard map still read the old shard until it
+    # expires, so its rows are kept until then
+    time.sleep(wait)
+
+    with shard_router.engine(source).begin() as source_connection:
+        for table in snapshot_tables:
+            source_connection.execute(table.delete()
+                                      .where(table.c.user_id == user_id))
+        source_connection.execute(transactions.delete()
+                                  .where(transactions.c.user_id == user_id))
+        source_connection.execute(accounts.delete()
+                                  .where(accounts.c.user_id == user_id))
+        if source != DEFAULT_SHARD:
+            source_connection.execute(users.delete()
+                                      .where(users.c.id == user_id))
+    # responses cached from the old shard during the wait carry the old ids
+    User.bump_data_version(user_id)
+    db.session.commit()
+    response_cache.clear_shared()
+    return len(account_rows), len(transaction_rows)
+
+@snapshot_cli.command("build")
+@click.option("--user", "user_ids", multiple=True, type=int,
+              help="Build only this user, can be repeated")
+@with_appcontext
+def build_snapshots(user_ids):
+    """
+    Brings the holding snapshots of every user whose accounts or transactions
+    changed since the last build up to date, run it periodically
+    """
+    from flaskr.snapshots import build_all_snapshots
+    users, rows = build_all_snapshots(list(user_ids) or None,
+                                      log=click.echo)
+    click.echo("Built the snapshots of %d users, wrote %d rows"
+               % (users, rows))
+
+@snapshot_cli.command("repair")
+@click.option("--user", "user_ids", multiple=True, type=int,
+              help="Repair only this user, can be repeated")
+@with_appcontext
+def repair_snapshots(user_ids):
+    """
+    Rewrites the holding snapshots of every user, or the given users, from
+    their transactions
+    """
+    from flaskr.snapshots import build_all_snapshots
+    users, rows = build_all_snapshots(list(user_ids) or None, repair=True,
+                                      log=click.echo)
+    click.echo("Repaired the snapshots of %d users, wrote %d rows"
+               % (users, rows))
@@ -1,65 +1,101 @@
-from flaskr import db
+from flaskr import db, metrics
+from flaskr.ledger import get_ledger
+from flaskr.model import InvestmentAccount, StockTransactionType
+from flaskr.snapshots import load_positions, snapshots_fresh
 from flaskr.utils.formatting_utils import FormattingUtils
-from flaskr.model import (
-    InvestmentAccount,
-    StockTransaction,
-    StockTransactionType
-)
-from sqlalchemy import func
+from flaskr.utils.metrics import GENERATOR_DURATION
+
+
+BUY = StockTransactionType.buy.value
+SELL = StockTransactionType.sell.value
 
 
 class AdjustCostBaseGenerator():
-    def __init__(self, user_id, account_id):
+    def __init__(self, user_id, account_id, as_of=None):
+        """
+        Keyword arguments:
+        user_id -- the id of the user that owns the account
+        account_id -- the account's id
+        as_of -- if provided the adjusted cost base at the end of this date is
+                 read from the holding snapshots when they are up to date
+        """
         self.user_id = user_id
         self.account_id = account_id
+        self.as_of = as_of
 
+    @metrics.timer(GENERATOR_DURATION, (('generator', 'adjust_cost_base'),))
     def next(self):
-        return self.get_adjust_cost_base()
+        if self.as_of is not None and snapshots_fresh(self.user_id):
+            return get_snapshot_adjust_cost_base(self.user_id,
+                                                 self.account_id,
+                                                 self.as_of)
+        return get_adjust_cost_base(get_ledger(self.user_id),
+                                    self.account_id,
+                                    self.as_of)
+
+
+def get_adjust_cost_base(ledger, account_id, as_of=None):
+    """
+    Returns the adjusted cost base of every stock in the account, or an empty
+    dict if the account is not taxable
 
-    def get_adjust_cost_base(self):
-        is_account_taxable = db.session.query(InvestmentAccount.taxable) \
-                .filter((InvestmentAccount.id == self.account_id) & \
-                        (InvestmentAccount.user_id == self.user_id)).scalar()
+    Keyword arguments:
+    ledger -- the Ledger of the user that owns the account
+    account_id -- the account's id
+    as_of -- if provided only the transactions up to this date are used
+    """
+    stock_acbs = dict()
+    stock_quantities = dict()
+    if account_id is None or not ledger.is_taxable(account_id):
+        return stock_acbs
 
-        stock_acbs = dict()
-        stock_quantities = dict()
-        if not is_account_taxable:
-            return stock_acbs
+    symbol_indexes = ledger.symbol_indexes
+    transaction_types = ledger.transaction_types
+    quantities = ledger.quantities
+    costs_per_unit = ledger.costs_per_unit
+    trade_fees = ledger.trade_fees
+    trade_dates = ledger.trade_dates
+    last_day = as_of.toordinal() if as_of is not None else None
+    for i in ledger.indexes(account_id):
+        if last_day is not None and trade_dates[i] > last_day:
+            break
+        stock_symbol = ledger.symbols[symbol_indexes[i]]
+        quantity = quantities[i]
+        stock_acbs.setdefault(stock_symbol, 0.0)
+        stock_quantities.setdefault(stock_symbol, 0)
+        if transaction_types[i] == BUY:
+            acb_change = (quantity * costs_per_unit[i]) + trade_fees[i]
+            stock_acbs[stock_symbol] += acb_change
+            stock_quantities[stock_symbol] += quantity
+        elif transaction_types[i] == SELL:
+            prev_quantity = stock_quantities[stock_symbol]
+            acb_multiplier = (prev_quantity - quantity) / prev_quantity
+            stock_acbs[stock_symbol] *= acb_multiplier
+            stock_quantities[stock_symbol] -= quantity
 
-        for row in self.build_transaction_iterator():
-            stock_symbol = row[0]
-            quantity = row[1]
-            cost_per_unit = row[2]
-            trade_fee = row[3]
-            transaction_type = row[4]
-            stock_acbs.setdefault(stock_symbol, 0.0)
-            stock_quantities.setdefault(stock_symbol, 0)
-            if transaction_type == StockTransactionType.buy:
-                acb_change = (quantity * cost_per_unit) + trade_fee
-                stock_acbs[stock_symbol] += acb_change
-                stock_quantities[stock_symbol] += quantity
-            elif transaction_type == StockTransactionType.sell:
-                prev_quantity = stock_quantities[stock_symbol]
-                acb_multiplier = (prev_quantity - quantity) / prev_quantity
-                stock_acbs[stock_symbol] *= acb_multiplier
-                stock_quantities[stock_symbol] -= quantity
+    return dict(map(lambda kv: format_value(kv[0], kv[1]), stock_acbs.items()))
 
-        return dict(
-            map(lambda kv: self.format_value(kv[0], kv[1]), stock_acbs.items())
-        )
+def get_snapshot_adjust_cost_base(user_id, account_id, as_of):
+    """
+    Returns the same as get_adjust_cost_base from the account's holding
+    snapshots without replaying its transactions
 
-    def build_transaction_iterator(self):
-        return db.session.query(StockTransaction) \
-                .filter((StockTransaction.account_id == self.account_id) & \
-                        (StockTransaction.user_id == self.user_id)) \
-                .order_by(StockTransaction.trade_date) \
-                .values(
-                    StockTransaction.stock_symbol,
-                    StockTransaction.quantity,
-                    StockTransaction.cost_per_unit,
-                    StockTransaction.trade_fee,
-                    StockTransaction.transaction_type
-                )
+    Keyword arguments:
+    user_id -- the id of the user that owns the account
+    account_id -- the account's id
+    as_of -- the date of the adjusted cost base
+    """
+    taxable = db.session.query(InvestmentAccount.taxable) \
+        .filter((InvestmentAccount.id == account_id) & \
+                (InvestmentAccount.user_id == user_id)) \
+        .scalar()
+    if not taxable:
+        return dict()
+    return dict(
+        (stock_symbol, FormattingUtils.format_currency(book_cost))
+        for _, stock_symbol, _, book_cost
+        in load_positions(user_id, as_of, account_id)
+    )
 
-    def format_value(self, key, value):
-        return (key, FormattingUtils.format_currency(round(value)))
+def format_value(key, value):
+    return (key, FormattingUtils.format_currency(round(value)))
@@ -1,11 +1,7 @@
-from flaskr import db
+from flaskr import metrics
+from flaskr.ledger import get_ledger
 from flaskr.utils.formatting_utils import FormattingUtils
-from flaskr.model import (
-    StockTransaction,
-    StockTransactionType,
-    StockPrice
-)
-from sqlalchemy import func
+from flaskr.utils.metrics import GENERATOR_DURATION
 
 
 class BookCostGenerator():
@@ -13,30 +9,27 @@ class BookCostGenerator():
         self.user_id = user_id
         self.account_id = account_id
 
+    @metrics.timer(GENERATOR_DURATION, (('generator', 'book_cost'),))
     def next(self):
-        return self.get_book_cost()
+        return get_book_cost(get_ledger(self.user_id), self.account_id)
 
-    def get_book_cost(self):
-        """
-        Returns the computed book cost of all transactions in this account, if the
-        account has no tranasctions then N/A is returned.
-        """
-        book_cost = self.build_book_cost_query()
-        if book_cost is None:
-            return "N/A"
-        return FormattingUtils.format_currency(book_cost)
 
-    def build_book_cost_query(self):
-        aggregation = func.sum(
-            StockTransaction.cost_per_unit * StockTransaction.quantity + \
-            StockTransaction.trade_fee
-        )
-        query = None
-        if self.account_id is None:
-            query = aggregation.filter(StockTransaction.user_id == self.user_id)
-        else:
-            query = aggregation.filter(
-                ((StockTransaction.user_id == self.user_id) & \
-                 (StockTransaction.account_id == self.account_id))
-            )
-        return db.session.query(query).scalar()
+def get_book_cost(ledger, account_id=None):
+    """
+    Returns the computed book cost of all transactions in this account, if the
+    account has no tranasctions then N/A is returned.
+
+    Keyword arguments:
+    ledger -- the Ledger of the user that owns the account
+    account_id -- the account's id, None for all of the user's transactions
+    """
+    indexes = ledger.indexes(account_id)
+    if len(indexes) == 0:
+        return "N/A"
+    quantities = ledger.quantities
+    costs_per_unit = ledger.costs_per_unit
+    trade_fees = ledger.trade_fees
+    book_cost = 0
+    for i in indexes:
+        book_cost += costs_per_unit[i] * quantities[i] + trade_fees[i]
+    return FormattingUtils.format_currency(book_cost)
@@ -1,11 +1,12 @@
-from flaskr import db
+from flaskr import metrics
+from flaskr.ledger import get_latest_prices, get_ledger
+from flaskr.model import StockTransactionType
 from flaskr.utils.formatting_utils import FormattingUtils
-from flaskr.model import (
-    StockTransaction,
-    StockTransactionType,
-    StockPrice
-)
-from sqlalchemy import func
+from flaskr.utils.metrics import GENERATOR_DURATION
+
+
+BUY = StockTransactionType.buy.value
+SELL = StockTransactionType.sell.value
 
 
 class MarketValueGenerator():
@@ -13,68 +14,53 @@ class MarketValueGenerator():
         self.user_id = user_id
         self.account_id = account_id
 
+    @metrics.timer(GENERATOR_DURATION, (('generator', 'market_value'),))
     def next(self):
-        return self.get_market_value()
+        return get_market_value(get_ledger(self.user_id),
+                                get_latest_prices(),
+                                self.account_id)
 
-    def get_market_value(self):
-        """
-        Returns the market value of all the stocks in the portfolio
-        """
-        total_value = 0
-        breakdown = {}
-        stock_values = self.build_market_price_query()
-        for row in stock_values:
-            value = row[0] * row[1]
-            stock_symbol = row[2]
-            transaction_type = row[3]
-            breakdown.setdefault(stock_symbol, 0)
-            if transaction_type == StockTransactionType.buy:
-                total_value += value
-                breakdown[stock_symbol] += value
-            elif transaction_type == StockTransactionType.sell:
-                total_value -= value
-                breakdown[stock_symbol] -= value
 
-        return dict(
-            total = FormattingUtils.format_currency(total_value),
-            breakdown = self.build_stock_market_values(breakdown, total_value)
-        )
+def get_market_value(ledger, prices, account_id=None):
+    """
+    Returns the market value of all the stocks in the portfolio
 
-    def build_market_price_query(self):
-        last_date = db.session.query(
-            func.max(StockPrice.price_date).label('latest_price_date')
-        ).subquery('last_date')
-        price_query = db.session.query(
-            StockPrice.stock_symbol,
-            StockPrice.close_price.label('close_price')
-        ).filter(
-            StockPrice.price_date == last_date.c.latest_price_date
-        ).subquery('price_query')
+    Keyword arguments:
+    ledger -- the Ledger of the user that owns the portfolio
+    prices -- a dict of stock symbol to latest close price in cents
+    account_id -- the account's id, None for all of the user's transactions
+    """
+    symbol_prices = [prices.get(symbol) for symbol in ledger.symbols]
+    symbol_indexes = ledger.symbol_indexes
+    transaction_types = ledger.transaction_types
+    quantities = ledger.quantities
+    total_value = 0
+    breakdown = {}
+    for i in ledger.indexes(account_id):
+        price = symbol_prices[symbol_indexes[i]]
+        if price is None:
+            continue
+        value = quantities[i] * price
+        stock_symbol = ledger.symbols[symbol_indexes[i]]
+        breakdown.setdefault(stock_symbol, 0)
+        if transaction_types[i] == BUY:
+            total_value += value
+            breakdown[stock_symbol] += value
+        elif transaction_types[i] == SELL:
+            total_value -= value
+            breakdown[stock_symbol] -= value
 
-        market_price_query = db.session.query(
-            func.sum(StockTransaction.quantity),
-            func.min(price_query.c.close_price),
-            StockTransaction.stock_symbol,
-            StockTransaction.transaction_type
-        ).join(price_query, StockTransaction.stock_symbol == \
-               price_query.c.stock_symbol) \
-            .group_by(StockTransaction.stock_symbol) \
-            .group_by(StockTransaction.transaction_type)
+    return dict(
+        total = FormattingUtils.format_currency(total_value),
+        breakdown = build_stock_market_values(breakdown, total_value)
+    )
 
-        if self.account_id is None:
-            return market_price_query \
-                .filter(StockTransaction.user_id == self.user_id)
-        else:
-            return market_price_query \
-                .filter((StockTransaction.account_id == self.account_id) & \
-                        (StockTransaction.user_id == self.user_id))
-
-    def build_stock_market_values(self, breakdown, total_value):
-        values = {}
-        for kv in breakdown.items():
-            values[kv[0]] = dict(
-                formatted_value = FormattingUtils.format_currency(kv[1]),
-                raw_percent = kv[1],
-                percent = FormattingUtils.format_percentage(kv[1], total_value)
-            )
-        return values
+def build_stock_market_values(breakdown, total_value):
+    values = {}
+    for kv in breakdown.items():
+        values[kv[0]] = dict(
+            formatted_value = FormattingUtils.format_currency(kv[1]),
+            raw_percent = kv[1],
+            percent = FormattingUtils.format_percentage(kv[1], total_value)
+        )
+    return values
@@ -0,0 +1,45 @@
+from flaskr import metrics
+from flaskr.generators.adjust_cost_base import get_adjust_cost_base
+from flaskr.generators.book_cost import get_book_cost
+from flaskr.generators.market_value import get_market_value
+from flaskr.ledger import get_latest_prices, get_ledger
+from flaskr.utils.metrics import GENERATOR_DURATION
+
+
+class PortfolioStatsGenerator():
+    """
+    Computes book cost, market value and optionally the adjusted cost base
+    from the user's Ledger, so the stats endpoints read the transactions once
+    instead of once per statistic
+    """
+    def __init__(self, user_id, account_id=None, include_acb=False):
+        self.user_id = user_id
+        self.account_id = account_id
+        self.include_acb = include_acb and account_id is not None
+
+    @metrics.timer(GENERATOR_DURATION, (('generator', 'portfolio_stats'),))
+    def next(self):
+        return get_portfolio_stats(get_ledger(self.user_id),
+                                   get_latest_prices(),
+                                   self.account_id,
+                                   self.include_acb)
+
+
+def get_portfolio_stats(ledger, prices, account_id=None, include_acb=False):
+    """
+    Returns a dict with the book cost, market value and, if include_acb is
+    True, adjusted cost base of the account
+
+    Keyword arguments:
+    ledger -- the Ledger of the user that owns the account
+    prices -- a dict of stock symbol to latest close price in cents
+    account_id -- the account's id, None for all of the user's transactions
+    include_acb -- if True the adjusted cost base is included
+    """
+    stats = dict(
+        book_cost = get_book_cost(ledger, account_id),
+        market_value = get_market_value(ledger, prices, account_id)
+    )
+    if include_acb:
+        stats['adjust_cost_base'] = get_adjust_cost_base(ledger, account_id)
+    return stats
@@ -0,0 +1,98 @@
+from decimal import Decimal
+from flaskr import db, metrics
+from flaskr.model import StockTransaction
+from flaskr.utils.dialects import date_trunc
+from flaskr.utils.metrics import GENERATOR_DURATION
+from sqlalchemy import func
+
+
+class TransactionAggregateGenerator():
+    DIMENSIONS = {
+        'symbol': lambda: StockTransaction.stock_symbol,
+        'account': lambda: StockTransaction.account_id,
+        'type': lambda: StockTransaction.transaction_type,
+        'day': lambda: date_trunc('day', StockTransaction.trade_date),
+        'month': lambda: date_trunc('month', StockTransaction.trade_date),
+        'year': lambda: date_trunc('year', StockTransaction.trade_date)
+    }
+    """The group by dimensions mapped to the column expression they group on"""
+
+    METRICS = {
+        'count': lambda: func.count(StockTransaction.id),
+        'quantity': lambda: func.sum(StockTransaction.quantity),
+        'gross_amount': lambda: func.sum(
+            StockTransaction.cost_per_unit * StockTransaction.quantity
+        ),
+        'fees': lambda: func.sum(StockTransaction.trade_fee)
+    }
+    """The metrics mapped to the aggregation that computes them"""
+
+    CURRENCY_METRICS = set(['gross_amount', 'fees'])
+    """The metrics that are amounts in cents"""
+
+    def __init__(self, user_id, group_by, metrics, account_id=None):
+        """
+        Keyword arguments:
+        user_id -- the id of the user whose transactions are aggregated
+        group_by -- a list of dimension names from DIMENSIONS
+        metrics -- a list of metric names from METRICS
+        account_id -- if provided only this account's transactions are used
+        """
+        unknown = [key for key in group_by if key not in self.DIMENSIONS] + \
+            [key for key in metrics if key not in self.METRICS]
+        if len(unknown) > 0:
+            raise ValueError('Unknown aggregation keys: %s' % ', '.join(unknown))
+        self.user_id = user_id
+        self.group_by = group_by
+        self.metrics = metrics
+        self.account_id = account_id
+
+    @metrics.timer(GENERATOR_DURATION,
+                   (('generator', 'transaction_aggregate'),))
+    def next(self):
+        return self.get_aggregates()
+
+    def get_aggregates(self):
+        """
+        Returns a list of dicts, one per group, with the group's dimension
+        values and the requested metrics
+        """
+        rows = []
+        for row in self.build_aggregate_query():
+            values = list(row)
+            result = {}
+            for key in self.group_by:
+                result[key] = self.format_dimension(key, values.pop(0))
+            for key in self.metrics:
+                result[key] = self.format_metric(key, values.pop(0))
+            rows.append(result)
+        return rows
+
+    def build_aggregate_query(self):
+        dimensions = [
+            self.DIMENSIONS[key]().label(key) for key in self.group_by
+        ]
+        aggregations = [
+            self.METRICS[key]().label(key) for key in self.metrics
+        ]
+        query = db.session.query(*(dimensions + aggregations)) \
+            .filter(StockTransaction.user_id == self.user_id)
+        if self.account_id is not None:
+            query = query.filter(StockTransaction.account_id == self.account_id)
+        if len(dimensions) > 0:
+            query = query.group_by(*dimensions).order_by(*dimensions)
+        return query
+
+    def format_dimension(self, key, value):
+        if key == 'type':
+            return value.name
+        if key in ('day', 'month', 'year'):
+            return value.strftime('%Y-%m-%d')
+        return value
+
+    def format_metric(self, key, value):
+        if value is None:
+            value = 0
+        if key in self.CURRENCY_METRICS:
+            return str(Decimal(value) / 100)
+        return int(value)
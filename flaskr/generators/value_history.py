@@ -0,0 +1,262 @@
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from flaskr import db, metrics
+from flaskr.ledger import get_ledger
+from flaskr.model import StockPrice, StockTransactionType
+from flaskr.snapshots import (
+    load_position_changes,
+    load_positions,
+    snapshots_fresh
+)
+from flaskr.utils.metrics import GENERATOR_DURATION
+from sqlalchemy import and_, func
+
+
+BUY = StockTransactionType.buy.value
+SELL = StockTransactionType.sell.value
+
+INTERVALS = ('day', 'week', 'month')
+"""The intervals a history can be sampled at, each value is the closing value
+of its day, week or month"""
+
+MAX_POINTS = 2000
+"""The default limit on the number of values a history may return"""
+
+
+class ValueHistoryGenerator():
+    """
+    Computes the market value of the user's holdings on every day of a date
+    range. Holdings and prices carry forward from the last transaction and
+    close price on or before each day. The holdings are read from the holding
+    snapshots when they are up to date, otherwise the ledger is replayed.
+    """
+    def __init__(self, user_id, start=None, end=None, interval='day',
+                 account_id=None, max_points=MAX_POINTS):
+        """
+        Keyword arguments:
+        user_id -- the id of the user whose holdings are valued
+        start -- the first date, defaults to the first trade date
+        end -- the last date, defaults to today
+        interval -- one of INTERVALS
+        account_id -- if provided only this account's transactions are used
+        max_points -- a ValueError is raised if the history would have more
+                      values, None for no limit
+        """
+        if interval not in INTERVALS:
+            raise ValueError('Unknown interval %s' % interval)
+        if start is not None and end is not None and start > end:
+            raise ValueError('start %s is after end %s' % (start, end))
+        self.user_id = user_id
+        self.start = start
+        self.end = end
+        self.interval = interval
+        self.account_id = account_id
+        self.max_points = max_points
+
+    @metrics.timer(GENERATOR_DURATION, (('generator', 'value_history'),))
+    def next(self):
+        end = self.end or date.today()
+        if snapshots_fresh(self.user_id):
+            changes, lookup = snapshot_changes(self.user_id, self.start, end,
+                                               self.account_id)
+        else:
+            changes, lookup = ledger_changes(get_ledger(self.user_id),
+                                             self.account_id)
+        start = self.start
+        if start is None:
+            start = date.fromordinal(changes[0][0]) \
+                if len(changes) > 0 else end
+        if start > end:
+            return []
+        if self.max_points is not None and \
+                sample_count(start, end, self.interval) > self.max_points:
+            raise ValueError('History from %s to %s has more than %d values'
+                             % (start, end, self.max_points))
+        return get_value_history(
+            changes,
+            load_price_history(lookup, start, end),
+            len(lookup),
+            start,
+            end,
+            self.interval
+        )
+
+
+def ledger_changes(ledger, account_id=None):
+    """
+    Returns the quantity changes of the ledger's buys and sells as (date
+    ordinal, symbol index, quantity change) tuples in date order and a dict of
+    stock symbol to symbol index
+
+    Keyword arguments:
+    ledger -- the Ledger of the user that owns the account
+    account_id -- the account's id, None for all of the user's transactions
+    """
+    symbol_indexes = ledger.symbol_indexes
+    transaction_types = ledger.transaction_types
+    quantities = ledger.quantities
+    trade_dates = ledger.trade_dates
+    lookup = {}
+    changes = []
+    for i in ledger.indexes(account_id):
+        if transaction_types[i] == BUY:
+            change = quantities[i]
+        elif transaction_types[i] == SELL:
+            change = -quantities[i]
+        else:
+            continue
+        symbol_index = lookup.setdefault(ledger.symbols[symbol_indexes[i]],
+                                         len(lookup))
+        changes.append((trade_dates[i], symbol_index, change))
+    return changes, lookup
+
+def snapshot_changes(user_id, start, end, account_id=None):
+    """
+    Returns the same as ledger_changes from the holding snapshots without
+    replaying the transactions before start, the positions held before start
+    are changes on the day before it
+
+    Keyword arguments:
+    user_id -- the id of the user
+    start -- the first date, None for the first snapshot
+    end -- the last date
+    account_id -- the account's id, None for all of the user's positions
+    """
+    lookup = {}
+    changes = []
+    held = {}
+    if start is not None:
+        day = start.toordinal() - 1
+        for account, stock_symbol, quantity, _ in \
+                load_positions(user_id, date.fromordinal(day), account_id):
+            held[(account, stock_symbol)] = quantity
+            changes.append((day,
+                            lookup.setdefault(stock_symbol, len(lookup)),
+                            quantity))
+    for day, account, stock_symbol, quantity in \
+            load_position_changes(user_id, start, end, account_id):
+        key = (account, stock_symbol)
+        changes.append((day,
+                        lookup.setdefault(stock_symbol, len(lookup)),
+                        quantity - held.get(key, 0)))
+        held[key] = quantity
+    return changes, lookup
+
+def get_value_history(changes, prices, symbol_count, start, end,
+                      interval='day'):
+    """
+    Returns a list of dicts with the date and market value of the holdings at
+    the close of each sampled day from start to end. The quantity changes and
+    prices are merged in one pass in date order and only the holdings and
+    price that changed update the running total.
+
+    Keyword arguments:
+    changes -- (date ordinal, symbol index, quantity change) tuples in date
+               order, see ledger_changes
+    prices -- (symbol index, date ordinal, close price in cents) tuples in date
+              order, see load_price_history
+    symbol_count -- the number of symbol indexes
+    start -- the first date
+    end -- the last date
+    interval -- one of INTERVALS
+    """
+    holdings = [0] * symbol_count
+    closes = [0] * symbol_count
+    total_value = 0
+    next_change = 0
+    next_price = 0
+    last_day = end.toordinal()
+    history = []
+    for day in range(start.toordinal(), last_day + 1):
+        while next_change < len(changes) and changes[next_change][0] <= day:
+            _, symbol_index, change = changes[next_change]
+            next_change += 1
+            holdings[symbol_index] += change
+            total_value += change * closes[symbol_index]
+        while next_price < len(prices) and prices[next_price][1] <= day:
+            symbol_index, _, close_price = prices[next_price]
+            next_price += 1
+            total_value += holdings[symbol_index] * \
+                (close_price - closes[symbol_index])
+            closes[symbol_index] = close_price
+        if day == last_day or is_sample_day(day, interval):
+            history.append(dict(
+                date = date.fromordinal(day).strftime('%Y-%m-%d'),
+                value = str(Decimal(total_value) / 100)
+            ))
+    return history
+
+def is_sample_day(day, interval):
+    """
+    Returns True if the date ordinal is the last day of its interval
+    """
+    if interval == 'day':
+        return True
+    if interval == 'week':
+        return date.fromordinal(day).isoweekday() == 7
+    return date.fromordinal(day + 1).day == 1
+
+def sample_count(start, end, interval):
+    """
+    Returns the number of values get_value_history returns from start to end,
+    the sample days plus end when it is not one
+    """
+    if interval == 'day':
+        return end.toordinal() - start.toordinal() + 1
+    if interval == 'week':
+        # date ordinals that are multiples of 7 are sundays
+        return end.toordinal() // 7 - (start.toordinal() - 1) // 7 + \
+            (0 if is_sample_day(end.toordinal(), interval) else 1)
+    return (end.year - start.year) * 12 + end.month - start.month + 1
+
+def parse_date(value):
+    """
+    Returns the date of a YYYY-MM-DD query argument, None if it is missing
+    """
+    return None if value is None else date.fromisoformat(value)
+
+def load_price_history(lookup, start, end):
+    """
+    Returns the close prices of the symbols from start to end and the last
+    close price of each before start, as (symbol index, date ordinal, close
+    price) tuples in date order
+
+    Keyword arguments:
+    lookup -- a dict of the stock symbols to load to their symbol index
+    start -- the first date
+    end -- the last date
+    """
+    if len(lookup) == 0:
+        return []
+    symbols = sorted(lookup)
+    start_time = datetime.combine(start, time.min)
+    end_time = datetime.combine(end + timedelta(days=1), time.min)
+    latest = db.session.query(
+        StockPrice.stock_symbol,
+        func.max(StockPrice.price_date).label('price_date')
+    ).filter(StockPrice.stock_symbol.in_(symbols) & \
+             (StockPrice.price_date < start_time)) \
+        .group_by(StockPrice.stock_symbol).subquery()
+    before_start = db.session.query(
+        StockPrice.stock_symbol,
+        StockPrice.price_date,
+        StockPrice.close_price
+    ).join(latest, and_(
+        StockPrice.stock_symbol == latest.c.stock_symbol,
+        StockPrice.price_date == latest.c.price_date
+    ))
+    in_range = db.session.query(
+        StockPrice.stock_symbol,
+        StockPrice.price_date,
+        StockPrice.close_price
+    ).filter(StockPrice.stock_symbol.in_(symbols) & \
+             (StockPrice.price_date >= start_time) & \
+             (StockPrice.price_date < end_time)) \
+        .order_by(StockPrice.price_date, StockPrice.id)
+    prices = []
+    for query in (before_start, in_range):
+        for stock_symbol, price_date, close_price in query:
+            prices.append((lookup[stock_symbol],
+                           price_date.toordinal(),
+                           close_price))
+    return prices
@@ -0,0 +1,329 @@
+from array import array
+from datetime import date
+from flask import g, request
+from flask_login import current_user
+from flaskr import db, ledger_cache, price_table, single_flight
+from flaskr.model import (
+    InvestmentAccount,
+    StockPrice,
+    StockTransaction,
+    User
+)
+from sqlalchemy import and_, bindparam, func
+from sqlalchemy.ext import baked
+import sys
+
+
+NO_ACCOUNT = -1
+"""The account id stored for transactions that have no account"""
+
+bakery = baked.bakery()
+"""Caches the hot queries below, each is built and compiled once per process"""
+
+
+class Ledger(object):
+    """
+    A compact, read-only copy of one user's stock transactions kept in
+    parallel arrays ordered by trade date. Index i of every array describes the
+    same transaction.
+    """
+    __slots__ = (
+        'user_id',
+        'symbols',
+        'symbol_indexes',
+        'account_ids',
+        'transaction_types',
+        'quantities',
+        'costs_per_unit',
+        'trade_fees',
+        'trade_dates',
+        'taxable_accounts'
+    )
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.symbols = []
+        """Every distinct stock symbol, symbol_indexes point into this list"""
+        self.symbol_indexes = array('i')
+        self.account_ids = array('q')
+        self.transaction_types = array('b')
+        """StockTransactionType values"""
+        self.quantities = array('q')
+        self.costs_per_unit = array('q')
+        self.trade_fees = array('q')
+        self.trade_dates = array('i')
+        """Proleptic Gregorian ordinals of the trade dates"""
+        self.taxable_accounts = set()
+        """Ids of the user's taxable accounts that have transactions"""
+
+    def __len__(self):
+        return len(self.quantities)
+
+    @staticmethod
+    def load(user_id):
+        """
+        Returns the Ledger for user_id read from the database in one query
+
+        Keyword arguments:
+        user_id -- the id of the user whose transactions are loaded
+        """
+        ledger = Ledger(user_id)
+        symbol_lookup = {}
+        for row in Ledger.build_ledger_query(user_id):
+            ledger.append(symbol_lookup, *row)
+        return ledger
+
+    @staticmethod
+    def build_ledger_query(user_id):
+        return LEDGER_QUERY(db.session()).params(user_id=user_id)
+
+    def append(self, symbol_lookup, stock_symbol, account_id, transaction_type,
+               quantity, cost_per_unit, trade_fee, trade_date, taxable):
+        symbol_index = symbol_lookup.get(stock_symbol)
+        if symbol_index is None:
+            symbol_index = len(self.symbols)
+            symbol_lookup[stock_symbol] = symbol_index
+            self.symbols.append(stock_symbol)
+        if account_id is None:
+            account_id = NO_ACCOUNT
+        elif taxable:
+            self.taxable_accounts.add(account_id)
+        self.symbol_indexes.append(symbol_index)
+        self.account_ids.append(account_id)
+        self.transaction_types.append(transaction_type.value)
+        self.quantities.append(quantity)
+        self.costs_per_unit.append(cost_per_unit)
+        self.trade_fees.append(trade_fee)
+        self.trade_dates.append(trade_date.toordinal())
+
+    def indexes(self, account_id=None):
+        """
+        Returns the indexes of the transactions in account_id in trade date
+        order, every transaction's index if account_id is None
+
+        Keyword arguments:
+        account_id -- the account to select, None for all accounts
+        """
+        if account_id is None:
+            return range(len(self))
+        account_ids = self.account_ids
+        return [i for i in range(len(account_ids))
+                if account_ids[i] == account_id]
+
+    def is_taxable(self, account_id):
+        return account_id in self.taxable_accounts
+
+    def nbytes(self):
+        """
+        Returns the approximate number of bytes of memory the ledger uses
+        """
+        arrays = (
+            self.symbol_indexes,
+            self.account_ids,
+            self.transaction_types,
+            self.quantities,
+            self.costs_per_unit,
+            self.trade_fees,
+            self.trade_dates
+        )
+        return sys.getsizeof(self) + \
+            sum(sys.getsizeof(values) for values in arrays) + \
+            sys.getsizeof(self.symbols) + \
+            sum(sys.getsizeof(symbol) for symbol in self.symbols) + \
+            sys.getsizeof(self.taxable_accounts)
+
+
+def get_ledger(user_id):
+    """
+    Returns the user's Ledger, shared with every generator for the rest of the
+    request. On first use in a request the ledger cache is checked against the
+    user's data version and the ledger is only read from the database on a miss,
+    concurrent misses for the same version share one read.
+
+    Keyword arguments:
+    user_id -- the id of the user
+    """
+    ledgers = g.setdefault('ledgers', {})
+    ledger = ledgers.get(user_id)
+    if ledger is None:
+        data_version = get_versions(user_id)[0]
+        ledger = ledger_cache.get(user_id, data_version)
+        if ledger is None:
+            ledger = single_flight.do(
+                ('ledger', user_id, data_version),
+                lambda: load_ledger(user_id, data_version)
+            )
+        ledgers[user_id] = ledger
+    return ledger
+
+def load_ledger(user_id, data_version):
+    """
+    Reads the user's Ledger from the database and caches it for data_version
+    """
+    generation = ledger_cache.generation(user_id)
+    ledger = Ledger.load(user_id)
+    ledger_cache.put(user_id, data_version, ledger, generation)
+    return ledger
+
+def clear_request_ledgers(exception=None):
+    """
+    Drops the ledgers and prices loaded during the request so an app context
+    that outlives the request does not hand them to the next one
+    """
+    g.pop('ledgers', None)
+    g.pop('latest_prices', None)
+    g.pop('versions', None)
+    g.pop('price_snapshot', None)
+
+def get_versions(user_id):
+    """
+    Returns a (data version, price version) tuple for the user, read in one
+    query and kept for the rest of the request. Together they identify every
+    input of the stats computations.
+
+    Keyword arguments:
+    user_id -- the id of the user
+    """
+    versions = g.setdefault('versions', {})
+    if user_id not in versions:
+        snapshot = get_price_snapshot()
+        if snapshot is None:
+            row = build_versions_query(user_id).one_or_none()
+            versions[user_id] = (0, 0) if row is None else (row[0], row[1])
+        else:
+            row = build_data_version_query(user_id).one_or_none()
+            versions[user_id] = (0 if row is None else row[0],
+                                 snapshot.version)
+    return versions[user_id]
+
+def build_versions_query(user_id):
+    """
+    The price version is the newest stock_price id, every price fetch deletes
+    and re-inserts a stock's prices so it changes whenever prices do
+    """
+    return VERSIONS_QUERY(db.session()).params(user_id=user_id)
+
+def build_data_version_query(user_id):
+    return DATA_VERSION_QUERY(db.session()).params(user_id=user_id)
+
+def stats_cache_key():
+    """
+    Returns the response cache key for the current request's stats, which
+    changes whenever the user's transactions or the stock prices change
+    """
+    data_version, price_version = get_versions(current_user.id)
+    return '%s:%s:%s:%s' % (
+        current_user.id,
+        data_version,
+        price_version,
+        request.full_path
+    )
+
+def history_cache_key():
+    """
+    Returns the response cache key for the current request's value history,
+    the stats key with the effective end date so a history that ends today by
+    default is not served on later days
+    """
+    return '%s:%s' % (stats_cache_key(),
+                      request.args.get('end', date.today().isoformat()))
+
+def get_latest_prices():
+    """
+    Returns a mapping of stock symbol to close price in cents on the latest
+    price date. The shared price table is used when it has been published,
+    otherwise the prices are loaded once per request from the database.
+    """
+    prices = get_price_snapshot()
+    if prices is None:
+        prices = g.get('latest_prices')
+        if prices is None:
+            prices = dict(build_latest_price_query())
+            g.latest_prices = prices
+    return prices
+
+def get_price_snapshot():
+    """
+    Returns the price table snapshot used for the rest of the request or None
+    if no price table has been published
+    """
+    if 'price_snapshot' not in g:
+        g.price_snapshot = price_table.snapshot()
+    return g.price_snapshot
+
+def publish_price_table():
+    """
+    Writes every stock's newest close price to the shared price table, the
+    table's version is the price version the prices were read at
+    """
+    version = db.session.query(price_version_query(db.session)).scalar()
+    price_table.write(build_price_table_query(), version)
+
+def build_latest_price_query():
+    return LATEST_PRICE_QUERY(db.session())
+
+def build_price_table_query():
+    latest = db.session.query(
+        StockPrice.stock_symbol,
+        func.max(StockPrice.price_date).label('price_date')
+    ).group_by(StockPrice.stock_symbol).subquery()
+    return db.session.query(
+        StockPrice.stock_symbol,
+        func.min(StockPrice.close_price),
+        latest.c.price_date
+    ).join(latest, and_(
+        StockPrice.stock_symbol == latest.c.stock_symbol,
+        StockPrice.price_date == latest.c.price_date
+    )).group_by(StockPrice.stock_symbol, latest.c.price_date)
+
+
+def ledger_query(session):
+    """
+    Every transaction of the bound user_id with its account's taxable flag in
+    trade date order, the columns Ledger.append takes
+    """
+    user_id = bindparam('user_id')
+    return session.query(
+        StockTransaction.stock_symbol,
+        StockTransaction.account_id,
+        StockTransaction.transaction_type,
+        StockTransaction.quantity,
+        StockTransaction.cost_per_unit,
+        StockTransaction.trade_fee,
+        StockTransaction.trade_date,
+        InvestmentAccount.taxable
+    ).outerjoin(
+        InvestmentAccount,
+        (InvestmentAccount.id == StockTransaction.account_id) & \
+        (InvestmentAccount.user_id == user_id)
+    ).filter(StockTransaction.user_id == user_id) \
+        .order_by(StockTransaction.trade_date, StockTransaction.id)
+
+def versions_query(session):
+    return session.query(User.data_version, price_version_query(session)) \
+        .filter(User.id == bindparam('user_id'))
+
+def price_version_query(session):
+    return session.query(
+        func.coalesce(func.max(StockPrice.id), 0)
+    ).as_scalar()
+
+def data_version_query(session):
+    return session.query(User.data_version) \
+        .filter(User.id == bindparam('user_id'))
+
+def latest_price_query(session):
+    last_date = session.query(
+        func.max(StockPrice.price_date)
+    ).as_scalar()
+    return session.query(
+        StockPrice.stock_symbol,
+        func.min(StockPrice.close_price)
+    ).filter(StockPrice.price_date == last_date) \
+        .group_by(StockPrice.stock_symbol)
+
+
+LEDGER_QUERY = bakery(ledger_query)
+VERSIONS_QUERY = bakery(versions_query)
+DATA_VERSION_QUERY = bakery(data_version_query)
+LATEST_PRICE_QUERY = bakery(latest_price_query)
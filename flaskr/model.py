@@ -1,15 +1,42 @@
 import enum
-from datetime import date
+from datetime import date, datetime
 from decimal import Decimal
 from flask_sqlalchemy import SQLAlchemy
-from flaskr import db, login_manager , apply_user_id
+from flaskr import (
+    db,
+    login_manager,
+    apply_user_id,
+    api_tokens,
+    ledger_cache,
+    password_hasher,
+    user_cache
+)
+from flaskr.utils.user_cache import CachedUser
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import event, select
+from sqlalchemy.orm.attributes import get_history
 
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return user_cache.get(int(user_id), load_user_snapshot)
+
+def load_user_snapshot(user_id):
+    """
+    Loads the user from the database and returns a detached snapshot of it
+    """
+    return CachedUser.from_user(User.query.get(user_id))
+
+@login_manager.request_loader
+def load_user_from_token(request):
+    """
+    Authenticates requests carrying an "Authorization: Bearer <token>" header
+    from the token's claims alone
+    """
+    authorization = request.headers.get('Authorization', '')
+    if not authorization.startswith('Bearer '):
+        return None
+    return api_tokens.loads(authorization[len('Bearer '):].strip())
 
 
 class User(UserMixin, db.Model):
@@ -20,6 +47,11 @@ class User(UserMixin, db.Model):
     """User's email"""
     password_hash = db.Column(db.String(128), nullable=False)
     """User's hashed password"""
+    data_version = db.Column(db.Integer, nullable=False, default=0,
+                             server_default='0')
+    """Incremented every time the user's accounts or transactions change"""
+    data_written_at = db.Column(db.DateTime, nullable=True)
+    """UTC time data_version was last incremented, None if it never was"""
     accounts = db.relationship('InvestmentAccount')
     """Accounts owned by the user"""
     stock_transactions = db.relationship('StockTransaction')
@@ -38,7 +70,7 @@ class User(UserMixin, db.Model):
         Keyword arguments:
         password -- the user's password
         """
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
 
     def check_password(self, password):
         """
@@ -47,7 +79,67 @@ class User(UserMixin, db.Model):
         Keyword arguments:
         password -- the user's password
         """
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.verify(self.password_hash, password)
+
+    def rehash_password(self, password):
+        """
+        Rehashes an already verified password if its hash was made with a
+        different method, cost or salt length than the configured ones.
+        Returns True if the password_hash was changed.
+
+        Keyword arguments:
+        password -- the user's verified password
+        """
+        if not password_hasher.needs_rehash(self.password_hash):
+            return False
+        self.set_password(password)
+        return True
+
+    @staticmethod
+    def bump_data_version(user_id):
+        """
+        Increments the user's data version in the current transaction, every
+        route that writes accounts or transactions calls this before committing
+
+        Keyword arguments:
+        user_id -- the id of the user whose data changed
+        """
+        db.session.query(User) \
+            .filter(User.id == user_id) \
+            .update({User.data_version: User.data_version + 1,
+                     User.data_written_at: datetime.utcnow()},
+                    synchronize_session=False)
+        ledger_cache.invalidate(user_id)
+
+
+@event.listens_for(db.session, 'after_flush')
+def collect_changed_users(session, flush_context):
+    """
+    Remembers the users whose email or password was flushed or who were
+    deleted, their cached snapshots are dropped once the transaction commits
+    """
+    changed = session.info.setdefault('changed_user_ids', set())
+    for target in session.dirty:
+        if isinstance(target, User) and target.id is not None and \
+                (get_history(target, 'email').has_changes() or \
+                 get_history(target, 'password_hash').has_changes()):
+            changed.add(target.id)
+    for target in session.deleted:
+        if isinstance(target, User):
+            changed.add(target.id)
+
+@event.listens_for(db.session, 'after_commit')
+def invalidate_cached_users(session):
+    """
+    Drops the cached snapshots of the users changed by the committed
+    transaction, so a concurrent request cannot cache the old values again
+    """
+    for user_id in session.info.pop('changed_user_ids', ()):
+        user_cache.invalidate(user_id)
+
+@event.listens_for(db.session, 'after_rollback')
+def forget_changed_users(session):
+    session.info.pop('changed_user_ids', None)
 
 
 class StockTransactionType(enum.Enum):
@@ -65,6 +157,10 @@ class StockTransactionType(enum.Enum):
 
 class StockTransaction(db.Model):
     __tablename__ = "stock_transaction"
+    __table_args__ = (
+        db.Index('ix_stock_transaction_user_id_trade_date',
+                 'user_id', 'trade_date'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     """StockTransaction's id"""
     transaction_type = db.Column(db.Enum(StockTransactionType), nullable=False)
@@ -98,14 +194,43 @@ class StockTransaction(db.Model):
     """The names of the data fields that need to be serialized"""
 
     def __iter__(self):
-        yield ('id', self.id)
-        yield ('transaction_type', self.transaction_type.name)
-        yield ('stock_symbol', self.stock_symbol)
-        yield ('cost_per_unit', str(Decimal(self.cost_per_unit) / 100))
-        yield ('quantity', self.quantity)
-        yield ('trade_fee', str(Decimal(self.trade_fee) / 100))
-        yield ('trade_date', self.trade_date.strftime('%Y-%m-%d'))
-        yield ('account_id', self.account_id)
+        return StockTransaction.row_items(self)
+
+    @staticmethod
+    def select_rows(whereclause):
+        """
+        Returns a Core select of the columns the transactions are serialized
+        from, its rows list transactions without loading them into the session
+
+        Keyword arguments:
+        whereclause -- the criteria of the transactions to select
+        """
+        table = StockTransaction.__table__
+        return select([
+            table.c.id,
+            table.c.transaction_type,
+            table.c.stock_symbol,
+            table.c.cost_per_unit,
+            table.c.quantity,
+            table.c.trade_fee,
+            table.c.trade_date,
+            table.c.account_id
+        ]).where(whereclause).order_by(table.c.id)
+
+    @staticmethod
+    def row_items(row):
+        """
+        Yields the serialized fields of a StockTransaction or a row of
+        select_rows
+        """
+        yield ('id', row.id)
+        yield ('transaction_type', row.transaction_type.name)
+        yield ('stock_symbol', row.stock_symbol)
+        yield ('cost_per_unit', str(Decimal(row.cost_per_unit) / 100))
+        yield ('quantity', row.quantity)
+        yield ('trade_fee', str(Decimal(row.trade_fee) / 100))
+        yield ('trade_date', row.trade_date.strftime('%Y-%m-%d'))
+        yield ('account_id', row.account_id)
 
     @staticmethod
     def serialize(data):
@@ -159,9 +284,30 @@ class InvestmentAccount(db.Model):
     """The stock transactions that belong to this investment account"""
 
     def __iter__(self):
-        yield ('id', self.id)
-        yield ('name', self.name)
-        yield ('taxable', self.taxable)
+        return InvestmentAccount.row_items(self)
+
+    @staticmethod
+    def select_rows(whereclause):
+        """
+        Returns a Core select of the columns the accounts are serialized from,
+        its rows list accounts without loading them into the session
+
+        Keyword arguments:
+        whereclause -- the criteria of the accounts to select
+        """
+        table = InvestmentAccount.__table__
+        return select([table.c.id, table.c.name, table.c.taxable]) \
+            .where(whereclause).order_by(table.c.id)
+
+    @staticmethod
+    def row_items(row):
+        """
+        Yields the serialized fields of an InvestmentAccount or a row of
+        select_rows
+        """
+        yield ('id', row.id)
+        yield ('name', row.name)
+        yield ('taxable', row.taxable)
 
 
 class StockMarker(db.Model):
@@ -181,6 +327,9 @@ class StockMarker(db.Model):
 
 class StockPrice(db.Model):
     __tablename__ = "stock_price"
+    # sqlite reuses the largest rowid after a delete, AUTOINCREMENT keeps the
+    # max id, the price version, increasing when a stock's prices are replaced
+    __table_args__ = {'sqlite_autoincrement': True}
     id = db.Column(db.Integer, primary_key=True)
     """The id of the StockPrice event"""
     stock_symbol = db.Column(db.String(16), nullable=False)
@@ -196,3 +345,71 @@ class StockPrice(db.Model):
             str(Decimal(self.close_price) / 100),
             self.price_date.strftime('%Y-%m-%d')
         )
+
+
+class UserShard(db.Model):
+    __tablename__ = "user_shard"
+    user_id = db.Column(db.Integer,
+                        db.ForeignKey('portfolio_user.id'),
+                        primary_key=True)
+    """The id of the user whose accounts and transactions were moved"""
+    shard = db.Column(db.String(64), nullable=False)
+    """The shard the user's accounts and transactions live on"""
+    moving_to = db.Column(db.String(64), nullable=True)
+    """
+    The shard the user is being moved to, their data cannot be written while
+    it is set
+    """
+
+    def __repr__(self):
+        return '<UserShard {}, {}>'.format(self.user_id, self.shard)
+
+
+class HoldingSnapshot(db.Model):
+    __tablename__ = "holding_snapshot"
+    __table_args__ = (
+        db.Index('ix_holding_snapshot_position',
+                 'user_id', 'account_id', 'stock_symbol', 'snapshot_date'),
+        db.Index('ix_holding_snapshot_user_id_snapshot_date',
+                 'user_id', 'snapshot_date'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    """HoldingSnapshot's id"""
+    user_id = db.Column(db.Integer,
+                        db.ForeignKey('portfolio_user.id'),
+                        nullable=False)
+    """The id of the user that holds the stock"""
+    account_id = db.Column(db.Integer, nullable=False)
+    """
+    The investment account's id, -1 for transactions without an account. Rows
+    of deleted accounts are dropped by the next build.
+    """
+    stock_symbol = db.Column(db.String(16), nullable=False)
+    """The held stock's ticker symbol"""
+    snapshot_date = db.Column(db.DateTime, nullable=False)
+    """The trade date the position changed on"""
+    quantity = db.Column(db.Integer, nullable=False)
+    """The quantity held at the end of snapshot_date"""
+    book_cost = db.Column(db.Integer, nullable=False)
+    """The adjusted cost base in cents at the end of snapshot_date"""
+
+    def __repr__(self):
+        return '<HoldingSnapshot {}, {}, {}, {}>'.format(
+            self.account_id,
+            self.stock_symbol,
+            self.snapshot_date.strftime('%Y-%m-%d'),
+            self.quantity
+        )
+
+
+class HoldingSnapshotState(db.Model):
+    __tablename__ = "holding_snapshot_state"
+    user_id = db.Column(db.Integer,
+                        db.ForeignKey('portfolio_user.id'),
+                        primary_key=True)
+    """The id of the user whose snapshots were built"""
+    data_version = db.Column(db.Integer, nullable=False)
+    """
+    The user's data version the snapshots were built from, they are only read
+    while it is the user's current data version
+    """
@@ -1,7 +1,16 @@
 from flask_login import current_user, login_user, login_required, logout_user
-from flaskr import db
+from flaskr import db, api_tokens
 from flaskr.model import User
-from flask import Blueprint, flash, redirect, render_template, url_for, jsonify
+from flaskr.utils.password_hasher import PasswordHasherBusy
+from flask import (
+    Blueprint,
+    flash,
+    jsonify,
+    redirect,
+    render_template,
+    request,
+    url_for
+)
 from flask_wtf import FlaskForm
 from wtforms import BooleanField, StringField, PasswordField, SubmitField
 from wtforms.validators import DataRequired, Email, EqualTo, Length
@@ -10,6 +19,17 @@ from wtforms.validators import DataRequired, Email, EqualTo, Length
 auth_bp = Blueprint('auth_bp', __name__, url_prefix="/auth")
 
 
+@auth_bp.errorhandler(PasswordHasherBusy)
+def password_hasher_busy(e):
+    """
+    Rejects the request straight away when too many passwords are already
+    being hashed
+    """
+    return 'Too many login attempts, please try again', 503, {
+        'Retry-After': '1'
+    }
+
+
 class LoginForm(FlaskForm):
     email = StringField('email', validators=[DataRequired()])
     password = PasswordField('password', validators=[DataRequired()])
@@ -27,6 +47,8 @@ def login():
         if user is None or not user.check_password(form.password.data):
             flash('Invalid username or password')
             return redirect(url_for('auth_bp.login'))
+        if user.rehash_password(form.password.data):
+            db.session.commit()
         login_user(user, remember=form.remember_me.data)
         return redirect('/app', code=302)
     return render_template('login.html', title='Sign In', form=form)
@@ -59,6 +81,27 @@ def register():
         return redirect(url_for('auth_bp.login'))
     return render_template('register.html', form=form)
 
+@auth_bp.route('/token', methods=['POST'])
+def issue_token():
+    """
+    Returns a signed api token for non-browser clients to send as an
+    "Authorization: Bearer <token>" header instead of a session cookie
+
+    Request data:
+    email -- the user's email
+    password -- the user's password
+    """
+    data = request.get_json(silent=True) or request.form
+    user = User.query.filter_by(email=data.get('email')).first()
+    if user is None or not user.check_password(data.get('password', '')):
+        return jsonify(None), 401
+    if user.rehash_password(data.get('password')):
+        db.session.commit()
+    return jsonify(dict(
+        token = api_tokens.dumps(user.id, user.data_version),
+        expires_in = api_tokens.max_age
+    ))
+
 @auth_bp.route("/logout", methods=['POST'])
 @login_required
 def logout():
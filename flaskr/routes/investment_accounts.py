@@ -2,15 +2,22 @@ from flask_login import login_required, current_user
 import json
 import logging
 import traceback
-from flask import Blueprint, jsonify, request
-from flaskr import db, apply_user_id
+from flask import Blueprint, current_app, jsonify, request
+from flaskr import db, apply_user_id, response_cache, single_flight
 from flaskr.generators.adjust_cost_base import AdjustCostBaseGenerator
-from flaskr.generators.book_cost import BookCostGenerator
-from flaskr.generators.market_value import MarketValueGenerator
+from flaskr.generators.portfolio_stats import PortfolioStatsGenerator
+from flaskr.generators.value_history import (
+    MAX_POINTS,
+    ValueHistoryGenerator,
+    parse_date
+)
+from flaskr.ledger import history_cache_key, stats_cache_key
 from flaskr.model import (
     InvestmentAccount,
-    StockTransaction
+    StockTransaction,
+    User
 )
+from flaskr.utils.database import is_statement_timeout
 from sqlalchemy import func
 
 
@@ -42,10 +49,9 @@ def get_all_investment_accounts():
     """
     Returns an array of all investment accounts belonging to the current user
     """
-    investment_accounts = db.session.query(InvestmentAccount) \
-        .filter(InvestmentAccount.user_id == current_user.id) \
-        .all()
-    return jsonify(list(map(dict, investment_accounts)))
+    rows = db.session.execute(InvestmentAccount.select_rows(
+        InvestmentAccount.user_id == current_user.id))
+    return jsonify([dict(InvestmentAccount.row_items(row)) for row in rows])
 
 @investment_accounts.route('/transactions', methods=['GET'])
 @login_required
@@ -55,11 +61,10 @@ def get_investment_account_transactions():
     account_id
     """
     id = request.args.get('account_id')
-    transactions = db.session.query(StockTransaction) \
-        .filter((StockTransaction.user_id == current_user.id) & \
-                (StockTransaction.account_id == id)) \
-        .all()
-    return jsonify(list(map(dict, transactions)))
+    rows = db.session.execute(StockTransaction.select_rows(
+        (StockTransaction.user_id == current_user.id) & \
+        (StockTransaction.account_id == id)))
+    return jsonify([dict(StockTransaction.row_items(row)) for row in rows])
 
 @investment_accounts.route('', methods=['POST'])
 @login_required
@@ -70,9 +75,12 @@ def create_investment_account():
             del json_data['id']
         investment_account = InvestmentAccount(**json_data)
         db.session.add(investment_account)
+        User.bump_data_version(current_user.id)
         db.session.commit()
         return jsonify(dict(investment_account))
     except Exception as e:
+        if is_statement_timeout(e):
+            raise
         logging.error(e)
         logging.error(traceback.format_exc())
         db.session.rollback()
@@ -94,9 +102,12 @@ def update_investment_account(id):
             .filter((InvestmentAccount.id == id) & \
                     (InvestmentAccount.user_id == current_user.id)) \
             .update(json_data)
+        User.bump_data_version(current_user.id)
         db.session.commit()
         return jsonify(json_data)
     except Exception as e:
+        if is_statement_timeout(e):
+            raise
         logging.error(e)
         logging.error(traceback.format_exc())
         db.session.rollback()
@@ -118,9 +129,12 @@ def delete_investment_account(id):
             .filter((InvestmentAccount.id == id) & \
                     (InvestmentAccount.user_id == current_user.id)) \
             .delete()
+        User.bump_data_version(current_user.id)
         db.session.commit()
         return jsonify(None)
     except Exception as e:
+        if is_statement_timeout(e):
+            raise
         logging.error(e)
         logging.error(traceback.format_exc())
         db.session.rollback()
@@ -128,21 +142,78 @@ def delete_investment_account(id):
 
 @investment_accounts.route('/<int:id>/stats', methods=['GET'])
 @login_required
+@response_cache.cached(stats_cache_key)
+@single_flight.coalesced_view(stats_cache_key)
 def get_investment_account_stats(id):
     """
     Returns a json object with stat values for the investment account
+
+    Query arguments:
+    include -- "acb" to also return the adjusted cost base values from the
+               same pass over the account's transactions
     """
-    return jsonify(dict(
-        book_cost = BookCostGenerator(current_user.id, id).next(),
-        market_value = MarketValueGenerator(current_user.id, id).next()
-    ))
+    include_acb = request.args.get('include') == 'acb'
+    return jsonify(PortfolioStatsGenerator(current_user.id,
+                                           id,
+                                           include_acb).next())
 
 @investment_accounts.route('/<int:id>/acb', methods=['GET'])
 @login_required
+@response_cache.cached(stats_cache_key)
+@single_flight.coalesced_view(stats_cache_key)
 def get_investment_account_acb(id):
     """
     Returns an object with adjusted cost base values for the investment account
+
+    Query arguments:
+    as_of -- the date as YYYY-MM-DD to return the adjusted cost base at the
+             end of, defaults to all of the account's transactions
     """
-    return jsonify(dict(
-        adjust_cost_base = AdjustCostBaseGenerator(current_user.id, id).next()
-    ))
+    try:
+        return jsonify(dict(
+            adjust_cost_base = AdjustCostBaseGenerator(
+                current_user.id,
+                id,
+                parse_date(request.args.get('as_of'))
+            ).next()
+        ))
+    except Exception as e:
+        if is_statement_timeout(e):
+            raise
+        logging.error(e)
+        logging.error(traceback.format_exc())
+        db.session.rollback()
+        return jsonify(None)
+
+@investment_accounts.route('/<int:id>/history', methods=['GET'])
+@login_required
+@response_cache.cached(history_cache_key)
+@single_flight.coalesced_view(history_cache_key)
+def get_investment_account_history(id):
+    """
+    Returns the investment account's market value on each day of a date range
+
+    Query arguments:
+    start -- the first date as YYYY-MM-DD, defaults to the first trade date
+    end -- the last date as YYYY-MM-DD, defaults to today
+    interval -- day, week or month, each value is the market value at the
+                close of its interval and the last one is at end
+
+    A range with more values than HISTORY_MAX_POINTS is rejected.
+    """
+    try:
+        return jsonify(ValueHistoryGenerator(
+            current_user.id,
+            parse_date(request.args.get('start')),
+            parse_date(request.args.get('end')),
+            request.args.get('interval', 'day'),
+            id,
+            current_app.config.get('HISTORY_MAX_POINTS', MAX_POINTS)
+        ).next())
+    except Exception as e:
+        if is_statement_timeout(e):
+            raise
+        logging.error(e)
+        logging.error(traceback.format_exc())
+        db.session.rollback()
+        return jsonify(None)
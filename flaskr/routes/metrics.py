@@ -0,0 +1,138 @@
+from datetime import date, datetime, time as datetime_time, timezone
+from flask import Blueprint, current_app, g, has_app_context, request
+from flaskr import (
+    db,
+    ledger_cache,
+    metrics,
+    price_table,
+    response_cache,
+    single_flight,
+    user_cache
+)
+from flaskr.model import StockPrice
+from flaskr.utils.database import app_engines
+from flaskr.utils.metrics import (
+    GENERATOR_DURATION,
+    IMPORT_DURATION,
+    IMPORTED_ROWS
+)
+from sqlalchemy import func
+import time
+
+
+metrics_bp = Blueprint('metrics_bp', __name__)
+
+REQUEST_DURATION = 'portfolio_request_duration_seconds'
+REQUESTS = 'portfolio_requests_total'
+POOL_CHECKOUT = 'portfolio_db_pool_checkout_seconds'
+POOL_IN_USE = 'portfolio_db_pool_connections_in_use'
+CACHE_HITS = 'portfolio_cache_hits_total'
+CACHE_MISSES = 'portfolio_cache_misses_total'
+COALESCED = 'portfolio_single_flight_coalesced_total'
+LATEST_PRICE_DATE = 'portfolio_price_latest_date_timestamp_seconds'
+
+metrics.describe(REQUEST_DURATION, 'histogram',
+                 'Request latency by endpoint')
+metrics.describe(REQUESTS, 'counter', 'Requests by endpoint and status')
+metrics.describe(GENERATOR_DURATION, 'histogram',
+                 'Time spent computing statistics by generator')
+metrics.describe(IMPORT_DURATION, 'histogram',
+                 'Time spent importing a transaction csv')
+metrics.describe(IMPORTED_ROWS, 'counter', 'Transactions imported from csv')
+metrics.describe(POOL_CHECKOUT, 'histogram',
+                 'Time spent waiting for a database connection')
+metrics.describe(POOL_IN_USE, 'gauge', 'Database connections checked out')
+metrics.describe(CACHE_HITS, 'counter', 'Cache hits by cache')
+metrics.describe(CACHE_MISSES, 'counter', 'Cache misses by cache')
+metrics.describe(COALESCED, 'counter',
+                 'Stats requests that shared another request\'s computation')
+metrics.describe(LATEST_PRICE_DATE, 'gauge',
+                 'Date of the newest stock price, the price lag is the time '
+                 'since it')
+
+@metrics_bp.record_once
+def instrument_pool(state):
+    """
+    Times how long each checkout from the connection pools of the app's
+    primary, replicas and shards waits
+    """
+    for name, engine in app_engines(state.app, db):
+        time_checkouts(engine.pool, (('database', name),))
+
+def time_checkouts(pool, labels):
+    connect = pool.connect
+    def timed_connect():
+        start = time.perf_counter()
+        try:
+            return connect()
+        finally:
+            metrics.observe(POOL_CHECKOUT, time.perf_counter() - start,
+                            labels)
+    pool.connect = timed_connect
+
+@metrics_bp.before_app_request
+def start_request_timer():
+    g.metrics_start = time.perf_counter()
+
+@metrics_bp.after_app_request
+def record_request(response):
+    start = g.pop('metrics_start', None)
+    if start is not None:
+        endpoint = request.endpoint or 'none'
+        metrics.observe(REQUEST_DURATION,
+                        time.perf_counter() - start,
+                        (('endpoint', endpoint), ('method', request.method)))
+        metrics.inc(REQUESTS, (('endpoint', endpoint),
+                               ('method', request.method),
+                               ('status', str(response.status_code))))
+    metrics.maybe_flush()
+    return response
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Returns every process's metrics in the Prometheus text format
+    """
+    payload = metrics.render([
+        (LATEST_PRICE_DATE, (), get_latest_price_timestamp())
+    ])
+    return current_app.response_class(
+        payload,
+        mimetype='text/plain; version=0.0.4'
+    )
+
+def get_latest_price_timestamp():
+    snapshot = price_table.snapshot()
+    if snapshot is not None:
+        latest_date = date.fromordinal(snapshot.latest_date) \
+            if snapshot.latest_date > 0 else None
+    else:
+        latest_date = db.session.query(func.max(StockPrice.price_date)) \
+            .scalar()
+    if latest_date is None:
+        return 0
+    return datetime.combine(latest_date, datetime_time(),
+                            tzinfo=timezone.utc).timestamp()
+
+def collect_cache_stats():
+    """
+    Returns the hit and miss counters of the process's caches and the
+    connections each of its pools has checked out
+    """
+    samples = []
+    for name, cache in (('user', user_cache),
+                        ('ledger', ledger_cache),
+                        ('response', response_cache)):
+        stats = cache.stats()
+        samples.append((CACHE_HITS, (('cache', name),), stats['hits']))
+        samples.append((CACHE_MISSES, (('cache', name),), stats['misses']))
+    samples.append((COALESCED, (), single_flight.stats()['coalesced']))
+    if has_app_context():
+        for name, engine in app_engines(current_app, db):
+            checkedout = getattr(engine.pool, 'checkedout', None)
+            if checkedout is not None:
+                samples.append((POOL_IN_USE, (('database', name),),
+                                checkedout()))
+    return samples
+
+metrics.add_collector(collect_cache_stats)
@@ -5,14 +5,23 @@ import io
 import json
 import logging
 import traceback
-from flask import Blueprint, jsonify, request, make_response
-from flaskr import db
-from flaskr.generators.book_cost import BookCostGenerator
-from flaskr.generators.market_value import MarketValueGenerator
+from flask import Blueprint, current_app, jsonify, request, make_response
+from flaskr import db, metrics, response_cache, single_flight
+from flaskr.generators.portfolio_stats import PortfolioStatsGenerator
+from flaskr.generators.transaction_aggregate import TransactionAggregateGenerator
+from flaskr.generators.value_history import (
+    MAX_POINTS,
+    ValueHistoryGenerator,
+    parse_date
+)
+from flaskr.ledger import history_cache_key, stats_cache_key
 from flaskr.model import (
     StockTransaction,
-    StockTransactionType
+    StockTransactionType,
+    User
 )
+from flaskr.utils.database import is_statement_timeout
+from flaskr.utils.metrics import IMPORT_DURATION, IMPORTED_ROWS
 
 
 stock_transactions = Blueprint('stock_transaction_bp', __name__, url_prefix="/transaction")
@@ -38,10 +47,9 @@ def get_all_transaction():
     """
     Returns all stock transactions that belong to the current user
     """
-    stock_transactions = db.session.query(StockTransaction) \
-            .filter(StockTransaction.user_id == current_user.id) \
-            .all()
-    return jsonify(list(map(dict, stock_transactions)))
+    rows = db.session.execute(StockTransaction.select_rows(
+        StockTransaction.user_id == current_user.id))
+    return jsonify([dict(StockTransaction.row_items(row)) for row in rows])
 
 @stock_transactions.route('/', methods=['POST'])
 @login_required
@@ -57,9 +65,12 @@ def create_transaction():
             del json_data['id']
         transaction = StockTransaction(**StockTransaction.deserialize(json_data))
         db.session.add(transaction)
+        User.bump_data_version(current_user.id)
         db.session.commit()
         return jsonify(dict(transaction))
     except Exception as e:
+        if is_statement_timeout(e):
+            raise
         logging.error(e)
         logging.error(traceback.format_exc())
         db.session.rollback()
@@ -79,9 +90,12 @@ def update_transaction(id):
             .filter((StockTransaction.id == id) & \
                     (StockTransaction.user_id == current_user.id)) \
             .update(update_data)
+        User.bump_data_version(current_user.id)
         db.session.commit()
         return jsonify(StockTransaction.serialize(update_data))
     except Exception as e:
+        if is_statement_timeout(e):
+            raise
         logging.error(e)
         logging.error(traceback.format_exc())
         db.session.rollback()
@@ -98,9 +112,12 @@ def delete_transaction(id):
             .filter((StockTransaction.id == id) & \
                     (StockTransaction.user_id == current_user.id)) \
             .delete()
+        User.bump_data_version(current_user.id)
         db.session.commit()
         return jsonify(None)
     except Exception as e:
+        if is_statement_timeout(e):
+            raise
         logging.error(e)
         logging.error(traceback.format_exc())
         db.session.rollback()
@@ -112,14 +129,14 @@ def export_transactions():
     """
     Exports all the user's user's transactions
     """
-    stock_transactions_query = db.session.query(StockTransaction) \
-            .filter(StockTransaction.user_id == current_user.id)
+    rows = db.session.execute(StockTransaction.select_rows(
+        StockTransaction.user_id == current_user.id))
 
     csv_stream = io.StringIO()
     csv_writer = csv.writer(csv_stream)
     csv_writer.writerow(StockTransaction.DATA_KEYS)
-    for transaction in stock_transactions_query.all():
-        transaction_fields = dict(transaction)
+    for transaction in rows:
+        transaction_fields = dict(StockTransaction.row_items(transaction))
         row = []
         for key in StockTransaction.DATA_KEYS:
             row.append(transaction_fields[key])
@@ -131,6 +148,7 @@ def export_transactions():
 
 @stock_transactions.route('/import', methods=['POST'])
 @login_required
+@metrics.timer(IMPORT_DURATION)
 def batch_create_transaction():
     """
     Reads the relevant transaction data from the csv and creates the
@@ -167,9 +185,13 @@ def batch_create_transaction():
             ))
 
         db.session.bulk_save_objects(transactions)
+        User.bump_data_version(current_user.id)
         db.session.commit()
+        metrics.inc(IMPORTED_ROWS, amount=len(transactions))
         return ''
     except Exception as e:
+        if is_statement_timeout(e):
+            raise
         logging.error(e)
         logging.error(traceback.format_exc())
         db.session.rollback()
@@ -194,9 +216,12 @@ def batch_move_transaction():
                 StockTransaction.account_id: account_id
             }, synchronize_session=False)
 
+        User.bump_data_version(current_user.id)
         db.session.commit()
         return ''
     except Exception as e:
+        if is_statement_timeout(e):
+            raise
         logging.error(e)
         logging.error(traceback.format_exc())
         db.session.rollback()
@@ -216,9 +241,12 @@ def batch_delete_transaction():
             .filter((StockTransaction.id.in_(transaction_ids)) & \
                     (StockTransaction.user_id == current_user.id)) \
             .delete(synchronize_session=False)
+        User.bump_data_version(current_user.id)
         db.session.commit()
         return ''
     except Exception as e:
+        if is_statement_timeout(e):
+            raise
         logging.error(e)
         logging.error(traceback.format_exc())
         db.session.rollback()
@@ -226,12 +254,82 @@ def batch_delete_transaction():
 
 @stock_transactions.route('/stats', methods=['GET'])
 @login_required
+@response_cache.cached(stats_cache_key)
+@single_flight.coalesced_view(stats_cache_key)
 def get_transaction_stats():
     """
     Returns a json object with stat values for all transactions associated with
     the current user
     """
-    return jsonify(dict(
-        book_cost = BookCostGenerator(current_user.id, None).next(),
-        market_value = MarketValueGenerator(current_user.id, None).next()
-    ))
+    return jsonify(PortfolioStatsGenerator(current_user.id, None).next())
+
+@stock_transactions.route('/history', methods=['GET'])
+@login_required
+@response_cache.cached(history_cache_key)
+@single_flight.coalesced_view(history_cache_key)
+def get_transaction_history():
+    """
+    Returns the market value of all of the current user's holdings on each day
+    of a date range
+
+    Query arguments:
+    start -- the first date as YYYY-MM-DD, defaults to the first trade date
+    end -- the last date as YYYY-MM-DD, defaults to today
+    interval -- day, week or month, each value is the market value at the
+                close of its interval and the last one is at end
+
+    A range with more values than HISTORY_MAX_POINTS is rejected.
+    """
+    try:
+        return jsonify(ValueHistoryGenerator(
+            current_user.id,
+            parse_date(request.args.get('start')),
+            parse_date(request.args.get('end')),
+            request.args.get('interval', 'day'),
+            None,
+            current_app.config.get('HISTORY_MAX_POINTS', MAX_POINTS)
+        ).next())
+    except Exception as e:
+        if is_statement_timeout(e):
+            raise
+        logging.error(e)
+        logging.error(traceback.format_exc())
+        db.session.rollback()
+        return jsonify(None)
+
+@stock_transactions.route('/aggregate', methods=['GET'])
+@login_required
+def get_transaction_aggregate():
+    """
+    Returns the current user's transactions aggregated on the server
+
+    Query arguments:
+    group_by -- comma separated dimensions: symbol, account, type, day, month,
+                year. If omitted a single row with the totals is returned
+    metrics -- comma separated metrics: count, quantity, gross_amount, fees.
+               If omitted all metrics are returned
+    account_id -- optionally restricts the aggregation to one account
+    """
+    try:
+        group_by = split_arg(request.args.get('group_by'))
+        metric_names = split_arg(request.args.get('metrics')) or \
+            list(TransactionAggregateGenerator.METRICS.keys())
+        account_id = request.args.get('account_id', type=int)
+        return jsonify(TransactionAggregateGenerator(
+            current_user.id, group_by, metric_names, account_id
+        ).next())
+    except Exception as e:
+        if is_statement_timeout(e):
+            raise
+        logging.error(e)
+        logging.error(traceback.format_exc())
+        db.session.rollback()
+        return jsonify(None)
+
+def split_arg(value):
+    """
+    Splits a comma separated query argument into a list of its values
+    """
+    if value is None:
+        return []
+    return [part.strip() for part in value.split(',') if part.strip() != '']
@@ -0,0 +1,240 @@
+from datetime import datetime
+from flaskr import db, shard_router
+from flaskr.ledger import Ledger, get_versions
+from flaskr.model import (
+    HoldingSnapshot,
+    HoldingSnapshotState,
+    StockTransactionType,
+    User
+)
+from flaskr.utils.shards import ShardMoving
+from sqlalchemy import and_, func, select
+import logging
+import traceback
+
+
+BUY = StockTransactionType.buy.value
+SELL = StockTransactionType.sell.value
+
+
+def snapshot_rows(ledger):
+    """
+    Returns a (date ordinal, account id, stock symbol, quantity, book cost)
+    tuple for every account, stock and day the ledger has transactions on,
+    with the position at the end of that day, sorted. The book cost is the
+    adjusted cost base in cents computed like get_adjust_cost_base.
+
+    Keyword arguments:
+    ledger -- the Ledger of the user
+    """
+    symbol_indexes = ledger.symbol_indexes
+    account_ids = ledger.account_ids
+    transaction_types = ledger.transaction_types
+    quantities = ledger.quantities
+    costs_per_unit = ledger.costs_per_unit
+    trade_fees = ledger.trade_fees
+    trade_dates = ledger.trade_dates
+    positions = {}
+    rows = {}
+    for i in ledger.indexes():
+        key = (account_ids[i], ledger.symbols[symbol_indexes[i]])
+        quantity, book_cost = positions.get(key, (0, 0.0))
+        if transaction_types[i] == BUY:
+            book_cost += (quantities[i] * costs_per_unit[i]) + trade_fees[i]
+            quantity += quantities[i]
+        elif transaction_types[i] == SELL:
+            if quantity != 0:
+                book_cost *= (quantity - quantities[i]) / quantity
+            quantity -= quantities[i]
+        positions[key] = (quantity, book_cost)
+        rows[(trade_dates[i],) + key] = (quantity, book_cost)
+    return sorted(key + (quantity, round(book_cost))
+                  for key, (quantity, book_cost) in rows.items())
+
+def build_snapshots(user_id, repair=False):
+    """
+    Brings the user's holding snapshots up to their current data version and
+    returns the number of rows written. Rows before the first one that differs
+    from the ledger are kept, so appending transactions only writes their days.
+
+    Keyword arguments:
+    user_id -- the id of the user
+    repair -- if True every snapshot row of the user is rewritten
+    """
+    table = HoldingSnapshot.__table__
+    with shard_router.for_user(user_id):
+        data_version = db.session.query(User.data_version) \
+            .filter(User.id == user_id).scalar()
+        if data_version is None:
+            return 0
+        computed = snapshot_rows(Ledger.load(user_id))
+        if repair:
+            db.session.execute(table.delete()
+                               .where(table.c.user_id == user_id))
+            existing = []
+        else:
+            existing = sorted(
+                (row.snapshot_date.toordinal(), row.account_id,
+                 row.stock_symbol, row.quantity, row.book_cost)
+                for row in db.session.execute(select([
+                    table.c.snapshot_date,
+                    table.c.account_id,
+                    table.c.stock_symbol,
+                    table.c.quantity,
+                    table.c.book_cost
+                ]).where(table.c.user_id == user_id))
+            )
+        first = 0
+        while first < len(existing) and first < len(computed) and \
+                existing[first] == computed[first]:
+            first += 1
+        written = []
+        if first < len(existing) or first < len(computed):
+            since = min(rows[first][0] for rows in (existing, computed)
+                        if first < len(rows))
+            if first < len(existing):
+                db.session.execute(table.delete().where(
+                    (table.c.user_id == user_id) & \
+                    (table.c.snapshot_date >= ordinal_datetime(since))))
+            written = [row for row in computed if row[0] >= since]
+        if len(written) > 0:
+            db.session.execute(table.insert(), [dict(
+                user_id = user_id,
+                snapshot_date = ordinal_datetime(day),
+                account_id = account_id,
+                stock_symbol = stock_symbol,
+                quantity = quantity,
+                book_cost = book_cost
+            ) for day, account_id, stock_symbol, quantity, book_cost
+                in written])
+        state = db.session.query(HoldingSnapshotState).get(user_id)
+        if state is None:
+            db.session.add(HoldingSnapshotState(user_id=user_id,
+                                                data_version=data_version))
+        else:
+            state.data_version = data_version
+        db.session.commit()
+    return len(written)
+
+def stale_user_ids():
+    """
+    Returns the ids of the users whose snapshots were not built from their
+    current data version, in id order
+    """
+    versions = dict(db.session.query(User.id, User.data_version))
+    state = HoldingSnapshotState.__table__
+    built = {}
+    for shard in shard_router.names():
+        built.update(shard_router.engine(shard).execute(
+            select([state.c.user_id, state.c.data_version])).fetchall())
+    return sorted(user_id for user_id, data_version in versions.items()
+                  if built.get(user_id) != data_version)
+
+def build_all_snapshots(user_ids=None, repair=False, log=print):
+    """
+    Builds the snapshots of the users and returns (users built, rows written).
+    A user that is being moved between shards or fails is logged and skipped.
+
+    Keyword arguments:
+    user_ids -- the users to build, defaults to every user with stale
+                snapshots, or every user when repairing
+    repair -- if True the users' snapshots are rewritten from scratch
+    log -- called with progress messages
+    """
+    if user_ids is None:
+        user_ids = stale_user_ids() if not repair else \
+            [user_id for user_id, in db.session.query(User.id)
+                .order_by(User.id)]
+    users = 0
+    rows = 0
+    for user_id in user_ids:
+        try:
+            rows += build_snapshots(user_id, repair)
+            users += 1
+        except ShardMoving as e:
+            db.session.rollback()
+            log('Skipped user %d: %s' % (user_id, e))
+        except Exception as e:
+            logging.error(e)
+            logging.error(traceback.format_exc())
+            db.session.rollback()
+            log('Failed to build the snapshots of user %d: %s' % (user_id, e))
+    return users, rows
+
+def snapshots_fresh(user_id):
+    """
+    Returns True if the user's snapshots were built from the data version the
+    current request reads
+    """
+    built_version = db.session.query(HoldingSnapshotState.data_version) \
+        .filter(HoldingSnapshotState.user_id == user_id).scalar()
+    return built_version is not None and \
+        built_version == get_versions(user_id)[0]
+
+def load_positions(user_id, as_of, account_id=None):
+    """
+    Returns (account id, stock symbol, quantity, book cost) tuples of every
+    position the user held at the end of as_of, one index lookup per position
+
+    Keyword arguments:
+    user_id -- the id of the user
+    as_of -- the date of the positions
+    account_id -- if provided only this account's positions are returned
+    """
+    criteria = (HoldingSnapshot.user_id == user_id) & \
+        (HoldingSnapshot.snapshot_date <
+         ordinal_datetime(as_of.toordinal() + 1))
+    if account_id is not None:
+        criteria = criteria & (HoldingSnapshot.account_id == account_id)
+    latest = db.session.query(
+        HoldingSnapshot.account_id,
+        HoldingSnapshot.stock_symbol,
+        func.max(HoldingSnapshot.snapshot_date).label('snapshot_date')
+    ).filter(criteria) \
+        .group_by(HoldingSnapshot.account_id, HoldingSnapshot.stock_symbol) \
+        .subquery()
+    return db.session.query(
+        HoldingSnapshot.account_id,
+        HoldingSnapshot.stock_symbol,
+        HoldingSnapshot.quantity,
+        HoldingSnapshot.book_cost
+    ).join(latest, and_(
+        HoldingSnapshot.account_id == latest.c.account_id,
+        HoldingSnapshot.stock_symbol == latest.c.stock_symbol,
+        HoldingSnapshot.snapshot_date == latest.c.snapshot_date
+    )).filter(HoldingSnapshot.user_id == user_id).all()
+
+def load_position_changes(user_id, start, end, account_id=None):
+    """
+    Returns (date ordinal, account id, stock symbol, quantity) tuples of the
+    positions that changed from start to end, in date order
+
+    Keyword arguments:
+    user_id -- the id of the user
+    start -- the first date, None for the first snapshot
+    end -- the last date
+    account_id -- if provided only this account's positions are returned
+    """
+    criteria = (HoldingSnapshot.user_id == user_id) & \
+        (HoldingSnapshot.snapshot_date < ordinal_datetime(end.toordinal() + 1))
+    if start is not None:
+        criteria = criteria & \
+            (HoldingSnapshot.snapshot_date >= ordinal_datetime(start.toordinal()))
+    if account_id is not None:
+        criteria = criteria & (HoldingSnapshot.account_id == account_id)
+    return sorted(
+        (snapshot_date.toordinal(), account_id, stock_symbol, quantity)
+        for snapshot_date, account_id, stock_symbol, quantity
+        in db.session.query(
+            HoldingSnapshot.snapshot_date,
+            HoldingSnapshot.account_id,
+            HoldingSnapshot.stock_symbol,
+            HoldingSnapshot.quantity
+        ).filter(criteria)
+    )
+
+def ordinal_datetime(day):
+    """
+    Returns midnight of the date ordinal, the way trade dates are stored
+    """
+    return datetime.fromordinal(day)
@@ -0,0 +1,65 @@
+from flask_login import UserMixin
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+
+class TokenUser(UserMixin):
+    """
+    A read-only user built from the claims of a verified api token, it is
+    never loaded from the database
+    """
+    __slots__ = ('id', 'data_version')
+
+    def __init__(self, id, data_version):
+        object.__setattr__(self, 'id', id)
+        object.__setattr__(self, 'data_version', data_version)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('TokenUser is read-only')
+
+    def __repr__(self):
+        return '<TokenUser {}>'.format(self.id)
+
+
+class ApiTokenSerializer(object):
+    """
+    Issues and verifies signed, expiring api tokens. The first secret key signs
+    new tokens, every key is accepted when verifying so keys can be rotated by
+    prepending a new one and dropping the oldest once its tokens expired.
+    """
+    SALT = 'api-token'
+
+    def __init__(self, max_age=3600):
+        self.max_age = max_age
+        self.serializers = []
+
+    def init_app(self, app):
+        secret_keys = app.config.get('API_TOKEN_SECRET_KEYS') or \
+            [app.config.get('SECRET_KEY')]
+        self.max_age = app.config.get('API_TOKEN_MAX_AGE', self.max_age)
+        self.serializers = [
+            URLSafeTimedSerializer(key, salt=self.SALT)
+            for key in secret_keys if key
+        ]
+
+    def dumps(self, user_id, data_version):
+        """
+        Returns a signed token carrying the user's id and data version
+
+        Keyword arguments:
+        user_id -- the id of the user the token authenticates
+        data_version -- the user's data version when the token is issued
+        """
+        return self.serializers[0].dumps(dict(uid=user_id, dv=data_version))
+
+    def loads(self, token):
+        """
+        Returns the TokenUser for a valid token or None if the token is expired
+        or not signed by any of the secret keys
+        """
+        for serializer in self.serializers:
+            try:
+                claims = serializer.loads(token, max_age=self.max_age)
+                return TokenUser(int(claims['uid']), int(claims['dv']))
+            except (BadSignature, KeyError, TypeError, ValueError):
+                continue
+        return None
@@ -0,0 +1,123 @@
+from flask import has_request_context, jsonify, request
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError, TimeoutError
+import logging
+
+
+POOL_OPTIONS = (
+    ('DATABASE_POOL_SIZE', 'pool_size'),
+    ('DATABASE_MAX_OVERFLOW', 'max_overflow'),
+    ('DATABASE_POOL_RECYCLE', 'pool_recycle'),
+    ('DATABASE_POOL_PRE_PING', 'pool_pre_ping'),
+    ('DATABASE_POOL_TIMEOUT', 'pool_timeout')
+)
+"""Config keys of the connection pool and the engine option each one sets"""
+
+QUERY_CANCELED = '57014'
+"""Postgres error code of a statement cancelled by statement_timeout"""
+
+
+def apply_pool_options(config):
+    """
+    Copies the DATABASE_POOL_* settings into SQLALCHEMY_ENGINE_OPTIONS, an
+    engine option that is already set there wins
+    """
+    engine_options = dict(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    for key, option in POOL_OPTIONS:
+        if config.get(key) is not None:
+            engine_options.setdefault(option, config[key])
+    config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options
+
+def app_engines(app, db):
+    """
+    Returns (name, engine) pairs of the app's primary database, its replicas
+    and its shards, the routers must have been initialized first
+    """
+    engines = [('primary', db.get_engine(app))]
+    if 'replica_router' in app.extensions:
+        engines.extend(
+            ('replica_%d' % index, engine) for index, engine
+            in enumerate(app.extensions['replica_router'].engines))
+    if 'shard_router' in app.extensions:
+        engines.extend(
+            ('shard_%s' % name, engine) for name, engine
+            in sorted(app.extensions['shard_router'].engines.items()))
+    return engines
+
+def is_statement_timeout(error):
+    """
+    Returns True if the error is a statement cancelled by statement_timeout
+    """
+    return isinstance(error, OperationalError) and \
+        getattr(error.orig, 'pgcode', None) == QUERY_CANCELED
+
+
+class StatementTimeouts(object):
+    """
+    Sets a statement_timeout on each transaction a request begins, so a slow
+    query fails with a 503 instead of holding its connection and thread.
+    STATEMENT_TIMEOUTS maps endpoints and blueprints to milliseconds, an
+    endpoint's budget wins over its blueprint's and STATEMENT_TIMEOUT is used
+    for the rest. Only postgres databases are limited.
+    """
+    def __init__(self):
+        self.budgets = {}
+        self.default = None
+        self.db = None
+
+    def init_app(self, app, db):
+        self.budgets = dict(app.config.get('STATEMENT_TIMEOUTS', {}))
+        self.default = app.config.get('STATEMENT_TIMEOUT')
+        self.db = db
+        app.register_error_handler(OperationalError, self.handle_timeout)
+        app.register_error_handler(TimeoutError, self.handle_pool_timeout)
+        if self.default is None and len(self.budgets) == 0:
+            return
+        for _, engine in app_engines(app, db):
+            if engine.dialect.name == 'postgresql':
+                event.listen(engine, 'begin', self.begin)
+
+    def budget(self):
+        """
+        Returns the milliseconds statements of the current request may run
+        for, None if they are not limited
+        """
+        if not has_request_context():
+            return None
+        if request.endpoint in self.budgets:
+            return self.budgets[request.endpoint]
+        return self.budgets.get(request.blueprint, self.default)
+
+    def begin(self, conn):
+        milliseconds = self.budget()
+        if milliseconds is None:
+            return
+        cursor = conn.connection.cursor()
+        try:
+            cursor.execute('SET LOCAL statement_timeout = %d'
+                           % int(milliseconds))
+        finally:
+            cursor.close()
+
+    def handle_timeout(self, error):
+        if not is_statement_timeout(error):
+            raise error
+        logging.warning("Statement timeout after %sms in %s %s",
+                        self.budget(), request.method, request.full_path)
+        return self.unavailable('statement_timeout',
+                                'The request took too long and was '
+                                'cancelled')
+
+    def handle_pool_timeout(self, error):
+        logging.warning("No database connection for %s %s: %s",
+                        request.method, request.full_path, error)
+        return self.unavailable('database_busy',
+                                'No database connection was free, try '
+                                'again')
+
+    def unavailable(self, error, message):
+        self.db.session.rollback()
+        response = jsonify(dict(error = error, message = message))
+        response.status_code = 503
+        response.headers['Retry-After'] = '1'
+        return response
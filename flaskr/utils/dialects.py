@@ -0,0 +1,110 @@
+from sqlalchemy import DateTime, event
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql.expression import FunctionElement, literal_column
+from sqlalchemy.sql.functions import func
+
+
+SQLITE_PRAGMAS = (
+    ('journal_mode', 'SQLITE_JOURNAL_MODE', 'WAL'),
+    ('synchronous', 'SQLITE_SYNCHRONOUS', 'NORMAL'),
+    ('mmap_size', 'SQLITE_MMAP_SIZE', 256 * 1024 * 1024),
+    ('cache_size', 'SQLITE_CACHE_SIZE', -64 * 1024),
+    ('busy_timeout', 'SQLITE_BUSY_TIMEOUT', 5000),
+    ('temp_store', 'SQLITE_TEMP_STORE', 'MEMORY'),
+    ('foreign_keys', 'SQLITE_FOREIGN_KEYS', 'ON')
+)
+"""Pragmas set on every SQLite connection, the config keys and defaults"""
+
+SQLITE_UNITS = {
+    'day': 'start of day',
+    'month': 'start of month',
+    'year': 'start of year'
+}
+"""The SQLite date modifiers matching date_trunc's units"""
+
+
+def is_sqlite(uri):
+    return uri is not None and uri.startswith('sqlite')
+
+def is_memory_sqlite(uri):
+    return uri in ('sqlite://', 'sqlite:///:memory:')
+
+def apply_sqlite_options(config):
+    """
+    Pools connections to a SQLite database file like any other database, a
+    connection checked in by one thread is handed to the next thread that asks
+    for one, SQLITE_POOL_SIZE idle connections are kept
+    """
+    uri = config.get('SQLALCHEMY_DATABASE_URI')
+    if not is_sqlite(uri) or is_memory_sqlite(uri):
+        return
+    engine_options = dict(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    # SQLite has no server side connection limit to queue for, a thread that
+    # finds the pool empty opens an overflow connection instead of waiting
+    engine_options.pop('pool_timeout', None)
+    engine_options['max_overflow'] = -1
+    engine_options.setdefault('poolclass', QueuePool)
+    engine_options.setdefault('pool_size', config.get('SQLITE_POOL_SIZE', 32))
+    # the pool hands a connection to one thread at a time, so sqlite3's check
+    # that a connection stays on the thread that opened it can be turned off
+    connect_args = dict(engine_options.get('connect_args') or {})
+    connect_args.setdefault('check_same_thread', False)
+    engine_options['connect_args'] = connect_args
+    config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options
+
+
+class SqlitePragmas(object):
+    """
+    Sets the SQLITE_PRAGMAS on each new connection to a SQLite database: write
+    ahead logging, memory-mapped reads, a larger page cache and enforced
+    foreign keys
+    """
+    def __init__(self):
+        self.pragmas = []
+
+    def init_app(self, app, db):
+        self.pragmas = [
+            (pragma, app.config.get(key, default))
+            for pragma, key, default in SQLITE_PRAGMAS
+            if app.config.get(key, default) is not None
+        ]
+        if not is_sqlite(app.config.get('SQLALCHEMY_DATABASE_URI')):
+            return
+        event.listen(db.get_engine(app), 'connect', self.connect)
+
+    def connect(self, dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma, value in self.pragmas:
+                cursor.execute('PRAGMA %s = %s' % (pragma, value))
+        finally:
+            cursor.close()
+
+
+class date_trunc(FunctionElement):
+    """
+    Truncates a timestamp to the start of its day, month or year, date_trunc on
+    postgres and the equivalent datetime modifier elsewhere
+    """
+    type = DateTime()
+    name = 'date_trunc'
+
+    def __init__(self, unit, expression):
+        if unit not in SQLITE_UNITS:
+            raise ValueError('Unknown date_trunc unit %s' % unit)
+        self.unit = unit
+        super(date_trunc, self).__init__(expression)
+
+
+@compiles(date_trunc)
+def compile_date_trunc(element, compiler, **kw):
+    return compiler.process(
+        func.date_trunc(element.unit, *element.clauses.clauses), **kw)
+
+@compiles(date_trunc, 'sqlite')
+def compile_sqlite_date_trunc(element, compiler, **kw):
+    return compiler.process(
+        func.datetime(*element.clauses.clauses,
+                      literal_column("'%s'" % SQLITE_UNITS[element.unit])),
+        **kw)
@@ -0,0 +1,135 @@
+from collections import OrderedDict
+import threading
+
+
+class LedgerCache(object):
+    """
+    A process-wide least recently used cache of user ledgers bounded by the
+    approximate number of bytes the cached ledgers use.
+
+    Every entry records the user's data version it was loaded at and is only
+    returned for that same version, so a write committed by any process makes
+    the entry unreachable even before it is invalidated here.
+
+    Invalidations are numbered and the number of each user's latest one is
+    kept for the max_invalidations most recently invalidated users, a put
+    started before the oldest forgotten invalidation is ignored.
+    """
+    def __init__(self, max_bytes=64 * 1024 * 1024, max_invalidations=4096):
+        self.max_bytes = max_bytes
+        self.max_invalidations = max_invalidations
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.generations = OrderedDict()
+        self.generation_counter = 0
+        self.oldest_generation = 0
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def init_app(self, app):
+        self.max_bytes = app.config.get('LEDGER_CACHE_MAX_BYTES',
+                                        self.max_bytes)
+        self.clear()
+
+    def get(self, user_id, data_version):
+        """
+        Returns the cached ledger for the user at data_version or None
+
+        Keyword arguments:
+        user_id -- the id of the ledger's user
+        data_version -- the user's current data version
+        """
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is not None and entry[0] == data_version:
+                self.entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def generation(self, user_id):
+        """
+        Returns a token to pass to put, if the user's ledger is invalidated in
+        between the put is ignored
+        """
+        with self.lock:
+            return self.generation_counter
+
+    def put(self, user_id, data_version, ledger, generation):
+        """
+        Caches the ledger loaded at data_version, evicting the least recently
+        used ledgers until the cache fits in max_bytes
+
+        Keyword arguments:
+        user_id -- the id of the ledger's user
+        data_version -- the user's data version read before loading the ledger
+        ledger -- the loaded Ledger
+        generation -- the value of generation(user_id) before loading
+        """
+        nbytes = ledger.nbytes()
+        if nbytes > self.max_bytes:
+            return
+        with self.lock:
+            if generation < self.oldest_generation or \
+                    self.generations.get(user_id, 0) > generation:
+                return
+            self.remove(user_id)
+            self.entries[user_id] = (data_version, ledger, nbytes)
+            self.total_bytes += nbytes
+            while self.total_bytes > self.max_bytes:
+                evicted_user_id = next(iter(self.entries))
+                self.remove(evicted_user_id)
+                self.evictions += 1
+
+    def invalidate(self, user_id):
+        """
+        Drops the user's ledger, called whenever the user's data changes
+        """
+        with self.lock:
+            self.generation_counter += 1
+            self.generations[user_id] = self.generation_counter
+            self.generations.move_to_end(user_id)
+            while len(self.generations) > self.max_invalidations:
+                _, forgotten = self.generations.popitem(last=False)
+                self.oldest_generation = forgotten
+            if self.remove(user_id):
+                self.invalidations += 1
+
+    def remove(self, user_id):
+        entry = self.entries.pop(user_id, None)
+        if entry is None:
+            return False
+        self.total_bytes -= entry[2]
+        return True
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.generations.clear()
+            self.oldest_generation = self.generation_counter
+            self.total_bytes = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+            self.invalidations = 0
+
+    def stats(self):
+        """
+        Returns a dict with the cache's counters, size and hit rate
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return dict(
+                hits = self.hits,
+                misses = self.misses,
+                evictions = self.evictions,
+                invalidations = self.invalidations,
+                hit_rate = float(self.hits) / lookups if lookups > 0 else 0.0,
+                entries = len(self.entries),
+                bytes = self.total_bytes,
+                max_bytes = self.max_bytes
+            )
@@ -0,0 +1,288 @@
+from functools import wraps
+from bisect import bisect_left
+import atexit
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+                   2.5, 5.0, 10.0)
+"""Upper bounds in seconds of the histogram buckets"""
+
+GENERATOR_DURATION = 'portfolio_generator_duration_seconds'
+IMPORT_DURATION = 'portfolio_import_duration_seconds'
+IMPORTED_ROWS = 'portfolio_imported_transactions_total'
+
+
+class Metrics(object):
+    """
+    Counters, gauges and histograms rendered in the Prometheus text format.
+    Every thread records into its own shard so recording never takes a lock,
+    shards are only summed when the metrics are scraped. With METRICS_DIR set
+    each process also writes its totals to a file in the directory and a
+    scrape of any process merges the files of all of them.
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.shards = []
+        self.gauges = {}
+        self.collectors = []
+        self.descriptions = {}
+        self.directory = None
+        self.name = None
+        self.flush_interval = 5
+        self.last_flush = 0
+        self.exit_registered = False
+
+    def init_app(self, app):
+        self.directory = app.config.get('METRICS_DIR')
+        self.flush_interval = app.config.get('METRICS_FLUSH_INTERVAL',
+                                             self.flush_interval)
+        with self.lock:
+            for shard in self.shards:
+                shard.clear()
+        self.gauges.clear()
+        if self.directory is not None:
+            os.makedirs(self.directory, exist_ok=True)
+            if not self.exit_registered:
+                atexit.register(self.flush)
+                self.exit_registered = True
+
+    def describe(self, name, metric_type, description):
+        self.descriptions[name] = (metric_type, description)
+
+    def add_collector(self, collector):
+        """
+        Registers a function called on every scrape that returns a list of
+        (name, labels, value) samples, for values that are cheaper to read
+        than to track such as cache statistics
+        """
+        self.collectors.append(collector)
+
+    def shard(self):
+        shard = getattr(self.local, 'shard', None)
+        if shard is None:
+            shard = {}
+            with self.lock:
+                self.shards.append(shard)
+            self.local.shard = shard
+        return shard
+
+    def inc(self, name, labels=(), amount=1):
+        """
+        Adds amount to a counter
+
+        Keyword arguments:
+        name -- the metric's name
+        labels -- tuple of (label name, value) pairs
+        amount -- added to the counter
+        """
+        shard = self.shard()
+        key = (name, labels)
+        shard[key] = shard.get(key, 0) + amount
+
+    def observe(self, name, value, labels=()):
+        """
+        Records value, usually a duration in seconds, in a histogram
+        """
+        shard = self.shard()
+        key = (name, labels)
+        counts = shard.get(key)
+        if counts is None:
+            counts = [0] * (len(self.buckets) + 2)
+            shard[key] = counts
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def set(self, name, value, labels=()):
+        """
+        Sets a gauge, gauges of different running processes are summed
+        """
+        self.gauges[(name, labels)] = value
+
+    def timer(self, name, labels=()):
+        """
+        Decorates a function so each call's duration is observed in the
+        histogram
+        """
+        def decorator(function):
+            @wraps(function)
+            def timed(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.observe(name, time.perf_counter() - start, labels)
+            return timed
+        return decorator
+
+    def snapshot(self):
+        """
+        Returns this process's counters and histograms summed over every
+        thread, followed by its gauges and collected samples
+        """
+        with self.lock:
+            shards = list(self.shards)
+        values = {}
+        for shard in shards:
+            for key, value in shard.copy().items():
+                merge_value(values, key, value)
+        samples = list(self.gauges.items())
+        for collector in self.collectors:
+            for name, labels, value in collector():
+                samples.append(((name, labels), value))
+        for key, value in samples:
+            merge_value(values, key, value)
+        return values
+
+    def flush(self):
+        """
+        Writes this process's snapshot to the metrics directory
+        """
+        if self.directory is None:
+            return
+        self.last_flush = time.time()
+        values = [[name, [list(label) for label in labels], value]
+                  for (name, labels), value in self.snapshot().items()]
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as temp_file:
+                json.dump(values, temp_file)
+            os.replace(temp_path, self.process_path())
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def maybe_flush(self):
+        if self.directory is not None and \
+                time.time() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def process_path(self):
+        """
+        Processes are identified by pid unless they are named, a named process
+        such as the price fetch replaces the file of its previous run
+        """
+        name = self.name if self.name is not None else str(os.getpid())
+        return os.path.join(self.directory, 'metrics-%s.json' % name)
+
+    def collect(self):
+        """
+        Returns the values of every process sharing the metrics directory, or
+        of this process only if there is none. The counters and histograms of
+        a process that has exited still count, its gauges no longer do.
+        """
+        if self.directory is None:
+            return self.snapshot()
+        self.flush()
+        values = {}
+        for path in glob.glob(os.path.join(self.directory, 'metrics-*.json')):
+            try:
+                with open(path) as metrics_file:
+                    process_values = json.load(metrics_file)
+            except (OSError, ValueError):
+                continue
+            name = os.path.basename(path)[len('metrics-'):-len('.json')]
+            alive = process_alive(name)
+            for name, labels, value in process_values:
+                if not alive and self.is_gauge(name):
+                    continue
+                key = (name, tuple(tuple(label) for label in labels))
+                merge_value(values, key, value)
+        return values
+
+    def is_gauge(self, name):
+        return self.descriptions.get(name, ('untyped',))[0] == 'gauge'
+
+    def render(self, extra_samples=()):
+        """
+        Returns the collected metrics in the Prometheus text format
+
+        Keyword arguments:
+        extra_samples -- (name, labels, value) gauges read once by the
+                         scraping process
+        """
+        values = self.collect()
+        for name, labels, value in extra_samples:
+            values[(name, labels)] = value
+        lines = []
+        for name in sorted(set(key[0] for key in values)):
+            metric_type, description = self.descriptions.get(
+                name, ('untyped', name)
+            )
+            lines.append('# HELP %s %s' % (name, description))
+            lines.append('# TYPE %s %s' % (name, metric_type))
+            keys = sorted(key for key in values if key[0] == name)
+            for key in keys:
+                labels = key[1]
+                value = values[key]
+                if isinstance(value, list):
+                    lines.extend(self.render_histogram(name, labels, value))
+                else:
+                    lines.append('%s%s %s' % (name,
+                                              format_labels(labels),
+                                              format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+    def render_histogram(self, name, labels, counts):
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), counts):
+            cumulative += count
+            le = bound if bound == '+Inf' else format_value(bound)
+            yield '%s_bucket%s %s' % (name,
+                                      format_labels(labels + (('le', le),)),
+                                      cumulative)
+        yield '%s_sum%s %s' % (name, format_labels(labels),
+                               format_value(counts[-1]))
+        yield '%s_count%s %s' % (name, format_labels(labels), cumulative)
+
+
+def process_alive(name):
+    """
+    Returns whether the process that wrote the metrics file with this name is
+    still running, named processes are assumed to be
+
+    Keyword arguments:
+    name -- the pid or name in the metrics file's name
+    """
+    if not name.isdigit():
+        return True
+    try:
+        os.kill(int(name), 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+def merge_value(values, key, value):
+    current = values.get(key)
+    if current is None:
+        values[key] = list(value) if isinstance(value, list) else value
+    elif isinstance(value, list):
+        for index, count in enumerate(value):
+            current[index] += count
+    else:
+        values[key] = current + value
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join(
+        '%s="%s"' % (name, str(value).replace('\\', '\\\\')
+                                     .replace('"', '\\"')
+                                     .replace('\n', '\\n'))
+        for name, value in labels
+    )
+
+def format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(int(value))
@@ -0,0 +1,125 @@
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from werkzeug.security import generate_password_hash, check_password_hash
+import threading
+
+
+class PasswordHasherBusy(Exception):
+    """
+    Raised when the password hashing queue is full and the request should be
+    rejected instead of waiting
+    """
+    pass
+
+
+class PasswordHasher(object):
+    """
+    Runs password hashing and verification on a dedicated, bounded thread pool
+    so a burst of logins cannot occupy every request thread. When more than
+    max_workers + max_queue hashes are pending new ones fail fast with
+    PasswordHasherBusy. The method and salt length default to werkzeug's own.
+    """
+    def __init__(self,
+                 method=None,
+                 salt_length=None,
+                 max_workers=2,
+                 max_queue=16,
+                 timeout=10):
+        self.method = method
+        self.salt_length = salt_length
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.executor = None
+        self.slots = None
+        self.target = None
+
+    def init_app(self, app):
+        self.method = app.config.get('PASSWORD_HASH_METHOD', self.method)
+        self.salt_length = app.config.get('PASSWORD_SALT_LENGTH',
+                                          self.salt_length)
+        self.max_workers = app.config.get('PASSWORD_HASH_WORKERS',
+                                          self.max_workers)
+        self.max_queue = app.config.get('PASSWORD_HASH_QUEUE_SIZE',
+                                        self.max_queue)
+        self.timeout = app.config.get('PASSWORD_HASH_TIMEOUT', self.timeout)
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix='password-hasher'
+        )
+        self.slots = threading.BoundedSemaphore(
+            self.max_workers + self.max_queue
+        )
+        self.target = None
+
+    def hash(self, password):
+        """
+        Returns the hash of the password using the configured method and salt
+        length, werkzeug's defaults for the ones that are not configured
+        """
+        options = {}
+        if self.method is not None:
+            options['method'] = self.method
+        if self.salt_length is not None:
+            options['salt_length'] = self.salt_length
+        return self.run(generate_hash, password, options)
+
+    def verify(self, password_hash, password):
+        """
+        Returns True if the password matches password_hash
+        """
+        return self.run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """
+        Returns True if password_hash is weaker than the hashes made with the
+        configured method, cost and salt length: a shorter salt, fewer pbkdf2
+        iterations of the same digest or a method without a cost. Stronger
+        hashes and hashes of another costed method are kept.
+        """
+        if self.target is None:
+            # werkzeug fills in its defaults, hashing once shows what the
+            # stored method and salt will look like
+            method, salt, _ = self.hash('').split('$')
+            self.target = (method, len(salt))
+        target_method, target_salt_length = self.target
+        parts = password_hash.split('$')
+        if len(parts) != 3:
+            return True
+        method, salt, _ = parts
+        if len(salt) < target_salt_length:
+            return True
+        if method == target_method:
+            return False
+        stored = method.split(':')
+        target = target_method.split(':')
+        if len(stored) == 1:
+            return True
+        if stored[0] == target[0] == 'pbkdf2' and stored[1] == target[1] \
+                and len(stored) == len(target) == 3:
+            try:
+                return int(stored[2]) < int(target[2])
+            except ValueError:
+                return True
+        return False
+
+    def run(self, fn, *args):
+        if self.executor is None:
+            return fn(*args)
+        if not self.slots.acquire(blocking=False):
+            raise PasswordHasherBusy()
+        try:
+            future = self.executor.submit(fn, *args)
+        except Exception:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda f: self.slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            raise PasswordHasherBusy()
+
+
+def generate_hash(password, options):
+    return generate_password_hash(password, **options)
@@ -0,0 +1,154 @@
+import mmap
+import os
+import struct
+import tempfile
+import threading
+
+
+MAGIC = b'PRCTBL01'
+
+HEADER = struct.Struct('<8sQII')
+"""magic, version, record count, latest as of date ordinal"""
+
+RECORD = struct.Struct('<16sqI4x')
+"""stock symbol, close price in cents, as of date ordinal"""
+
+SYMBOL_SIZE = 16
+
+
+class PriceSnapshot(object):
+    """
+    A read-only view of one price table file, records are read straight out
+    of the memory map and looked up by binary search on the sorted symbols.
+    Only prices on the table's latest date are returned, matching the prices
+    the market value has always been computed with.
+    """
+    __slots__ = ('buffer', 'version', 'count', 'latest_date')
+
+    def __init__(self, buffer):
+        magic, version, count, latest_date = HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            raise ValueError('Not a price table')
+        self.buffer = buffer
+        self.version = version
+        self.count = count
+        self.latest_date = latest_date
+
+    def __len__(self):
+        return self.count
+
+    def record(self, index):
+        return RECORD.unpack_from(self.buffer,
+                                  HEADER.size + index * RECORD.size)
+
+    def get(self, stock_symbol, default=None):
+        """
+        Returns the stock's close price in cents on the latest price date
+
+        Keyword arguments:
+        stock_symbol -- the stock's ticker symbol
+        default -- returned if the stock has no price on the latest date
+        """
+        key = encode_symbol(stock_symbol)
+        if key is None:
+            return default
+        low = 0
+        high = self.count
+        while low < high:
+            middle = (low + high) // 2
+            symbol, close_price, as_of = self.record(middle)
+            if symbol < key:
+                low = middle + 1
+            elif symbol > key:
+                high = middle
+            elif as_of == self.latest_date:
+                return close_price
+            else:
+                return default
+        return default
+
+
+class PriceTable(object):
+    """
+    A file of fixed size latest price records shared by every worker process.
+    The fetch pipeline writes a complete new file and renames it over the old
+    one, readers map the file and remap it when it is replaced.
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self.lock = threading.Lock()
+        self.current = None
+        self.current_stat = None
+
+    def init_app(self, app):
+        with self.lock:
+            self.path = app.config.get('PRICE_TABLE_PATH')
+            self.current = None
+            self.current_stat = None
+
+    def snapshot(self):
+        """
+        Returns the PriceSnapshot of the newest table file or None if there is
+        no table
+        """
+        if self.path is None:
+            return None
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        file_id = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        with self.lock:
+            if self.current_stat != file_id:
+                self.current = self.map()
+                self.current_stat = file_id
+            return self.current
+
+    def map(self):
+        with open(self.path, 'rb') as table_file:
+            buffer = mmap.mmap(table_file.fileno(), 0, access=mmap.ACCESS_READ)
+        return PriceSnapshot(buffer)
+
+    def write(self, prices, version):
+        """
+        Atomically replaces the table with the prices
+
+        Keyword arguments:
+        prices -- iterable of (stock symbol, close price in cents, as of date)
+        version -- stored in the header, identifies this set of prices
+        """
+        records = []
+        for stock_symbol, close_price, as_of in prices:
+            key = encode_symbol(stock_symbol)
+            if key is not None:
+                records.append((key, close_price, as_of.toordinal()))
+        records.sort()
+        latest_date = max([record[2] for record in records], default=0)
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as table_file:
+                table_file.write(
+                    HEADER.pack(MAGIC, version, len(records), latest_date)
+                )
+                for record in records:
+                    table_file.write(RECORD.pack(*record))
+                table_file.flush()
+                os.fsync(table_file.fileno())
+            os.replace(temp_path, self.path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+
+def encode_symbol(stock_symbol):
+    """
+    Returns the symbol as the null padded bytes stored in a record or None if
+    it does not fit
+    """
+    key = stock_symbol.encode('utf-8')
+    if len(key) > SYMBOL_SIZE:
+        return None
+    return key.ljust(SYMBOL_SIZE, b'\0')
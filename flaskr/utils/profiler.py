@@ -0,0 +1,100 @@
+from datetime import datetime
+from flask import g, request
+from flask_login import current_user
+import cProfile
+import os
+import re
+import tracemalloc
+
+
+class Profile(object):
+    """
+    A running cProfile capture and, if memory is True, tracemalloc capture
+    """
+    def __init__(self, memory=False):
+        self.profile = cProfile.Profile()
+        self.memory = memory and not tracemalloc.is_tracing()
+        if self.memory:
+            tracemalloc.start()
+        self.profile.enable()
+
+    def finish(self, directory, name, top=25):
+        """
+        Stops the captures and saves them to the directory, returns the path
+        of the cProfile stats file
+        """
+        self.profile.disable()
+        os.makedirs(directory, exist_ok=True)
+        base_name = '%s-%s' % (datetime.utcnow().strftime('%Y%m%dT%H%M%S%f'),
+                               re.sub(r'[^A-Za-z0-9_.-]+', '_', name))
+        path = os.path.join(directory, base_name + '.prof')
+        self.profile.dump_stats(path)
+        if self.memory:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            with open(os.path.join(directory, base_name + '.mem.txt'),
+                      'w') as memory_file:
+                memory_file.write('peak %d bytes\n' % peak)
+                for stat in snapshot.statistics('lineno')[:top]:
+                    memory_file.write('%s\n' % stat)
+        return path
+
+
+class RequestProfiler(object):
+    """
+    Profiles single requests when PROFILING is set and a user listed in
+    PROFILE_ADMIN_EMAILS sends an "X-Profile" header or "_profile" query
+    argument. The value "memory" also traces allocations. Captures are saved
+    to PROFILE_DIR and the file is named in the X-Profile-File header.
+    """
+    def __init__(self):
+        self.directory = None
+        self.admin_emails = frozenset()
+
+    def init_app(self, app):
+        self.directory = app.config.get(
+            'PROFILE_DIR',
+            os.path.join(app.instance_path, 'profiles')
+        )
+        self.admin_emails = frozenset(app.config.get('PROFILE_ADMIN_EMAILS',
+                                                     []))
+        if not app.config.get('PROFILING', False):
+            return
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+        app.teardown_request(self.teardown_request)
+
+    def requested_mode(self):
+        return request.headers.get('X-Profile') or \
+            request.args.get('_profile')
+
+    def is_admin(self):
+        if not current_user.is_authenticated:
+            return False
+        email = getattr(current_user, 'email', None)
+        if email is None:
+            from flaskr.model import User
+            user = User.query.get(current_user.id)
+            email = user.email if user is not None else None
+        return email in self.admin_emails
+
+    def start_request(self):
+        mode = self.requested_mode()
+        if mode is None or not self.is_admin():
+            return
+        g.profile = Profile(memory=mode == 'memory')
+
+    def finish_request(self, response):
+        profile = g.pop('profile', None)
+        if profile is not None:
+            path = profile.finish(self.directory, '%s-%s' % (
+                request.endpoint, current_user.id))
+            response.headers['X-Profile-File'] = os.path.basename(path)
+        return response
+
+    def teardown_request(self, exception=None):
+        profile = g.pop('profile', None)
+        if profile is not None:
+            profile.finish(self.directory, '%s-%s-error' % (
+                request.endpoint, current_user.id))
@@ -0,0 +1,149 @@
+from datetime import datetime, timedelta
+from flask import g, has_request_context, request
+from flask_login import current_user
+from sqlalchemy import create_engine
+import itertools
+import logging
+import threading
+import time
+
+
+READ_METHODS = frozenset(['GET', 'HEAD'])
+"""Request methods that are routed to the replicas"""
+
+
+class ReplicaRouter(object):
+    """
+    Picks a replica for each GET request round-robin, skipping replicas that
+    failed to connect for REPLICA_RETRY_SECONDS and falling back to the
+    primary when none is up. For REPLICA_READ_YOUR_WRITES_SECONDS after a user
+    wrote, their reads only go to a replica that already has the data version
+    of the write. The time of the write is kept on the user's row in the
+    primary, so every process and every client, cookie or api token, sees it.
+    """
+    def __init__(self):
+        self.db = None
+        self.engines = []
+        self.primary_endpoints = frozenset()
+        self.write_window = 10
+        self.retry_after = 30
+        self.lock = threading.Lock()
+        self.counter = itertools.count()
+        self.down_until = {}
+
+    def init_app(self, app, db):
+        self.db = db
+        for engine in self.engines:
+            engine.dispose()
+        engine_options = app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {}
+        self.engines = [
+            create_engine(uri, **engine_options)
+            for uri in app.config.get('SQLALCHEMY_REPLICA_URIS') or []
+        ]
+        self.primary_endpoints = frozenset(
+            app.config.get('REPLICA_PRIMARY_ENDPOINTS', []))
+        self.write_window = app.config.get('REPLICA_READ_YOUR_WRITES_SECONDS',
+                                           10)
+        self.retry_after = app.config.get('REPLICA_RETRY_SECONDS', 30)
+        with self.lock:
+            self.down_until.clear()
+        if len(self.engines) == 0:
+            return
+        app.extensions['replica_router'] = self
+        app.teardown_request(self.teardown_request)
+
+    def read_engine(self):
+        """
+        Returns the replica engine the current request reads from, None if it
+        uses the primary
+        """
+        if not has_request_context():
+            return None
+        if 'replica_engine' in g:
+            return g.replica_engine
+        # queries made while choosing, like loading the user, use the primary
+        g.replica_engine = None
+        if request.method in READ_METHODS and \
+                request.endpoint not in self.primary_endpoints:
+            user_id = current_user_id()
+            g.replica_engine = self.choose(user_id,
+                                           self.required_version(user_id))
+        return g.replica_engine
+
+    def choose(self, user_id, min_version=-1):
+        """
+        Returns the next replica engine that is up and has at least min_version
+        of the user's data. None if no replica qualifies.
+
+        Keyword arguments:
+        user_id -- the id of the user reading
+        min_version -- the data version the replica needs, -1 for any
+        """
+        start = next(self.counter)
+        check_version = user_id is not None and min_version >= 0
+        for offset in range(len(self.engines)):
+            index = (start + offset) % len(self.engines)
+            if self.is_down(index):
+                continue
+            engine = self.engines[index]
+            try:
+                if not check_version:
+                    engine.connect().close()
+                    return engine
+                if data_version(engine, user_id) >= min_version:
+                    return engine
+            except Exception as e:
+                logging.warning("Replica %d is unavailable: %s", index, e)
+                with self.lock:
+                    self.down_until[index] = time.monotonic() + \
+                        self.retry_after
+        return None
+
+    def is_down(self, index):
+        with self.lock:
+            until = self.down_until.get(index)
+            if until is None:
+                return False
+            if until <= time.monotonic():
+                del self.down_until[index]
+                return False
+            return True
+
+    def required_version(self, user_id):
+        """
+        Returns the user's data version if they wrote within
+        REPLICA_READ_YOUR_WRITES_SECONDS, -1 if any replica will do
+        """
+        if user_id is None:
+            return -1
+        from flaskr.model import User
+        row = self.db.engine.execute(
+            User.__table__.select()
+                .with_only_columns([User.data_version, User.data_written_at])
+                .where(User.id == user_id)
+        ).first()
+        if row is None or row[1] is None or row[1] <= \
+                datetime.utcnow() - timedelta(seconds=self.write_window):
+            return -1
+        return row[0]
+
+    def teardown_request(self, exception=None):
+        g.pop('replica_engine', None)
+
+
+def current_user_id():
+    user_id = current_user.get_id()
+    return int(user_id) if user_id is not None else None
+
+def data_version(engine, user_id):
+    """
+    Returns the user's data version in the engine's database, -1 if the user
+    is not there yet
+    """
+    from flaskr.model import User
+    version = engine.execute(
+        User.__table__.select()
+            .with_only_columns([User.data_version])
+            .where(User.id == user_id)
+    ).scalar()
+    return version if version is not None else -1
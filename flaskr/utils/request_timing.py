@@ -0,0 +1,123 @@
+from flask import g, has_app_context, request
+from flaskr.utils.database import app_engines
+from sqlalchemy import event
+import logging
+import time
+
+
+class RequestTimer(object):
+    """
+    The statements and time spent on the database and serializing JSON during
+    one request
+    """
+    __slots__ = ('start', 'statements', 'db_time', 'serialize_time', 'log')
+
+    def __init__(self, keep_statements):
+        self.start = time.perf_counter()
+        self.statements = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self.log = [] if keep_statements else None
+
+    def record_statement(self, statement, elapsed):
+        self.statements += 1
+        self.db_time += elapsed
+        if self.log is not None:
+            self.log.append((statement, elapsed))
+
+
+class RequestTiming(object):
+    """
+    Adds a Server-Timing header with the database, serialization and total
+    time of each request and optionally logs slow requests with their
+    statements. Nothing is hooked unless REQUEST_TIMING is set.
+    """
+    def __init__(self):
+        self.slow_threshold = None
+
+    def init_app(self, app, db):
+        if not app.config.get('REQUEST_TIMING', False):
+            return
+        self.slow_threshold = app.config.get('REQUEST_TIMING_SLOW_MS')
+        for _, engine in app_engines(app, db):
+            event.listen(engine, 'before_cursor_execute',
+                         self.before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute',
+                         self.after_cursor_execute)
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+        app.teardown_request(self.teardown_request)
+        app.json_encoder = timed_encoder(app.json_encoder)
+
+    def start_request(self):
+        g.request_timer = RequestTimer(self.slow_threshold is not None)
+
+    def finish_request(self, response):
+        timer = g.get('request_timer')
+        if timer is None:
+            return response
+        total = (time.perf_counter() - timer.start) * 1000
+        response.headers.add('Server-Timing', format_server_timing(
+            timer.db_time * 1000,
+            timer.statements,
+            timer.serialize_time * 1000,
+            total
+        ))
+        if self.slow_threshold is not None and total >= self.slow_threshold:
+            log_slow_request(timer, total)
+        return response
+
+    def teardown_request(self, exception=None):
+        g.pop('request_timer', None)
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters,
+                              context, executemany):
+        conn.info.setdefault('query_start_time', []) \
+            .append(time.perf_counter())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters,
+                             context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_start_time'].pop()
+        timer = current_timer()
+        if timer is not None:
+            timer.record_statement(statement, elapsed)
+
+
+def current_timer():
+    """
+    Returns the RequestTimer of the current request or None outside of a timed
+    request
+    """
+    if not has_app_context():
+        return None
+    return g.get('request_timer')
+
+def timed_encoder(encoder_class):
+    """
+    Returns a subclass of the JSON encoder that adds the time spent encoding
+    to the current request's timer
+    """
+    class TimedJSONEncoder(encoder_class):
+        def encode(self, o):
+            start = time.perf_counter()
+            try:
+                return super(TimedJSONEncoder, self).encode(o)
+            finally:
+                timer = current_timer()
+                if timer is not None:
+                    timer.serialize_time += time.perf_counter() - start
+    return TimedJSONEncoder
+
+def format_server_timing(db_ms, statements, serialize_ms, total_ms):
+    return 'db;dur=%.2f;desc="%d statements", serialize;dur=%.2f, ' \
+        'total;dur=%.2f' % (db_ms, statements, serialize_ms, total_ms)
+
+def log_slow_request(timer, total):
+    logging.warning("Slow request %s %s took %.2fms, %d statements %.2fms",
+                    request.method,
+                    request.full_path,
+                    total,
+                    timer.statements,
+                    timer.db_time * 1000)
+    for statement, elapsed in timer.log:
+        logging.warning("%.2fms %s", elapsed * 1000, statement)
@@ -0,0 +1,208 @@
+from collections import OrderedDict
+from flask import current_app, make_response
+from functools import wraps
+import hashlib
+import os
+import tempfile
+import threading
+
+
+def is_null_body(payload):
+    """
+    Returns whether payload is the JSON null the views answer with when they
+    fail, with a 200 status
+
+    Keyword arguments:
+    payload -- response body as bytes
+    """
+    return payload.strip() == b'null'
+
+
+class LocalBackend(object):
+    """
+    Keeps cached responses in this process in least recently used order
+    """
+    shared = False
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            payload = self.entries.get(key)
+            if payload is not None:
+                self.entries.move_to_end(key)
+            return payload
+
+    def set(self, key, payload):
+        with self.lock:
+            self.entries[key] = payload
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class FileSystemBackend(object):
+    """
+    Keeps cached responses as files in a directory that every worker process
+    of the deployment shares. Files are written to a temporary name and renamed
+    into place so readers never see a partial response.
+    """
+    shared = True
+    PRUNE_INTERVAL = 64
+    """How many sets happen between checks of the number of cached files"""
+
+    def __init__(self, directory, max_entries=1024):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.sets = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(
+            self.directory,
+            hashlib.sha1(key.encode('utf-8')).hexdigest()
+        )
+
+    def get(self, key):
+        try:
+            with open(self.path(key), 'rb') as cache_file:
+                return cache_file.read()
+        except OSError:
+            return None
+
+    def set(self, key, payload):
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as temp_file:
+                temp_file.write(payload)
+            os.replace(temp_path, self.path(key))
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        self.sets += 1
+        if self.sets % self.PRUNE_INTERVAL == 0:
+            self.prune()
+
+    def prune(self):
+        """
+        Removes the oldest files once there are more than max_entries
+        """
+        paths = [
+            entry.path for entry in os.scandir(self.directory)
+            if not entry.name.endswith('.tmp')
+        ]
+        if len(paths) <= self.max_entries:
+            return
+        paths.sort(key=lambda path: os.stat(path).st_mtime)
+        for path in paths[:len(paths) - self.max_entries]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def clear(self):
+        for entry in os.scandir(self.directory):
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+
+class ResponseCache(object):
+    """
+    Caches the json bodies of views whose output only depends on the inputs
+    named by a key function, the key function must include every version the
+    response depends on so writes make old entries unreachable
+    """
+    def __init__(self):
+        self.backend = None
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, app):
+        backend = app.config.get('RESPONSE_CACHE_BACKEND', 'local')
+        max_entries = app.config.get('RESPONSE_CACHE_SIZE', 1024)
+        if backend == 'local':
+            self.backend = LocalBackend(max_entries)
+        elif backend == 'filesystem':
+            self.backend = FileSystemBackend(
+                app.config['RESPONSE_CACHE_DIR'],
+                max_entries
+            )
+        else:
+            self.backend = None
+        with self.lock:
+            self.hits = 0
+            self.misses = 0
+
+    def cached(self, key_function):
+        """
+        Decorates a view so its response is stored in the backend under the
+        key returned by key_function and served from there while the key
+        stays the same
+
+        Keyword arguments:
+        key_function -- called during the request, returns a string key
+        """
+        def decorator(view):
+            @wraps(view)
+            def cached_view(*args, **kwargs):
+                if self.backend is None:
+                    return view(*args, **kwargs)
+                key = key_function()
+                payload = self.backend.get(key)
+                if payload is not None:
+                    self.count(hit=True)
+                    return current_app.response_class(
+                        payload,
+                        mimetype='application/json'
+                    )
+                self.count(hit=False)
+                response = make_response(view(*args, **kwargs))
+                if response.status_code == 200 and \
+                        not is_null_body(response.get_data()):
+                    self.backend.set(key, response.get_data())
+                return response
+            return cached_view
+        return decorator
+
+    def count(self, hit):
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def clear(self):
+        if self.backend is not None:
+            self.backend.clear()
+
+    def clear_shared(self):
+        """
+        Clears the cache if its backend is shared by every worker process, for
+        commands that run in their own process. Clearing a local backend there
+        would only empty the command's own copy, the workers' entries become
+        unreachable through the versions in their keys instead.
+        """
+        if self.backend is not None and self.backend.shared:
+            self.backend.clear()
+
+    def stats(self):
+        """
+        Returns a dict with the hit and miss counters and the hit rate
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return dict(
+                hits = self.hits,
+                misses = self.misses,
+                hit_rate = float(self.hits) / lookups if lookups > 0 else 0.0
+            )
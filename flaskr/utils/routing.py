@@ -0,0 +1,39 @@
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import orm
+from sqlalchemy.sql.dml import UpdateBase
+
+
+class RoutingSession(SignallingSession):
+    """
+    A session that sends statements on the sharded tables to the user's shard
+    and the statements of read-only requests to the replica the app's
+    ReplicaRouter picked for the request
+    """
+    def get_bind(self, mapper=None, clause=None):
+        if not has_bind_key(mapper):
+            writing = self._flushing or isinstance(clause, UpdateBase)
+            shards = self.app.extensions.get('shard_router')
+            if shards is not None:
+                engine = shards.route(mapper, clause, writing)
+                if engine is not None:
+                    return engine
+            replicas = self.app.extensions.get('replica_router')
+            if replicas is not None and not writing:
+                engine = replicas.read_engine()
+                if engine is not None:
+                    return engine
+        return SignallingSession.get_bind(self, mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """
+    Flask-SQLAlchemy with sessions that route to shards and replicas
+    """
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+def has_bind_key(mapper):
+    if mapper is None:
+        return False
+    return mapper.persist_selectable.info.get('bind_key') is not None
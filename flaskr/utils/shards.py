@@ -0,0 +1,193 @@
+from contextlib import contextmanager
+from flask import has_request_context, jsonify, request
+from flask_login import current_user
+from sqlalchemy import create_engine
+from sqlalchemy.sql.util import find_tables
+import threading
+import time
+
+
+DEFAULT_SHARD = 'default'
+"""The shard of users without an entry in the shard map, the main database"""
+
+READ_METHODS = frozenset(['GET', 'HEAD'])
+"""Request methods that never write a user's data"""
+
+SHARDED_TABLES = frozenset([
+    'holding_snapshot',
+    'holding_snapshot_state',
+    'investment_account',
+    'stock_transaction'
+])
+"""Tables whose rows live on the shard of the user they belong to"""
+
+
+class ShardMoving(Exception):
+    """
+    Raised when a user's data is written while it is being moved between
+    shards
+    """
+    def __init__(self, user_id):
+        super(ShardMoving, self).__init__(
+            'User %d is being moved to another shard' % user_id)
+        self.user_id = user_id
+
+
+class ShardEntry(object):
+    __slots__ = ('shard', 'moving_to', 'expires')
+
+    def __init__(self, shard, moving_to, expires):
+        self.shard = shard
+        self.moving_to = moving_to
+        self.expires = expires
+
+
+class ShardRouter(object):
+    """
+    Sends statements on the sharded tables to the shard of the user they are
+    made for, the current user or the one set with for_user. The shard map in
+    the main database's user_shard table is cached for SHARD_MAP_TTL seconds;
+    users without an entry, the reference tables and everything outside a
+    user's scope stay in the main database.
+    """
+    def __init__(self):
+        self.db = None
+        self.engines = {}
+        self.ttl = 30
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.local = threading.local()
+
+    def init_app(self, app, db):
+        self.db = db
+        for engine in self.engines.values():
+            engine.dispose()
+        engine_options = app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {}
+        self.engines = dict(
+            (name, create_engine(uri, **engine_options))
+            for name, uri in (app.config.get('SQLALCHEMY_SHARD_URIS')
+                              or {}).items()
+        )
+        self.ttl = app.config.get('SHARD_MAP_TTL', self.ttl)
+        self.clear()
+        if len(self.engines) == 0:
+            return
+        app.extensions['shard_router'] = self
+        app.register_error_handler(ShardMoving, shard_moving)
+        app.before_request(self.reject_moving_writes)
+
+    def reject_moving_writes(self):
+        """
+        Answers requests that may write with a 503 while the current user is
+        being moved
+        """
+        if request.method in READ_METHODS:
+            return
+        user_id = self.current_user_id()
+        if user_id is not None and self.lookup(user_id).moving_to is not None:
+            raise ShardMoving(user_id)
+
+    def engine(self, shard):
+        """
+        Returns the engine of the shard, the main database's for DEFAULT_SHARD
+        """
+        if shard == DEFAULT_SHARD:
+            return self.db.engine
+        if shard not in self.engines:
+            raise KeyError('Unknown shard %s' % shard)
+        return self.engines[shard]
+
+    def names(self):
+        return [DEFAULT_SHARD] + sorted(self.engines)
+
+    def route(self, mapper, clause, writing):
+        """
+        Returns the shard engine for a statement on a sharded table, None if
+        the statement belongs in the main database
+
+        Keyword arguments:
+        mapper -- the mapper the statement is for, if any
+        clause -- the statement, if any
+        writing -- True if the statement writes
+        """
+        if not is_sharded(mapper, clause):
+            return None
+        user_id = self.current_user_id()
+        if user_id is None:
+            return None
+        entry = self.lookup(user_id)
+        if entry.moving_to is not None and writing:
+            raise ShardMoving(user_id)
+        if entry.shard == DEFAULT_SHARD:
+            return None
+        return self.engine(entry.shard)
+
+    def current_user_id(self):
+        user_id = getattr(self.local, 'user_id', None)
+        if user_id is not None:
+            return user_id
+        if not has_request_context():
+            return None
+        user_id = current_user.get_id()
+        return int(user_id) if user_id is not None else None
+
+    @contextmanager
+    def for_user(self, user_id):
+        """
+        Routes the statements made inside the block to user_id's shard, for
+        work outside of a request
+        """
+        previous = getattr(self.local, 'user_id', None)
+        self.local.user_id = user_id
+        try:
+            yield
+        finally:
+            self.local.user_id = previous
+
+    def lookup(self, user_id):
+        """
+        Returns the user's ShardEntry, from the cache if it is fresh
+        """
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(user_id)
+        if entry is not None and entry.expires > now:
+            return entry
+        from flaskr.model import UserShard
+        row = self.db.engine.execute(
+            UserShard.__table__.select()
+                .with_only_columns([UserShard.shard, UserShard.moving_to])
+                .where(UserShard.user_id == user_id)
+        ).first()
+        if row is None:
+            entry = ShardEntry(DEFAULT_SHARD, None, now + self.ttl)
+        else:
+            entry = ShardEntry(row[0], row[1], now + self.ttl)
+        with self.lock:
+            if len(self.entries) > 4096:
+                self.entries.clear()
+            self.entries[user_id] = entry
+        return entry
+
+    def invalidate(self, user_id):
+        with self.lock:
+            self.entries.pop(user_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+def is_sharded(mapper, clause):
+    if mapper is not None:
+        return mapper.persist_selectable.name in SHARDED_TABLES
+    if clause is None:
+        return False
+    return any(getattr(table, 'name', None) in SHARDED_TABLES
+               for table in find_tables(clause, include_crud=True))
+
+def shard_moving(error):
+    response = jsonify(dict(error = 'shard_moving', message = str(error)))
+    response.status_code = 503
+    response.headers['Retry-After'] = '5'
+    return response
@@ -0,0 +1,132 @@
+from flask import current_app, make_response
+from functools import wraps
+from flaskr.utils.response_cache import is_null_body
+import threading
+
+
+class Call(object):
+    """
+    One in-flight computation that other callers with the same key wait on
+    """
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class UnsharedResponse(Exception):
+    """
+    Carries a response that must not be handed to the waiting callers back to
+    the caller that rendered it
+    """
+    def __init__(self, response):
+        Exception.__init__(self)
+        self.response = response
+        self.owner = threading.current_thread()
+
+
+class SingleFlight(object):
+    """
+    Makes concurrent callers asking for the same key share one computation,
+    the first caller computes the result and the rest wait for it
+    """
+    def __init__(self, timeout=30):
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    def init_app(self, app):
+        self.timeout = app.config.get('SINGLE_FLIGHT_TIMEOUT', self.timeout)
+        with self.lock:
+            self.executions = 0
+            self.coalesced = 0
+
+    def do(self, key, fn):
+        """
+        Returns fn's result, calling fn only if no other thread is already
+        computing key. A waiter that times out computes the result itself.
+
+        Keyword arguments:
+        key -- identifies the computation, callers with equal keys must expect
+               the same result
+        fn -- computes the result, takes no arguments
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            if call is None:
+                call = Call()
+                self.calls[key] = call
+                self.executions += 1
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+
+        if not leader:
+            if not call.done.wait(self.timeout):
+                return fn()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+
+    def coalesced_view(self, key_function):
+        """
+        Decorates a view so concurrent requests with the same key share the
+        body, status and mimetype of one response. A null body is a failed
+        view, so it is returned only to the request that rendered it and the
+        waiting requests render their own.
+
+        Keyword arguments:
+        key_function -- called during the request, returns a hashable key
+        """
+        def decorator(view):
+            @wraps(view)
+            def coalesced_view(*args, **kwargs):
+                def render():
+                    response = make_response(view(*args, **kwargs))
+                    if is_null_body(response.get_data()):
+                        raise UnsharedResponse(response)
+                    return (response.get_data(),
+                            response.status_code,
+                            response.mimetype)
+                try:
+                    payload, status, mimetype = self.do(key_function(), render)
+                except UnsharedResponse as e:
+                    if e.owner is threading.current_thread():
+                        return e.response
+                    return view(*args, **kwargs)
+                return current_app.response_class(payload,
+                                                  status=status,
+                                                  mimetype=mimetype)
+            return coalesced_view
+        return decorator
+
+    def stats(self):
+        """
+        Returns a dict with how many computations ran and how many callers
+        shared another caller's computation
+        """
+        with self.lock:
+            calls = self.executions + self.coalesced
+            return dict(
+                executions = self.executions,
+                coalesced = self.coalesced,
+                in_flight = len(self.calls),
+                coalesced_rate = float(self.coalesced) / calls \
+                    if calls > 0 else 0.0
+            )
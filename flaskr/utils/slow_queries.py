@@ -0,0 +1,152 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from flask import has_request_context, request
+from flaskr.utils.database import app_engines
+from sqlalchemy import event
+import json
+import logging
+import os
+import random
+import threading
+import time
+import traceback
+
+
+class SlowQueryRecorder(object):
+    """
+    Appends statements that take longer than SLOW_QUERY_MS to a JSON lines
+    log with the route that ran them and the shape of their parameters. A
+    sample of slow SELECT statements are re-run with EXPLAIN (ANALYZE, BUFFERS)
+    on a background thread with its own connection to the database that ran
+    them, primary, replica or shard, and the plan is logged with them. Nothing
+    is hooked unless SLOW_QUERY_MS is set.
+    """
+    def __init__(self, max_pending=4):
+        self.threshold = None
+        self.explain_rate = 0.1
+        self.max_pending = max_pending
+        self.path = None
+        self.executor = None
+        self.slots = None
+        self.lock = threading.Lock()
+
+    def init_app(self, app, db):
+        self.path = app.config.get(
+            'SLOW_QUERY_LOG',
+            os.path.join(app.instance_path, 'slow_queries.jsonl')
+        )
+        self.threshold = app.config.get('SLOW_QUERY_MS')
+        if self.threshold is None:
+            return
+        self.explain_rate = app.config.get('SLOW_QUERY_EXPLAIN_RATE',
+                                           self.explain_rate)
+        for _, engine in app_engines(app, db):
+            event.listen(engine, 'before_cursor_execute',
+                         self.before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute',
+                         self.after_cursor_execute)
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+        self.executor = ThreadPoolExecutor(max_workers=1,
+                                           thread_name_prefix='slow-query')
+        self.slots = threading.BoundedSemaphore(self.max_pending)
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters,
+                              context, executemany):
+        conn.info.setdefault('slow_query_start_time', []) \
+            .append(time.perf_counter())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters,
+                             context, executemany):
+        start = conn.info['slow_query_start_time'].pop()
+        duration = (time.perf_counter() - start) * 1000
+        if duration < self.threshold or statement.startswith('EXPLAIN'):
+            return
+        record = dict(
+            recorded_at = datetime.utcnow().isoformat(),
+            duration_ms = round(duration, 3),
+            route = request.endpoint if has_request_context() else None,
+            statement = statement,
+            parameters = parameter_shape(parameters, executemany),
+            plan = None
+        )
+        if self.should_explain(conn.engine, statement, executemany) and \
+                self.slots.acquire(blocking=False):
+            future = self.executor.submit(self.explain, conn.engine, record,
+                                          parameters)
+            future.add_done_callback(lambda f: self.slots.release())
+        else:
+            self.write(record)
+
+    def should_explain(self, engine, statement, executemany):
+        return not executemany and \
+            engine.dialect.name == 'postgresql' and \
+            statement.lstrip().upper().startswith('SELECT') and \
+            random.random() < self.explain_rate
+
+    def explain(self, engine, record, parameters):
+        """
+        Re-runs the statement on the engine that ran it in a read only
+        transaction that is rolled back and logs the record with the resulting
+        plan
+        """
+        try:
+            with engine.connect() as conn:
+                transaction = conn.begin()
+                try:
+                    conn.execute('SET TRANSACTION READ ONLY')
+                    rows = conn.execute(
+                        'EXPLAIN (ANALYZE, BUFFERS) ' + record['statement'],
+                        parameters
+                    )
+                    record['plan'] = '\n'.join(row[0] for row in rows)
+                finally:
+                    transaction.rollback()
+        except Exception as e:
+            logging.error(e)
+            logging.error(traceback.format_exc())
+        self.write(record)
+
+    def write(self, record):
+        line = json.dumps(record) + '\n'
+        with self.lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)),
+                        exist_ok=True)
+            with open(self.path, 'a') as log_file:
+                log_file.write(line)
+
+    def drain(self):
+        """
+        Waits for the plans that are being captured to be logged
+        """
+        if self.executor is not None:
+            self.executor.submit(lambda: None).result()
+
+    def read(self):
+        """
+        Returns the logged slow queries, oldest first
+        """
+        try:
+            with open(self.path) as log_file:
+                return [json.loads(line) for line in log_file if line.strip()]
+        except OSError:
+            return []
+
+
+def parameter_shape(parameters, executemany=False):
+    """
+    Returns the parameters with each value replaced by its type name so the
+    log shows how a statement was called without the user's data
+    """
+    if executemany:
+        rows = list(parameters)
+        return dict(
+            rows = len(rows),
+            row = parameter_shape(rows[0]) if rows else None
+        )
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__
+                for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
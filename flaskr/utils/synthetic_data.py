@@ -0,0 +1,180 @@
+from datetime import date, timedelta
+import csv
+import io
+import math
+import random
+
+
+TRANSACTION_MIX = (
+    ('buy', 0.55),
+    ('sell', 0.20),
+    ('dividend', 0.20),
+    ('return_of_capital', 0.03),
+    ('reinvested_capital_distribution', 0.02)
+)
+"""Transaction types and the share of generated transactions they make up"""
+
+TRADE_FEES = (0, 495, 999)
+"""Trade fees in cents a generated trade is charged"""
+
+
+class RowStream(object):
+    """
+    A read-only file over CSV rows produced by an iterator, so COPY can load
+    more rows than fit in memory
+    """
+    def __init__(self, rows):
+        self.rows = iter(rows)
+        self.buffer = ''
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            chunk = self.next_chunk()
+            if chunk == '':
+                break
+            self.buffer += chunk
+        if size < 0:
+            size = len(self.buffer)
+        data = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+        return data
+
+    readline = read
+
+    def next_chunk(self, row_count=1024):
+        output = io.StringIO()
+        writer = csv.writer(output)
+        for row in self.rows:
+            writer.writerow(row)
+            row_count -= 1
+            if row_count == 0:
+                break
+        return output.getvalue()
+
+
+class PriceHistory(object):
+    """
+    Daily close prices in cents for every generated stock, a random walk over
+    the weekdays from start to end
+    """
+    def __init__(self, symbols, start, end, rng):
+        self.start = start
+        self.days = [start + timedelta(days=i)
+                     for i in range((end - start).days + 1)
+                     if (start + timedelta(days=i)).weekday() < 5]
+        self.closes = {}
+        for symbol in symbols:
+            price = rng.uniform(10, 300)
+            closes = []
+            for i in range(len(self.days)):
+                price *= math.exp(rng.gauss(0.0002, 0.015))
+                closes.append(max(1, int(round(price * 100))))
+            self.closes[symbol] = closes
+
+    def rows(self):
+        for symbol, closes in self.closes.items():
+            for day, close in zip(self.days, closes):
+                yield (symbol, day.isoformat(), close)
+
+    def close(self, symbol, day_index):
+        return self.closes[symbol][day_index]
+
+
+class PortfolioGenerator(object):
+    """
+    Deterministically generates users, investment accounts, stock
+    transactions and stock prices. The same arguments always produce the same
+    rows.
+
+    Keyword arguments:
+    users -- the number of users
+    accounts -- the number of investment accounts each user has
+    transactions -- the number of transactions in each account
+    symbols -- the number of stocks traded, a few are traded far more often
+    years -- the years of price history, transactions happen during them
+    end -- the date of the latest price
+    seed -- seeds the random generator
+    """
+    def __init__(self, users, accounts, transactions, symbols=100, years=5,
+                 end=None, seed=0):
+        self.users = users
+        self.accounts = accounts
+        self.transactions = transactions
+        self.seed = seed
+        self.symbols = [make_symbol(i) for i in range(symbols)]
+        # zipf-like popularity, the first symbols are held by most accounts
+        self.symbol_weights = [1.0 / (rank + 1) for rank in range(symbols)]
+        end = end or date.today()
+        start = end - timedelta(days=int(365.25 * years))
+        self.prices = PriceHistory(self.symbols, start, end,
+                                   random.Random(seed))
+
+    def user_rows(self, password_hash):
+        for i in range(self.users):
+            yield (self.email(i), password_hash, 0)
+
+    def email(self, user_index):
+        return 'seed-%d-%d@example.com' % (self.seed, user_index)
+
+    def account_rows(self, user_ids):
+        for user_id in user_ids:
+            for i in range(self.accounts):
+                # every other account is taxable so both paths are exercised
+                yield ('Account %d' % (i + 1), i % 2 == 1, user_id)
+
+    def transaction_rows(self, accounts):
+        """
+        Yields the transactions of each (account id, user id) in accounts, in
+        the order account_rows generated them
+        """
+        type_names = [name for name, share in TRANSACTION_MIX]
+        type_weights = [share for name, share in TRANSACTION_MIX]
+        day_count = len(self.prices.days)
+        for account_index, (account_id, user_id) in enumerate(accounts):
+            rng = random.Random('%s:%s' % (self.seed, account_index))
+            day_indexes = sorted(rng.randrange(day_count)
+                                 for i in range(self.transactions))
+            holdings = {}
+            for day_index in day_indexes:
+                transaction_type = rng.choices(type_names, type_weights)[0]
+                held = [symbol for symbol, quantity in holdings.items()
+                        if quantity > 0]
+                if transaction_type != 'buy' and len(held) == 0:
+                    transaction_type = 'buy'
+                if transaction_type == 'buy':
+                    symbol = rng.choices(self.symbols, self.symbol_weights)[0]
+                    quantity = rng.randint(1, 200)
+                    holdings[symbol] = holdings.get(symbol, 0) + quantity
+                    cost_per_unit = self.prices.close(symbol, day_index)
+                    trade_fee = rng.choice(TRADE_FEES)
+                elif transaction_type == 'sell':
+                    symbol = rng.choice(held)
+                    quantity = rng.randint(1, holdings[symbol])
+                    holdings[symbol] -= quantity
+                    cost_per_unit = self.prices.close(symbol, day_index)
+                    trade_fee = rng.choice(TRADE_FEES)
+                else:
+                    symbol = rng.choice(held)
+                    quantity = holdings[symbol]
+                    cost_per_unit = rng.randint(1, 150)
+                    trade_fee = 0
+                yield (transaction_type,
+                       symbol,
+                       cost_per_unit,
+                       quantity,
+                       trade_fee,
+                       self.prices.days[day_index].isoformat(),
+                       account_id,
+                       user_id)
+
+
+def make_symbol(index):
+    """
+    Returns a ticker symbol, a third of them listed on the TSX
+    """
+    letters = ''
+    value = index
+    while value > 0 or len(letters) < 3:
+        value, remainder = divmod(value, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters + '.TO' if index % 3 == 0 else letters
@@ -0,0 +1,109 @@
+from collections import OrderedDict
+from flask_login import UserMixin
+import threading
+import time
+
+
+class CachedUser(UserMixin):
+    """
+    A read-only snapshot of a User that is detached from any database session
+    so it can be shared between requests and threads
+    """
+    __slots__ = ('id', 'email')
+
+    def __init__(self, id, email):
+        object.__setattr__(self, 'id', id)
+        object.__setattr__(self, 'email', email)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('CachedUser is read-only')
+
+    def __iter__(self):
+        yield ('email', self.email)
+
+    def __repr__(self):
+        return '<CachedUser {}>'.format(self.id)
+
+    @staticmethod
+    def from_user(user):
+        """
+        Returns a snapshot of the user or None if there is no user
+
+        Keyword arguments:
+        user -- the User model to take a snapshot of
+        """
+        if user is None:
+            return None
+        return CachedUser(user.id, user.email)
+
+
+class UserCache(object):
+    """
+    A size bounded, time limited in-process cache of user snapshots keyed by
+    user id
+    """
+    def __init__(self, ttl=30, max_size=1024):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, app):
+        self.ttl = app.config.get('USER_CACHE_TTL', self.ttl)
+        self.max_size = app.config.get('USER_CACHE_SIZE', self.max_size)
+        self.clear()
+
+    def get(self, user_id, loader):
+        """
+        Returns the cached snapshot for user_id, calling loader to create it
+        when there is no live entry
+
+        Keyword arguments:
+        user_id -- the id of the user
+        loader -- a function taking user_id that returns a snapshot or None
+        """
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is not None and entry[0] > now:
+                self.entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        user = loader(user_id)
+        if user is not None and self.ttl > 0 and self.max_size > 0:
+            with self.lock:
+                self.entries[user_id] = (now + self.ttl, user)
+                self.entries.move_to_end(user_id)
+                while len(self.entries) > self.max_size:
+                    self.entries.popitem(last=False)
+        return user
+
+    def invalidate(self, user_id):
+        """
+        Removes the snapshot for user_id if one is cached
+        """
+        with self.lock:
+            self.entries.pop(user_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """
+        Returns a dict with the hit and miss counters and the hit rate
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return dict(
+                hits = self.hits,
+                misses = self.misses,
+                hit_rate = float(self.hits) / lookups if lookups > 0 else 0.0,
+                size = len(self.entries)
+            )
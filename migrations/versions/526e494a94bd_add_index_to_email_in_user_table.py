@@ -18,13 +18,15 @@ depends_on = None
 
 def upgrade():
     # ### commands auto generated by Alembic - please adjust! ###
-    op.create_index(op.f('ix_portfolio_user_email'), 'portfolio_user', ['email'], unique=True)
-    op.drop_constraint('portfolio_user_email_key', 'portfolio_user', type_='unique')
+    with op.batch_alter_table('portfolio_user') as batch_op:
+        batch_op.create_index(batch_op.f('ix_portfolio_user_email'), ['email'], unique=True)
+        batch_op.drop_constraint('portfolio_user_email_key', type_='unique')
     # ### end Alembic commands ###
 
 
 def downgrade():
     # ### commands auto generated by Alembic - please adjust! ###
-    op.create_unique_constraint('portfolio_user_email_key', 'portfolio_user', ['email'])
-    op.drop_index(op.f('ix_portfolio_user_email'), table_name='portfolio_user')
+    with op.batch_alter_table('portfolio_user') as batch_op:
+        batch_op.create_unique_constraint('portfolio_user_email_key', ['email'])
+        batch_op.drop_index(batch_op.f('ix_portfolio_user_email'))
     # ### end Alembic commands ###
@@ -18,19 +18,23 @@ depends_on = None
 
 def upgrade():
     # ### commands auto generated by Alembic - please adjust! ###
-    op.alter_column('investment_account', 'user_id',
+    with op.batch_alter_table('investment_account') as batch_op:
+        batch_op.alter_column('user_id',
                existing_type=sa.INTEGER(),
                nullable=False)
-    op.add_column('stock_transaction', sa.Column('user_id', sa.Integer(), nullable=False))
-    op.create_foreign_key(None, 'stock_transaction', 'portfolio_user', ['user_id'], ['id'])
+    with op.batch_alter_table('stock_transaction') as batch_op:
+        batch_op.add_column(sa.Column('user_id', sa.Integer(), nullable=False))
+        batch_op.create_foreign_key('stock_transaction_user_id_fkey', 'portfolio_user', ['user_id'], ['id'])
     # ### end Alembic commands ###
 
 
 def downgrade():
     # ### commands auto generated by Alembic - please adjust! ###
-    op.drop_constraint(None, 'stock_transaction', type_='foreignkey')
-    op.drop_column('stock_transaction', 'user_id')
-    op.alter_column('investment_account', 'user_id',
+    with op.batch_alter_table('stock_transaction') as batch_op:
+        batch_op.drop_constraint('stock_transaction_user_id_fkey', type_='foreignkey')
+        batch_op.drop_column('user_id')
+    with op.batch_alter_table('investment_account') as batch_op:
+        batch_op.alter_column('user_id',
                existing_type=sa.INTEGER(),
                nullable=True)
     # ### end Alembic commands ###
@@ -23,16 +23,18 @@ def upgrade():
     sa.Column('email', sa.String(length=128), nullable=False),
     sa.Column('password_hash', sa.String(length=128), nullable=False),
     sa.PrimaryKeyConstraint('id'),
-    sa.UniqueConstraint('email')
+    sa.UniqueConstraint('email', name='portfolio_user_email_key')
     )
-    op.add_column('investment_account', sa.Column('user_id', sa.Integer(), nullable=True))
-    op.create_foreign_key(None, 'investment_account', 'portfolio_user', ['user_id'], ['id'])
+    with op.batch_alter_table('investment_account') as batch_op:
+        batch_op.add_column(sa.Column('user_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('investment_account_user_id_fkey', 'portfolio_user', ['user_id'], ['id'])
     # ### end Alembic commands ###
 
 
 def downgrade():
     # ### commands auto generated by Alembic - please adjust! ###
-    op.drop_constraint(None, 'investment_account', type_='foreignkey')
-    op.drop_column('investment_account', 'user_id')
+    with op.batch_alter_table('investment_account') as batch_op:
+        batch_op.drop_constraint('investment_account_user_id_fkey', type_='foreignkey')
+        batch_op.drop_column('user_id')
     op.drop_table('portfolio_user')
     # ### end Alembic commands ###
@@ -0,0 +1,52 @@
+"""Add missing transaction types
+
+Revision ID: b7d3e5f12a84
+Revises: a4e7c2b91f30
+Create Date: 2026-10-19 15:02:48.903114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d3e5f12a84'
+down_revision = 'a4e7c2b91f30'
+branch_labels = None
+depends_on = None
+
+OLD_TYPES = ('buy', 'sell')
+NEW_TYPES = ('dividend', 'return_of_capital',
+             'reinvested_capital_distribution')
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        # enum values cannot be added inside a transaction before postgres 12
+        with op.get_context().autocommit_block():
+            for name in NEW_TYPES:
+                op.execute("ALTER TYPE stocktransactiontype "
+                           "ADD VALUE IF NOT EXISTS '%s'" % name)
+    else:
+        with op.batch_alter_table('stock_transaction') as batch_op:
+            batch_op.alter_column(
+                'transaction_type',
+                existing_type=sa.Enum(*OLD_TYPES,
+                                      name='stocktransactiontype'),
+                type_=sa.Enum(*(OLD_TYPES + NEW_TYPES),
+                              name='stocktransactiontype'),
+                existing_nullable=False
+            )
+
+
+def downgrade():
+    # postgres cannot drop enum values, the extra values are left in place
+    if op.get_bind().dialect.name != 'postgresql':
+        with op.batch_alter_table('stock_transaction') as batch_op:
+            batch_op.alter_column(
+                'transaction_type',
+                existing_type=sa.Enum(*(OLD_TYPES + NEW_TYPES),
+                                      name='stocktransactiontype'),
+                type_=sa.Enum(*OLD_TYPES, name='stocktransactiontype'),
+                existing_nullable=False
+            )
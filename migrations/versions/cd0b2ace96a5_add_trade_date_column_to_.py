@@ -18,11 +18,13 @@ depends_on = None
 
 def upgrade():
     # ### commands auto generated by Alembic - please adjust! ###
-    op.add_column('stock_transaction', sa.Column('trade_date', sa.DateTime(), nullable=False))
+    with op.batch_alter_table('stock_transaction') as batch_op:
+        batch_op.add_column(sa.Column('trade_date', sa.DateTime(), nullable=False))
     # ### end Alembic commands ###
 
 
 def downgrade():
     # ### commands auto generated by Alembic - please adjust! ###
-    op.drop_column('stock_transaction', 'trade_date')
+    with op.batch_alter_table('stock_transaction') as batch_op:
+        batch_op.drop_column('trade_date')
     # ### end Alembic commands ###
@@ -0,0 +1,36 @@
+"""Use AUTOINCREMENT for stock_price ids on SQLite
+
+Revision ID: f4b8d2c6e1a7
+Revises: e2c6a9d4f318
+Create Date: 2026-10-19 19:12:05.417392
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f4b8d2c6e1a7'
+down_revision = 'e2c6a9d4f318'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # postgres sequences never hand out an id twice, only sqlite needs the
+    # table rebuilt with AUTOINCREMENT
+    if op.get_bind().dialect.name == 'sqlite':
+        with op.batch_alter_table(
+                'stock_price',
+                recreate='always',
+                table_kwargs={'sqlite_autoincrement': True}):
+            pass
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        with op.batch_alter_table(
+                'stock_price',
+                recreate='always',
+                table_kwargs={'sqlite_autoincrement': False}):
+            pass
@@ -5,14 +5,22 @@ from flaskr import create_app, db, login_manager
 from flaskr.model import User
 
 
+TEST_DATABASE_URI = os.environ.get('TEST_DATABASE_URI',
+                                   'postgresql:///portfoliotest')
+"""The database the tests run against, postgres unless overridden"""
+
+requires_postgres = pytest.mark.skipif(
+    not TEST_DATABASE_URI.startswith('postgresql'),
+    reason='needs a postgres test database'
+)
+
 @pytest.fixture
 def app():
     app = create_app({
         'TESTING': True,
         'WTF_CSRF_ENABLED': False,
         'SECRET_KEY': 'dev',
-        'SQLALCHEMY_DATABASE_URI': \
-            'postgresql:///portfoliotest',
+        'SQLALCHEMY_DATABASE_URI': TEST_DATABASE_URI,
         # 'SQLALCHEMY_ECHO':  True,
         'SQLALCHEMY_TRACK_MODIFICATIONS': False
     })
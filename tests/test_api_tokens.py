@@ -0,0 +1,104 @@
+from datetime import date
+import json
+import pytest
+from flaskr import db, api_tokens
+from flaskr.model import (
+    StockTransaction,
+    User,
+    load_user_from_token
+)
+from flaskr.utils.api_tokens import ApiTokenSerializer
+
+
+some_user_email = "noether@mathematicianlineage.com"
+totally_secure_password = "abstract algebra"
+
+@pytest.fixture
+def token_setup(app):
+    app.login_manager.request_loader(load_user_from_token)
+    try:
+        with app.app_context():
+            user = User(email=some_user_email, password_hash="")
+            user.set_password(totally_secure_password)
+            db.session.add(user)
+            db.session.commit()
+        yield app
+    except Exception as e:
+        assert False
+    finally:
+        with app.app_context():
+            StockTransaction.query.delete()
+            User.query.delete()
+            db.session.commit()
+
+def issue_token(client, password=totally_secure_password):
+    return client.post('/auth/token', data=json.dumps(dict(
+        email = some_user_email,
+        password = password
+    )), content_type='application/json')
+
+def bearer(token):
+    return {'Authorization': 'Bearer %s' % token}
+
+def test_issue_token(token_setup, client):
+    response = issue_token(client)
+    json_data = json.loads(response.data)
+    assert response.status_code == 200
+    assert json_data['expires_in'] == 3600
+    with token_setup.app_context():
+        user = api_tokens.loads(json_data['token'])
+        assert user.id == 1
+        assert user.data_version == 0
+
+def test_issue_token_bad_password(token_setup, client):
+    response = issue_token(client, "Bad pass")
+    assert response.status_code == 401
+
+def test_token_authenticates_request(token_setup, client):
+    token = json.loads(issue_token(client).data)['token']
+    response = client.get('/auth/details', headers=bearer(token))
+    assert json.loads(response.data)['email'] == some_user_email
+
+def test_bad_token_rejected(token_setup, client):
+    response = client.get('/auth/details', headers=bearer("not.a.token"))
+    assert response.status_code == 401
+
+def test_token_write_bumps_data_version(token_setup, client):
+    token = json.loads(issue_token(client).data)['token']
+    client.post('/transaction/', headers=bearer(token), data=json.dumps(dict(
+        transaction_type = 'buy',
+        stock_symbol = "XAW.TO",
+        cost_per_unit = "27.18",
+        quantity = 200,
+        trade_fee = "9.99",
+        trade_date = date(2016, 11, 11).isoformat(),
+        account_id = None
+    )))
+    with token_setup.app_context():
+        assert User.query.get(1).data_version == 1
+    token = json.loads(issue_token(client).data)['token']
+    with token_setup.app_context():
+        assert api_tokens.loads(token).data_version == 1
+
+def test_token_key_rotation(app):
+    old = ApiTokenSerializer()
+    app.config['API_TOKEN_SECRET_KEYS'] = ['old key']
+    old.init_app(app)
+    token = old.dumps(1, 3)
+
+    rotated = ApiTokenSerializer()
+    app.config['API_TOKEN_SECRET_KEYS'] = ['new key', 'old key']
+    rotated.init_app(app)
+    assert rotated.loads(token).id == 1
+    assert old.loads(rotated.dumps(1, 3)) is None
+
+    retired = ApiTokenSerializer()
+    app.config['API_TOKEN_SECRET_KEYS'] = ['new key']
+    retired.init_app(app)
+    assert retired.loads(token) is None
+
+def test_token_expiry(app):
+    serializer = ApiTokenSerializer()
+    app.config['API_TOKEN_MAX_AGE'] = -1
+    serializer.init_app(app)
+    assert serializer.loads(serializer.dumps(1, 0)) is None
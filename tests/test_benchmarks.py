@@ -0,0 +1,94 @@
+from benchmarks.compare import compare_results, format_comparison
+from benchmarks.load_test import (
+    IMPORT_ROWS,
+    format_summary,
+    import_csv,
+    multipart_csv,
+    percentile,
+    summarize
+)
+from benchmarks.query_overhead import (
+    format_query_overhead,
+    measure_query_overhead
+)
+from benchmarks.suite import stub_provider
+from datetime import date
+from flaskr import db, fetch_all_prices
+from flaskr.model import StockMarker, StockPrice, StockTransaction
+from flaskr.utils.synthetic_data import PortfolioGenerator
+import random
+
+
+def results(wall_seconds):
+    return dict(results = [dict(
+        size = 'small',
+        benchmark = 'book_cost',
+        wall_seconds = wall_seconds,
+        peak_memory_bytes = 100
+    )])
+
+def test_compare_flags_regression():
+    rows = compare_results(results(1.0), results(1.2), threshold=0.1)
+    assert len(rows) == 1
+    assert rows[0]['regressed']
+    assert abs(rows[0]['change'] - 0.2) < 1e-9
+    assert 'REGRESSED' in format_comparison(rows)
+
+def test_compare_within_threshold():
+    rows = compare_results(results(1.0), results(1.05), threshold=0.1)
+    assert not rows[0]['regressed']
+
+def test_compare_skips_new_benchmarks():
+    current = results(1.0)
+    current['results'][0]['benchmark'] = 'market_value'
+    assert compare_results(results(1.0), current) == []
+
+def test_fetch_with_stub_provider(app):
+    generator = PortfolioGenerator(1, 1, 1, symbols=2, years=1,
+                                   end=date(2019, 12, 31))
+    with app.app_context():
+        db.session.add(StockMarker(stock_symbol=generator.symbols[0],
+                                   exists=None))
+        db.session.commit()
+        fetch_all_prices(stub_provider(generator), 0)
+        prices = StockPrice.query.order_by(StockPrice.price_date).all()
+        assert len(prices) == 100
+        assert prices[-1].price_date.date() == date(2019, 12, 31)
+        assert prices[-1].close_price == \
+            generator.prices.closes[generator.symbols[0]][-1]
+        assert StockMarker.query.one().exists
+
+def test_percentile_nearest_rank():
+    values = [float(i) for i in range(1, 101)]
+    assert percentile(values, 0.50) == 50.0
+    assert percentile(values, 0.99) == 99.0
+    assert percentile([3.0], 0.95) == 3.0
+    assert percentile([], 0.5) is None
+
+def test_summarize_load_samples():
+    samples = [('transaction_all', 0.1, True),
+               ('transaction_all', 0.3, False),
+               ('transaction_stats', 0.2, True)]
+    summary = summarize(samples, 2)
+    assert summary['overall']['requests'] == 3
+    assert summary['overall']['throughput'] == 1.5
+    assert summary['overall']['p50'] == 0.2
+    assert summary['calls']['transaction_all']['error_rate'] == 0.5
+    assert 'overall' in format_summary(summary)
+
+def test_multipart_import_accepted(auth_app_user_1, client):
+    body, content_type = multipart_csv(import_csv(random.Random(0)))
+    client.post('/transaction/import', data=body, content_type=content_type)
+    with auth_app_user_1.app_context():
+        assert StockTransaction.query.count() == IMPORT_ROWS
+        StockTransaction.query.delete()
+        db.session.commit()
+
+def test_query_overhead(app):
+    with app.app_context():
+        results = measure_query_overhead(db.session(), 1, 2)
+    assert [row['query'] for row in results] == \
+        ['ledger', 'versions', 'data_version', 'latest_prices']
+    assert all(row['rebuilt_us'] > 0 and row['baked_us'] > 0
+               for row in results)
+    assert 'latest_prices' in format_query_overhead(results)
@@ -0,0 +1,143 @@
+from datetime import date
+import pytest
+from flaskr import db
+from flaskr.generators.adjust_cost_base import AdjustCostBaseGenerator
+from flaskr.generators.book_cost import BookCostGenerator
+from flaskr.generators.market_value import MarketValueGenerator
+from flaskr.ledger import NO_ACCOUNT, Ledger, bakery, get_ledger, ledger_query
+from flaskr.model import (
+    InvestmentAccount,
+    StockTransaction,
+    StockTransactionType,
+    User
+)
+from sqlalchemy import event
+
+
+investment_account_1 = dict(
+    name = "Taxable Account",
+    taxable = True,
+    user_id = 1
+)
+
+stock_transaction_1 = dict(
+    transaction_type = StockTransactionType.buy,
+    stock_symbol = "VCN.TO",
+    cost_per_unit = 3141,
+    quantity = 100,
+    trade_fee = 999,
+    trade_date = date(2016, 4, 23),
+    account_id = 1,
+    user_id = 1
+)
+
+stock_transaction_2 = dict(
+    transaction_type = StockTransactionType.sell,
+    stock_symbol = "VCN.TO",
+    cost_per_unit = 3300,
+    quantity = 50,
+    trade_fee = 999,
+    trade_date = date(2016, 8, 23),
+    account_id = 1,
+    user_id = 1
+)
+
+stock_transaction_3 = dict(
+    transaction_type = StockTransactionType.buy,
+    stock_symbol = "VAB.TO",
+    cost_per_unit = 2601,
+    quantity = 200,
+    trade_fee = 999,
+    trade_date = date(2016, 1, 4),
+    account_id = None,
+    user_id = 1
+)
+
+stock_transaction_4 = dict(
+    transaction_type = StockTransactionType.buy,
+    stock_symbol = "ZPR.TO",
+    cost_per_unit = 992,
+    quantity = 500,
+    trade_fee = 999,
+    trade_date = date(2016, 12, 9),
+    account_id = None,
+    user_id = 2
+)
+
+@pytest.fixture
+def ledger_setup(auth_app_user_1):
+    auth_app = auth_app_user_1
+    try:
+        with auth_app.app_context():
+            db.session.add(InvestmentAccount(**investment_account_1))
+            db.session.add(StockTransaction(**stock_transaction_1))
+            db.session.add(StockTransaction(**stock_transaction_2))
+            db.session.add(StockTransaction(**stock_transaction_3))
+            db.session.add(StockTransaction(**stock_transaction_4))
+            db.session.commit()
+        yield auth_app
+    except Exception as e:
+        assert False
+    finally:
+        with auth_app.app_context():
+            StockTransaction.query.delete()
+            InvestmentAccount.query.delete()
+            db.session.commit()
+
+def test_ledger_load(ledger_setup):
+    with ledger_setup.app_context():
+        ledger = Ledger.load(1)
+    assert len(ledger) == 3
+    assert ledger.symbols == ["VAB.TO", "VCN.TO"]
+    assert list(ledger.symbol_indexes) == [0, 1, 1]
+    assert list(ledger.account_ids) == [NO_ACCOUNT, 1, 1]
+    assert list(ledger.transaction_types) == [
+        StockTransactionType.buy.value,
+        StockTransactionType.buy.value,
+        StockTransactionType.sell.value
+    ]
+    assert list(ledger.quantities) == [200, 100, 50]
+    assert list(ledger.trade_dates) == [
+        date(2016, 1, 4).toordinal(),
+        date(2016, 4, 23).toordinal(),
+        date(2016, 8, 23).toordinal()
+    ]
+    assert ledger.is_taxable(1)
+    assert list(ledger.indexes(1)) == [1, 2]
+    assert list(ledger.indexes(NO_ACCOUNT)) == [0]
+
+def test_ledger_query_baked(ledger_setup):
+    with ledger_setup.app_context():
+        baked = Ledger.build_ledger_query(1).all()
+        cached = len(bakery.cache)
+        assert Ledger.build_ledger_query(0).all() == []
+        assert len(bakery.cache) == cached
+        assert baked == ledger_query(db.session).params(user_id=1).all()
+    assert len(baked) == 3
+
+def test_ledger_shared_by_generators(ledger_setup):
+    statements = []
+    def count_statement(conn, cursor, statement, *args):
+        statements.append(statement)
+    with ledger_setup.app_context():
+        engine = db.get_engine()
+        event.listen(engine, 'before_cursor_execute', count_statement)
+        try:
+            BookCostGenerator(1, 1).next()
+            MarketValueGenerator(1, 1).next()
+            acbs = AdjustCostBaseGenerator(1, 1).next()
+            assert get_ledger(1) is get_ledger(1)
+        finally:
+            event.remove(engine, 'before_cursor_execute', count_statement)
+    assert acbs == {'VCN.TO': '$1,575.50'}
+    assert len([s for s in statements if 'stock_transaction' in s]) == 1
+
+def test_ledger_per_request(ledger_setup, client):
+    with ledger_setup.test_request_context():
+        assert len(get_ledger(1)) == 3
+    with ledger_setup.app_context():
+        db.session.add(StockTransaction(**stock_transaction_1))
+        User.bump_data_version(1)
+        db.session.commit()
+    with ledger_setup.test_request_context():
+        assert len(get_ledger(1)) == 4
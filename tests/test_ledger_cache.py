@@ -0,0 +1,105 @@
+from datetime import date
+import json
+import pytest
+from flaskr import db, ledger_cache
+from flaskr.ledger import Ledger
+from flaskr.model import (
+    StockTransaction,
+    StockTransactionType
+)
+from flaskr.utils.ledger_cache import LedgerCache
+
+
+stock_transaction_1 = dict(
+    transaction_type = StockTransactionType.buy,
+    stock_symbol = "VCN.TO",
+    cost_per_unit = 3141,
+    quantity = 100,
+    trade_fee = 999,
+    trade_date = date(2016, 4, 23),
+    account_id = None,
+    user_id = 1
+)
+
+@pytest.fixture
+def cache_setup(auth_app_user_1):
+    auth_app = auth_app_user_1
+    try:
+        with auth_app.app_context():
+            db.session.add(StockTransaction(**stock_transaction_1))
+            db.session.commit()
+        yield auth_app
+    except Exception as e:
+        assert False
+    finally:
+        with auth_app.app_context():
+            StockTransaction.query.delete()
+            db.session.commit()
+
+def test_cache_hit_on_same_version():
+    cache = LedgerCache()
+    ledger = Ledger(1)
+    cache.put(1, 0, ledger, cache.generation(1))
+    assert cache.get(1, 0) is ledger
+    assert cache.get(1, 1) is None
+    stats = cache.stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 1
+    assert stats['bytes'] == ledger.nbytes()
+
+def test_cache_put_after_invalidate_ignored():
+    cache = LedgerCache()
+    generation = cache.generation(1)
+    cache.invalidate(1)
+    cache.put(1, 0, Ledger(1), generation)
+    assert cache.get(1, 0) is None
+
+def test_cache_invalidations_bounded():
+    cache = LedgerCache(max_invalidations=2)
+    generation = cache.generation(1)
+    for user_id in (1, 2, 3):
+        cache.invalidate(user_id)
+    assert list(cache.generations.keys()) == [2, 3]
+    cache.put(1, 0, Ledger(1), generation)
+    assert cache.get(1, 0) is None
+    cache.put(1, 0, Ledger(1), cache.generation(1))
+    assert cache.get(1, 0) is not None
+
+def test_cache_evicts_least_recently_used():
+    nbytes = Ledger(1).nbytes()
+    cache = LedgerCache(max_bytes=nbytes * 2)
+    cache.put(1, 0, Ledger(1), cache.generation(1))
+    cache.put(2, 0, Ledger(2), cache.generation(2))
+    cache.get(1, 0)
+    cache.put(3, 0, Ledger(3), cache.generation(3))
+    assert list(cache.entries.keys()) == [1, 3]
+    assert cache.stats()['evictions'] == 1
+    assert cache.stats()['bytes'] <= nbytes * 2
+
+def test_cache_skips_oversized_ledger():
+    cache = LedgerCache(max_bytes=1)
+    cache.put(1, 0, Ledger(1), cache.generation(1))
+    assert cache.stats()['entries'] == 0
+
+def test_requests_share_cached_ledger(cache_setup, client):
+    client.get('/transaction/stats')
+    response = client.get('/investment_account/1/stats')
+    assert json.loads(response.data)['book_cost'] == "N/A"
+    stats = ledger_cache.stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 1
+
+def test_write_invalidates_cached_ledger(cache_setup, client):
+    client.get('/transaction/stats')
+    client.post('/transaction/', data=json.dumps(dict(
+        transaction_type = 'buy',
+        stock_symbol = "VCN.TO",
+        cost_per_unit = "31.41",
+        quantity = 100,
+        trade_fee = "9.99",
+        trade_date = date(2016, 11, 11).isoformat(),
+        account_id = None
+    )))
+    assert ledger_cache.stats()['invalidations'] == 1
+    response = client.get('/transaction/stats')
+    assert json.loads(response.data)['book_cost'] == "$6,301.98"
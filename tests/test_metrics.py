@@ -0,0 +1,145 @@
+from datetime import date
+import io
+import os
+import pytest
+import subprocess
+import sys
+import threading
+from flaskr import db, metrics
+from flaskr.model import (
+    StockPrice,
+    StockTransaction,
+    StockTransactionType
+)
+from flaskr.utils.metrics import Metrics
+
+
+stock_transaction_1 = dict(
+    transaction_type = StockTransactionType.buy,
+    stock_symbol = "VCN.TO",
+    cost_per_unit = 3141,
+    quantity = 100,
+    trade_fee = 999,
+    trade_date = date(2016, 4, 23),
+    account_id = None,
+    user_id = 1
+)
+
+stock_price_1 = dict(
+    stock_symbol = "VCN.TO",
+    price_date = date(2019, 10, 25),
+    close_price = 3312
+)
+
+@pytest.fixture
+def metrics_setup(auth_app_user_1):
+    auth_app = auth_app_user_1
+    try:
+        with auth_app.app_context():
+            db.session.add(StockTransaction(**stock_transaction_1))
+            db.session.add(StockPrice(**stock_price_1))
+            db.session.commit()
+        yield auth_app
+    except Exception as e:
+        assert False
+    finally:
+        with auth_app.app_context():
+            StockTransaction.query.delete()
+            StockPrice.query.delete()
+            db.session.commit()
+
+def test_counters_summed_over_threads():
+    registry = Metrics()
+    def count():
+        for i in range(1000):
+            registry.inc('requests_total', (('endpoint', 'stats'),))
+    threads = [threading.Thread(target=count) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert registry.snapshot()[
+        ('requests_total', (('endpoint', 'stats'),))
+    ] == 4000
+
+def test_render_histogram():
+    registry = Metrics(buckets=(0.1, 1.0))
+    registry.describe('latency_seconds', 'histogram', 'Latency')
+    registry.observe('latency_seconds', 0.05)
+    registry.observe('latency_seconds', 0.5)
+    registry.observe('latency_seconds', 2.0)
+    assert registry.render().splitlines() == [
+        '# HELP latency_seconds Latency',
+        '# TYPE latency_seconds histogram',
+        'latency_seconds_bucket{le="0.1"} 1',
+        'latency_seconds_bucket{le="1.0"} 2',
+        'latency_seconds_bucket{le="+Inf"} 3',
+        'latency_seconds_sum 2.55',
+        'latency_seconds_count 3'
+    ]
+
+def test_processes_merged_through_directory(tmp_path):
+    processes = []
+    for name in ('1', '2'):
+        registry = Metrics(buckets=(1.0,))
+        registry.directory = str(tmp_path)
+        registry.name = name
+        registry.inc('jobs_total', amount=2)
+        registry.observe('latency_seconds', 0.5)
+        registry.set('in_use', 3)
+        registry.flush()
+        processes.append(registry)
+    values = processes[0].collect()
+    assert values[('jobs_total', ())] == 4
+    assert values[('latency_seconds', ())] == [2, 0, 1.0]
+    assert values[('in_use', ())] == 6
+
+def test_gauges_of_exited_process_dropped(tmp_path):
+    exited = subprocess.Popen([sys.executable, '-c', 'pass'])
+    exited.wait()
+    processes = []
+    for name in (str(os.getpid()), str(exited.pid)):
+        registry = Metrics(buckets=(1.0,))
+        registry.directory = str(tmp_path)
+        registry.name = name
+        registry.describe('jobs_total', 'counter', 'Jobs')
+        registry.describe('in_use', 'gauge', 'In use')
+        registry.inc('jobs_total', amount=2)
+        registry.set('in_use', 3)
+        registry.flush()
+        processes.append(registry)
+    values = processes[0].collect()
+    assert values[('jobs_total', ())] == 4
+    assert values[('in_use', ())] == 3
+
+def test_label_values_escaped():
+    registry = Metrics()
+    registry.inc('errors_total', (('message', 'a "b"\n'),))
+    assert 'errors_total{message="a \\"b\\"\\n"} 1' in registry.render()
+
+def test_metrics_endpoint(metrics_setup, client):
+    client.get('/transaction/stats')
+    client.post('/transaction/import', data=dict(
+        file=(io.BytesIO(
+            b'transaction_type,stock_symbol,cost_per_unit,quantity,'
+            b'trade_fee,trade_date\n'
+            b'buy,VCN.TO,31.41,100,9.99,2016-04-23\n'
+        ), 'import.csv')
+    ))
+    response = client.get('/metrics')
+    assert response.mimetype == 'text/plain'
+    lines = response.data.decode('utf-8').splitlines()
+    assert 'portfolio_request_duration_seconds_count{' \
+        'endpoint="stock_transaction_bp.get_transaction_stats",' \
+        'method="GET"} 1' in lines
+    assert 'portfolio_generator_duration_seconds_count{' \
+        'generator="portfolio_stats"} 1' in lines
+    assert 'portfolio_imported_transactions_total 1' in lines
+    assert 'portfolio_cache_misses_total{cache="ledger"} 1' in lines
+    assert 'portfolio_price_latest_date_timestamp_seconds 1571961600.0' \
+        in lines
+    assert any(line.startswith('portfolio_db_pool_checkout_seconds_count{'
+                               'database="primary"} ')
+               for line in lines)
+    assert 'portfolio_db_pool_connections_in_use{database="primary"} 1' \
+        in lines
@@ -0,0 +1,131 @@
+import pytest
+import threading
+from flaskr import db, password_hasher
+from flaskr.model import User
+from flaskr.utils.password_hasher import PasswordHasher, PasswordHasherBusy
+from werkzeug.security import generate_password_hash
+
+
+some_user_email = "hilbert@mathematicianlineage.com"
+totally_secure_password = "entscheidungsproblem"
+
+@pytest.fixture
+def old_hash_setup(app):
+    @app.login_manager.request_loader
+    def load_user_from_request(request):
+        return None
+    try:
+        with app.app_context():
+            user = User(
+                email=some_user_email,
+                password_hash=generate_password_hash(
+                    totally_secure_password,
+                    'pbkdf2:sha256:1000'
+                )
+            )
+            db.session.add(user)
+            db.session.commit()
+        yield app
+    except Exception as e:
+        assert False
+    finally:
+        with app.app_context():
+            User.query.delete()
+            db.session.commit()
+
+def occupy_hasher(hasher):
+    """
+    Blocks the hasher's only worker until the returned event is set
+    """
+    release = threading.Event()
+    started = threading.Event()
+    def block():
+        started.set()
+        release.wait()
+    def occupy():
+        try:
+            hasher.run(block)
+        except PasswordHasherBusy:
+            # a hasher with a short timeout stops waiting while block still
+            # holds the worker
+            pass
+    thread = threading.Thread(target=occupy)
+    thread.start()
+    started.wait()
+    return release, thread
+
+def default_method():
+    return generate_password_hash('').split('$')[0]
+
+def test_hash_and_verify(app):
+    password_hash = password_hasher.hash(totally_secure_password)
+    assert password_hash.startswith(default_method() + '$')
+    assert password_hasher.verify(password_hash, totally_secure_password)
+    assert not password_hasher.verify(password_hash, "Bad pass")
+    assert not password_hasher.needs_rehash(password_hash)
+
+def test_needs_rehash(app):
+    assert password_hasher.needs_rehash(
+        generate_password_hash(totally_secure_password, 'pbkdf2:sha256:1000')
+    )
+    assert password_hasher.needs_rehash(
+        generate_password_hash(totally_secure_password, default_method(), 4)
+    )
+    assert password_hasher.needs_rehash("")
+
+def test_stronger_hash_kept(app):
+    iterations = int(default_method().split(':')[2])
+    assert not password_hasher.needs_rehash(
+        generate_password_hash(totally_secure_password,
+                               'pbkdf2:sha256:%d' % (iterations * 2),
+                               32)
+    )
+
+def test_hash_timeout_is_busy(app):
+    hasher = PasswordHasher(max_workers=1, max_queue=1, timeout=0.01)
+    hasher.init_app(app)
+    release, thread = occupy_hasher(hasher)
+    try:
+        with pytest.raises(PasswordHasherBusy):
+            hasher.hash(totally_secure_password)
+    finally:
+        release.set()
+        thread.join()
+
+def test_login_rehashes_password(old_hash_setup, client):
+    client.post('/auth/login', data=dict(
+        email = some_user_email,
+        password = totally_secure_password
+    ))
+    with old_hash_setup.app_context():
+        user = User.query.get(1)
+        assert user.password_hash.startswith(default_method() + '$')
+        assert user.check_password(totally_secure_password)
+
+def test_full_queue_rejected(app):
+    hasher = PasswordHasher(max_workers=1, max_queue=0)
+    hasher.init_app(app)
+    release, thread = occupy_hasher(hasher)
+    try:
+        with pytest.raises(PasswordHasherBusy):
+            hasher.verify("", totally_secure_password)
+    finally:
+        release.set()
+        thread.join()
+    assert not hasher.verify("", totally_secure_password)
+
+def test_login_rejected_when_busy(old_hash_setup, client):
+    old_hash_setup.config['PASSWORD_HASH_WORKERS'] = 1
+    old_hash_setup.config['PASSWORD_HASH_QUEUE_SIZE'] = 0
+    password_hasher.init_app(old_hash_setup)
+    release, thread = occupy_hasher(password_hasher)
+    try:
+        response = client.post('/auth/login', data=dict(
+            email = some_user_email,
+            password = totally_secure_password
+        ))
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '1'
+    finally:
+        release.set()
+        thread.join()
@@ -0,0 +1,132 @@
+from datetime import date
+import csv
+import json
+import pytest
+from flaskr import db
+from flaskr.generators.portfolio_stats import PortfolioStatsGenerator
+from flaskr.model import (
+    InvestmentAccount,
+    StockPrice,
+    StockTransaction,
+    StockTransactionType
+)
+from sqlalchemy import event
+import logging
+import traceback
+
+
+investment_account_1 = dict(
+    name = "TFSA",
+    taxable = False,
+    user_id = 1
+)
+
+investment_account_2 = dict(
+    name = "Taxable Account",
+    taxable = True,
+    user_id = 1
+)
+
+stock_transaction_1 = dict(
+    transaction_type = StockTransactionType.buy,
+    stock_symbol = "VCN.TO",
+    cost_per_unit = 3141,
+    quantity = 100,
+    trade_fee = 999,
+    trade_date = date(2016, 4, 23),
+    account_id = 2,
+    user_id = 1
+)
+
+stock_transaction_2 = dict(
+    transaction_type = StockTransactionType.sell,
+    stock_symbol = "VCN.TO",
+    cost_per_unit = 3300,
+    quantity = 50,
+    trade_fee = 999,
+    trade_date = date(2016, 8, 23),
+    account_id = 2,
+    user_id = 1
+)
+
+stock_transaction_3 = dict(
+    transaction_type = StockTransactionType.buy,
+    stock_symbol = "VAB.TO",
+    cost_per_unit = 2601,
+    quantity = 200,
+    trade_fee = 999,
+    trade_date = date(2016, 8, 23),
+    account_id = 1,
+    user_id = 1
+)
+
+@pytest.fixture
+def stats_setup(auth_app_user_1):
+    auth_app = auth_app_user_1
+    try:
+        with auth_app.app_context():
+            with open('tests/resources/stock_price.csv', 'r') as csv_file:
+                csv_iterator = csv.reader(csv_file)
+                csv_iterator.__next__() # ignore the headers
+                for row in csv_iterator:
+                    db.session.add(StockPrice(**dict(
+                        stock_symbol = row[0],
+                        price_date = date.fromisoformat(row[1]),
+                        close_price = int(row[2])
+                    )))
+            db.session.add(InvestmentAccount(**investment_account_1))
+            db.session.add(InvestmentAccount(**investment_account_2))
+            db.session.add(StockTransaction(**stock_transaction_1))
+            db.session.add(StockTransaction(**stock_transaction_2))
+            db.session.add(StockTransaction(**stock_transaction_3))
+            db.session.commit()
+        yield auth_app
+    except Exception as e:
+        logging.error(traceback.format_exc())
+        logging.error(e)
+        assert False
+    finally:
+        with auth_app.app_context():
+            StockTransaction.query.delete()
+            InvestmentAccount.query.delete()
+            StockPrice.query.delete()
+            db.session.commit()
+
+def test_account_stats_with_acb(stats_setup, client):
+    response = client.get('/investment_account/2/stats?include=acb')
+    json_data = json.loads(response.data)
+    assert json_data['book_cost'] == "$4,810.98"
+    assert json_data['market_value']['total'] == "$1,656.00"
+    assert json_data['adjust_cost_base'] == {'VCN.TO': '$1,575.50'}
+
+def test_account_stats_without_acb(stats_setup, client):
+    response = client.get('/investment_account/2/stats')
+    json_data = json.loads(response.data)
+    assert 'adjust_cost_base' not in json_data
+
+def test_non_taxable_account_stats_with_acb(stats_setup, client):
+    response = client.get('/investment_account/1/stats?include=acb')
+    json_data = json.loads(response.data)
+    assert json_data['market_value']['total'] == "$5,196.00"
+    assert json_data['adjust_cost_base'] == {}
+
+def test_stats_match_acb_endpoint(stats_setup, client):
+    stats = json.loads(client.get('/investment_account/2/stats?include=acb')
+                       .data)
+    acb = json.loads(client.get('/investment_account/2/acb').data)
+    assert stats['adjust_cost_base'] == acb['adjust_cost_base']
+
+def test_stats_single_transaction_scan(stats_setup):
+    statements = []
+    def count_statement(conn, cursor, statement, *args):
+        statements.append(statement)
+    with stats_setup.app_context():
+        engine = db.get_engine()
+        event.listen(engine, 'before_cursor_execute', count_statement)
+        try:
+            stats = PortfolioStatsGenerator(1, 2, True).next()
+        finally:
+            event.remove(engine, 'before_cursor_execute', count_statement)
+    assert stats['book_cost'] == "$4,810.98"
+    assert len(statements) == 3
+    assert len([s for s in statements if 'stock_transaction' in s]) == 1
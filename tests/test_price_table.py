@@ -0,0 +1,115 @@
+from datetime import date
+import json
+import pytest
+from flaskr import db, price_table
+from flaskr.model import (
+    StockPrice,
+    StockTransaction,
+    StockTransactionType
+)
+from flaskr.utils.price_table import PriceTable
+
+
+stock_transaction_1 = dict(
+    transaction_type = StockTransactionType.buy,
+    stock_symbol = "VCN.TO",
+    cost_per_unit = 3141,
+    quantity = 100,
+    trade_fee = 999,
+    trade_date = date(2016, 4, 23),
+    account_id = None,
+    user_id = 1
+)
+
+stock_prices = [
+    dict(stock_symbol = "VCN.TO",
+         price_date = date(2019, 10, 24),
+         close_price = 3300),
+    dict(stock_symbol = "VCN.TO",
+         price_date = date(2019, 10, 25),
+         close_price = 3312),
+    dict(stock_symbol = "XAW.TO",
+         price_date = date(2019, 10, 25),
+         close_price = 2845),
+    dict(stock_symbol = "OLD.TO",
+         price_date = date(2019, 10, 24),
+         close_price = 100)
+]
+
+@pytest.fixture
+def price_table_setup(auth_app_user_1, tmp_path):
+    auth_app = auth_app_user_1
+    auth_app.config['PRICE_TABLE_PATH'] = str(tmp_path / 'prices.bin')
+    price_table.init_app(auth_app)
+    try:
+        with auth_app.app_context():
+            db.session.add(StockTransaction(**stock_transaction_1))
+            for stock_price in stock_prices:
+                db.session.add(StockPrice(**stock_price))
+            db.session.commit()
+        yield auth_app
+    except Exception as e:
+        assert False
+    finally:
+        with auth_app.app_context():
+            StockTransaction.query.delete()
+            StockPrice.query.delete()
+            db.session.commit()
+
+def test_lookup_latest_prices(tmp_path):
+    table = PriceTable(str(tmp_path / 'prices.bin'))
+    table.write([
+        ("XAW.TO", 2845, date(2019, 10, 25)),
+        ("VCN.TO", 3312, date(2019, 10, 25)),
+        ("OLD.TO", 100, date(2019, 10, 24))
+    ], 7)
+    snapshot = table.snapshot()
+    assert snapshot.version == 7
+    assert len(snapshot) == 3
+    assert snapshot.get("VCN.TO") == 3312
+    assert snapshot.get("XAW.TO") == 2845
+    assert snapshot.get("OLD.TO") is None
+    assert snapshot.get("ZZZ.TO") is None
+    assert snapshot.get("A" * 17) is None
+
+def test_missing_table_has_no_snapshot(tmp_path):
+    assert PriceTable().snapshot() is None
+    assert PriceTable(str(tmp_path / 'prices.bin')).snapshot() is None
+
+def test_replaced_table_remapped(tmp_path):
+    table = PriceTable(str(tmp_path / 'prices.bin'))
+    table.write([("VCN.TO", 3312, date(2019, 10, 25))], 1)
+    old_snapshot = table.snapshot()
+    assert table.snapshot() is old_snapshot
+    table.write([("VCN.TO", 3400, date(2019, 10, 28))], 2)
+    new_snapshot = table.snapshot()
+    assert new_snapshot.version == 2
+    assert new_snapshot.get("VCN.TO") == 3400
+    assert old_snapshot.get("VCN.TO") == 3312
+    assert [path.name for path in tmp_path.iterdir()] == ['prices.bin']
+
+def test_publish_command(price_table_setup, runner):
+    result = runner.invoke(args=['stock', 'publish'])
+    assert result.exit_code == 0
+    snapshot = price_table.snapshot()
+    with price_table_setup.app_context():
+        assert snapshot.version == db.session.query(
+            db.func.max(StockPrice.id)
+        ).scalar()
+    assert snapshot.get("VCN.TO") == 3312
+    assert snapshot.get("XAW.TO") == 2845
+    assert snapshot.get("OLD.TO") is None
+
+def test_stats_read_published_prices(price_table_setup, runner, client):
+    runner.invoke(args=['stock', 'publish'])
+    with price_table_setup.app_context():
+        StockPrice.query.delete()
+        db.session.commit()
+    response = client.get('/transaction/stats')
+    market_value = json.loads(response.data)['market_value']
+    assert market_value['total'] == "$3,312.00"
+
+def test_stats_without_table_read_database(price_table_setup, client):
+    response = client.get('/transaction/stats')
+    market_value = json.loads(response.data)['market_value']
+    assert market_value['total'] == "$3,312.00"
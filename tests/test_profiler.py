@@ -0,0 +1,68 @@
+import os
+import pytest
+from flaskr import create_app, db, request_profiler
+from flaskr.model import User
+from tests.conftest import TEST_DATABASE_URI
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        'TESTING': True,
+        'WTF_CSRF_ENABLED': False,
+        'SECRET_KEY': 'dev',
+        'SQLALCHEMY_DATABASE_URI': TEST_DATABASE_URI,
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'PROFILING': True,
+        'PROFILE_ADMIN_EMAILS': ['newton@mathematicianlineage.com'],
+        'PROFILE_DIR': str(tmp_path / 'profiles')
+    })
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.commit()
+    yield app
+
+def profile_files():
+    if not os.path.isdir(request_profiler.directory):
+        return []
+    return sorted(os.listdir(request_profiler.directory))
+
+def test_profile_header(auth_app_user_1, client):
+    response = client.get('/transaction/all', headers={'X-Profile': '1'})
+    assert response.status_code == 200
+    assert response.headers['X-Profile-File'] in profile_files()
+    assert response.headers['X-Profile-File'].endswith('.prof')
+
+def test_profile_query_argument_memory(auth_app_user_1, client):
+    response = client.get('/transaction/all?_profile=memory')
+    files = profile_files()
+    assert response.headers['X-Profile-File'] in files
+    assert len([name for name in files if name.endswith('.mem.txt')]) == 1
+
+def test_not_profiled_without_flag(auth_app_user_1, client):
+    response = client.get('/transaction/all')
+    assert 'X-Profile-File' not in response.headers
+    assert profile_files() == []
+
+def test_non_admin_not_profiled(auth_app_user_2, client):
+    response = client.get('/transaction/all', headers={'X-Profile': '1'})
+    assert response.status_code == 200
+    assert 'X-Profile-File' not in response.headers
+    assert profile_files() == []
+
+def test_profile_command(auth_app_user_1, runner):
+    result = runner.invoke(args=['perf', 'profile', '/transaction/all',
+                                 '--user', '1', '--top', '5'])
+    assert result.exit_code == 0
+    assert 'GET /transaction/all returned 200 OK' in result.output
+    assert 'cumulative' in result.output
+    assert len([name for name in profile_files()
+                if name.endswith('.prof')]) == 1
+
+def test_profile_command_unknown_user(app, runner):
+    result = runner.invoke(args=['perf', 'profile', '/transaction/all',
+                                 '--user', '5'])
+    assert result.exit_code != 0
+    assert 'No user 5' in result.output
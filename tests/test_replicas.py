@@ -0,0 +1,181 @@
+from flask import Blueprint, jsonify
+import json
+import pytest
+from flaskr import api_tokens, create_app, db, replica_router, slow_queries
+from flaskr.model import User, load_user_from_token
+from tests.conftest import requires_postgres
+
+
+pytestmark = requires_postgres
+
+REPLICA_URI = 'postgresql:///portfoliotest?options=-csearch_path%3Dreplica'
+
+replica_bp = Blueprint('replica_bp', __name__, url_prefix='/replica')
+
+@replica_bp.route('/path', methods=['GET', 'POST'])
+def search_path():
+    return jsonify(db.session.execute('SHOW search_path').scalar())
+
+@replica_bp.route('/count', methods=['GET'])
+def replica_count():
+    return jsonify(db.session.execute(
+        'SELECT count(*) FROM replica_only').scalar())
+
+@pytest.fixture
+def app(request, tmp_path):
+    app = create_app(dict({
+        'TESTING': True,
+        'WTF_CSRF_ENABLED': False,
+        'SECRET_KEY': 'dev',
+        'SQLALCHEMY_DATABASE_URI': \
+            'postgresql:///portfoliotest',
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'SQLALCHEMY_REPLICA_URIS': [
+            REPLICA_URI,
+            'postgresql://localhost:1/portfoliotest'
+        ],
+        'REPLICA_PRIMARY_ENDPOINTS': ['replica_bp.primary_path'],
+        'REPLICA_RETRY_SECONDS': 60,
+        'SLOW_QUERY_LOG': str(tmp_path / 'slow_queries.jsonl')
+    }, **getattr(request, 'param', {})))
+    app.register_blueprint(replica_bp)
+    app.add_url_rule('/replica/primary', 'replica_bp.primary_path',
+                     search_path)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.execute('DROP SCHEMA IF EXISTS replica CASCADE')
+        db.session.execute('CREATE SCHEMA replica')
+        db.session.execute('CREATE TABLE replica.portfolio_user '
+                           '(LIKE public.portfolio_user INCLUDING ALL)')
+        db.session.execute('CREATE TABLE replica.replica_only (id integer)')
+        db.session.commit()
+    yield app
+    with app.app_context():
+        db.session.execute('DROP SCHEMA replica CASCADE')
+        db.session.commit()
+
+@pytest.fixture
+def replicated_user_1(auth_app_user_1):
+    with auth_app_user_1.app_context():
+        db.session.execute('INSERT INTO replica.portfolio_user '
+                           'SELECT * FROM public.portfolio_user')
+        db.session.commit()
+    yield auth_app_user_1
+
+def test_reads_go_to_replica(app, client):
+    for i in range(3):
+        assert client.get('/replica/path').get_json() == 'replica'
+
+def test_down_replica_skipped(app, client):
+    for i in range(4):
+        assert client.get('/replica/path').get_json() == 'replica'
+    assert list(replica_router.down_until.keys()) == [1]
+
+def test_writes_and_primary_endpoints_use_primary(app, client):
+    assert client.post('/replica/path').get_json() == '"$user", public'
+    assert client.get('/replica/primary').get_json() == '"$user", public'
+
+def test_falls_back_to_primary(app, client):
+    replica_router.down_until[0] = float('inf')
+    replica_router.down_until[1] = float('inf')
+    assert client.get('/replica/path').get_json() == '"$user", public'
+
+def create_account(client):
+    response = client.post('/investment_account', data=json.dumps(dict(
+        name = 'TFSA',
+        taxable = False
+    )))
+    assert response.get_json()['name'] == 'TFSA'
+
+def catch_up_replica(app):
+    with app.app_context():
+        db.session.execute('UPDATE replica.portfolio_user SET data_version '
+                           '= data_version + 1 WHERE id = 1')
+        db.session.commit()
+
+def test_read_your_writes(replicated_user_1, client):
+    client.get('/replica/path')
+    create_account(client)
+    assert client.get('/replica/path').get_json() == '"$user", public'
+    catch_up_replica(replicated_user_1)
+    assert client.get('/replica/path').get_json() == 'replica'
+
+def test_read_your_writes_across_processes(replicated_user_1, client):
+    create_account(client)
+    # another process starts without any record of the write
+    replica_router.init_app(replicated_user_1, db)
+    assert client.get('/replica/path').get_json() == '"$user", public'
+
+def test_read_your_writes_window(replicated_user_1, client):
+    replicated_user_1.config['REPLICA_READ_YOUR_WRITES_SECONDS'] = 0
+    replica_router.init_app(replicated_user_1, db)
+    create_account(client)
+    assert client.get('/replica/path').get_json() == 'replica'
+
+def test_read_your_writes_only_for_writer(replicated_user_1, client):
+    with replicated_user_1.app_context():
+        User.bump_data_version(2)
+        db.session.commit()
+    assert client.get('/replica/path').get_json() == 'replica'
+
+def test_bearer_read_your_writes(app, client):
+    app.login_manager.request_loader(load_user_from_token)
+    with app.app_context():
+        user = User(email="newton@mathematicianlineage.com", password_hash="")
+        db.session.add(user)
+        db.session.commit()
+        db.session.execute('INSERT INTO replica.portfolio_user '
+                           'SELECT * FROM public.portfolio_user')
+        db.session.commit()
+        token = api_tokens.dumps(user.id, user.data_version)
+    # a client that never sends cookies back
+    client.cookie_jar.clear()
+    headers = {'Authorization': 'Bearer %s' % token}
+    assert client.get('/replica/path', headers=headers).get_json() == \
+        'replica'
+    response = client.post('/investment_account', headers=headers,
+                           data=json.dumps(dict(name = 'TFSA',
+                                                taxable = False)))
+    assert response.get_json()['name'] == 'TFSA'
+    assert 'Set-Cookie' not in response.headers
+    client.cookie_jar.clear()
+    assert client.get('/replica/path', headers=headers).get_json() == \
+        '"$user", public'
+    catch_up_replica(app)
+    assert client.get('/replica/path', headers=headers).get_json() == \
+        'replica'
+
+def test_listing_served_by_replica(replicated_user_1, client):
+    with replicated_user_1.app_context():
+        db.session.execute('CREATE TABLE replica.investment_account '
+                           '(LIKE public.investment_account INCLUDING ALL)')
+        db.session.execute("INSERT INTO replica.investment_account "
+                           "(name, taxable, user_id) "
+                           "VALUES ('replica account', false, 1)")
+        db.session.commit()
+    response = client.get('/investment_account/all')
+    assert [account['name'] for account in response.get_json()] == \
+        ['replica account']
+
+@pytest.mark.parametrize('app', [dict(
+    REQUEST_TIMING = True,
+    SLOW_QUERY_MS = 0,
+    SLOW_QUERY_EXPLAIN_RATE = 1.0,
+    REPLICA_PRIMARY_ENDPOINTS = ['metrics_bp.get_metrics']
+)], indirect=True)
+def test_replica_statements_instrumented(app, client):
+    response = client.get('/replica/count')
+    assert response.get_json() == 0
+    assert 'desc="0 statements"' not in response.headers['Server-Timing']
+    slow_queries.drain()
+    records = [record for record in slow_queries.read()
+               if record['route'] == 'replica_bp.replica_count' and
+               'replica_only' in record['statement']]
+    # the plan can only come from the replica, the primary has no such table
+    assert 'replica_only' in records[0]['plan']
+    lines = client.get('/metrics').data.decode('utf-8').splitlines()
+    assert any(line.startswith('portfolio_db_pool_checkout_seconds_count{'
+                               'database="replica_0"} ')
+               for line in lines)
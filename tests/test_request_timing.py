@@ -0,0 +1,91 @@
+from datetime import date
+import logging
+import pytest
+from flaskr import create_app, db
+from flaskr.model import (
+    StockTransaction,
+    StockTransactionType
+)
+from flaskr.utils.request_timing import format_server_timing
+from tests.conftest import TEST_DATABASE_URI
+
+
+stock_transaction_1 = dict(
+    transaction_type = StockTransactionType.buy,
+    stock_symbol = "VCN.TO",
+    cost_per_unit = 3141,
+    quantity = 100,
+    trade_fee = 999,
+    trade_date = date(2016, 4, 23),
+    account_id = None,
+    user_id = 1
+)
+
+@pytest.fixture
+def app():
+    app = create_app({
+        'TESTING': True,
+        'WTF_CSRF_ENABLED': False,
+        'SECRET_KEY': 'dev',
+        'SQLALCHEMY_DATABASE_URI': TEST_DATABASE_URI,
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'REQUEST_TIMING': True,
+        'REQUEST_TIMING_SLOW_MS': 0
+    })
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.commit()
+    yield app
+
+@pytest.fixture
+def timing_setup(auth_app_user_1):
+    auth_app = auth_app_user_1
+    try:
+        with auth_app.app_context():
+            db.session.add(StockTransaction(**stock_transaction_1))
+            db.session.commit()
+        yield auth_app
+    except Exception as e:
+        assert False
+    finally:
+        with auth_app.app_context():
+            StockTransaction.query.delete()
+            db.session.commit()
+
+def parse_server_timing(header):
+    metrics = {}
+    for metric in header.split(', '):
+        parts = metric.split(';')
+        metrics[parts[0]] = dict(part.split('=', 1) for part in parts[1:])
+    return metrics
+
+def test_server_timing_header(timing_setup, client):
+    response = client.get('/transaction/stats')
+    metrics = parse_server_timing(response.headers['Server-Timing'])
+    assert set(metrics.keys()) == {'db', 'serialize', 'total'}
+    assert metrics['db']['desc'] != '"0 statements"'
+    assert float(metrics['serialize']['dur']) > 0
+    assert float(metrics['total']['dur']) >= float(metrics['db']['dur'])
+
+def test_slow_request_logged(timing_setup, client, caplog):
+    with caplog.at_level(logging.WARNING):
+        client.get('/transaction/all')
+    messages = [record.getMessage() for record in caplog.records]
+    assert messages[0].startswith('Slow request GET /transaction/all')
+    assert any('stock_transaction' in message for message in messages[1:])
+
+def test_disabled_without_config(timing_setup):
+    plain_app = create_app({
+        'TESTING': True,
+        'SECRET_KEY': 'dev',
+        'SQLALCHEMY_DATABASE_URI': TEST_DATABASE_URI,
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False
+    })
+    response = plain_app.test_client().get('/auth/login')
+    assert 'Server-Timing' not in response.headers
+
+def test_format_server_timing():
+    assert format_server_timing(1.5, 3, 0.25, 4) == \
+        'db;dur=1.50;desc="3 statements", serialize;dur=0.25, total;dur=4.00'
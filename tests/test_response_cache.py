@@ -0,0 +1,128 @@
+from datetime import date
+import json
+import pytest
+from flaskr import db, ledger_cache, response_cache
+from flaskr.model import (
+    StockPrice,
+    StockTransaction,
+    StockTransactionType
+)
+from flaskr.utils.response_cache import FileSystemBackend, LocalBackend
+
+
+stock_transaction_1 = dict(
+    transaction_type = StockTransactionType.buy,
+    stock_symbol = "VCN.TO",
+    cost_per_unit = 3141,
+    quantity = 100,
+    trade_fee = 999,
+    trade_date = date(2016, 4, 23),
+    account_id = None,
+    user_id = 1
+)
+
+stock_price_1 = dict(
+    stock_symbol = "VCN.TO",
+    price_date = date(2019, 10, 25),
+    close_price = 3312
+)
+
+@pytest.fixture
+def cache_setup(auth_app_user_1):
+    auth_app = auth_app_user_1
+    try:
+        with auth_app.app_context():
+            db.session.add(StockTransaction(**stock_transaction_1))
+            db.session.commit()
+        yield auth_app
+    except Exception as e:
+        assert False
+    finally:
+        with auth_app.app_context():
+            StockTransaction.query.delete()
+            StockPrice.query.delete()
+            db.session.commit()
+
+@pytest.fixture
+def filesystem_cache_setup(cache_setup, tmp_path):
+    cache_setup.config['RESPONSE_CACHE_BACKEND'] = 'filesystem'
+    cache_setup.config['RESPONSE_CACHE_DIR'] = str(tmp_path)
+    response_cache.init_app(cache_setup)
+    yield cache_setup
+
+def test_repeated_stats_served_from_cache(cache_setup, client):
+    first = client.get('/transaction/stats')
+    second = client.get('/transaction/stats')
+    assert first.data == second.data
+    assert second.mimetype == 'application/json'
+    assert response_cache.stats()['hits'] == 1
+    assert ledger_cache.stats()['misses'] == 1
+    assert ledger_cache.stats()['hits'] == 0
+
+def test_query_string_is_part_of_key(cache_setup, client):
+    client.get('/investment_account/1/stats')
+    client.get('/investment_account/1/stats?include=acb')
+    assert response_cache.stats()['misses'] == 2
+
+def test_write_changes_cached_stats(cache_setup, client):
+    client.get('/transaction/stats')
+    client.delete('/transaction/1')
+    response = client.get('/transaction/stats')
+    assert json.loads(response.data)['book_cost'] == "N/A"
+    assert response_cache.stats()['hits'] == 0
+
+def test_new_prices_change_cached_stats(cache_setup, client):
+    response = client.get('/transaction/stats')
+    assert json.loads(response.data)['market_value']['total'] == "$0.00"
+    with cache_setup.app_context():
+        db.session.add(StockPrice(**stock_price_1))
+        db.session.commit()
+    response = client.get('/transaction/stats')
+    assert json.loads(response.data)['market_value']['total'] == "$3,312.00"
+
+def test_filesystem_backend_shared(filesystem_cache_setup, client, tmp_path):
+    first = client.get('/transaction/stats')
+    assert len(list(tmp_path.iterdir())) == 1
+    cached_file = next(tmp_path.iterdir())
+    assert cached_file.read_bytes() == first.data
+    second = client.get('/transaction/stats')
+    assert second.data == first.data
+    assert response_cache.stats()['hits'] == 1
+
+def test_clear_shared_only_clears_filesystem(filesystem_cache_setup, client,
+                                              tmp_path):
+    client.get('/transaction/stats')
+    response_cache.clear_shared()
+    assert list(tmp_path.iterdir()) == []
+    filesystem_cache_setup.config['RESPONSE_CACHE_BACKEND'] = 'local'
+    response_cache.init_app(filesystem_cache_setup)
+    client.get('/transaction/stats')
+    response_cache.clear_shared()
+    client.get('/transaction/stats')
+    assert response_cache.stats()['hits'] == 1
+
+def test_filesystem_backend_prune(tmp_path):
+    backend = FileSystemBackend(str(tmp_path), max_entries=2)
+    for i in range(3):
+        backend.set(str(i), b'{}')
+    backend.prune()
+    assert len(list(tmp_path.iterdir())) == 2
+    backend.clear()
+    assert backend.get('2') is None
+
+def test_local_backend_evicts_least_recently_used():
+    backend = LocalBackend(max_entries=2)
+    backend.set('a', b'1')
+    backend.set('b', b'2')
+    backend.get('a')
+    backend.set('c', b'3')
+    assert backend.get('b') is None
+    assert backend.get('a') == b'1'
+
+def test_failed_view_not_cached(cache_setup, client):
+    first = client.get('/transaction/history?interval=year')
+    second = client.get('/transaction/history?interval=year')
+    assert first.get_json() is None
+    assert second.get_json() is None
+    assert response_cache.stats()['hits'] == 0
+    assert response_cache.stats()['misses'] == 2
@@ -0,0 +1,115 @@
+from datetime import date
+import json
+import pytest
+from flaskr import db
+from flaskr.model import (
+    InvestmentAccount,
+    StockPrice,
+    StockTransaction,
+    StockTransactionType,
+    User
+)
+from flaskr.utils.synthetic_data import (
+    PortfolioGenerator,
+    RowStream,
+    make_symbol
+)
+
+
+SEED_ARGS = ['perf', 'seed', '--users', '3', '--accounts', '2',
+             '--transactions', '40', '--symbols', '6', '--years', '1',
+             '--end', '2019-12-31', '--seed', '7']
+
+@pytest.fixture
+def seeded_app(app, runner):
+    result = runner.invoke(args=SEED_ARGS)
+    assert result.exit_code == 0
+    assert result.output == \
+        "Seeded 3 users, 6 accounts, 240 transactions and 1572 prices\n"
+    yield app
+
+def transaction_rows():
+    return [(t.account_id,
+             t.transaction_type,
+             t.stock_symbol,
+             t.cost_per_unit,
+             t.quantity,
+             t.trade_fee,
+             t.trade_date)
+            for t in StockTransaction.query.order_by(StockTransaction.id)]
+
+def test_seed_loads_rows(seeded_app):
+    with seeded_app.app_context():
+        users = User.query.order_by(User.id).all()
+        assert [user.email for user in users] == [
+            'seed-7-0@example.com',
+            'seed-7-1@example.com',
+            'seed-7-2@example.com'
+        ]
+        assert users[0].check_password('password')
+        assert InvestmentAccount.query.count() == 6
+        assert InvestmentAccount.query.filter_by(taxable=True).count() == 3
+        assert StockTransaction.query.count() == 240
+        latest = db.session.query(db.func.max(StockPrice.price_date)).scalar()
+        assert latest.date() == date(2019, 12, 31)
+
+def test_seed_never_sells_more_than_held(seeded_app):
+    with seeded_app.app_context():
+        held = {}
+        for account_id, transaction_type, symbol, cost, quantity, fee, day \
+                in transaction_rows():
+            key = (account_id, symbol)
+            if transaction_type == StockTransactionType.buy:
+                held[key] = held.get(key, 0) + quantity
+            elif transaction_type == StockTransactionType.sell:
+                assert 0 < quantity <= held[key]
+                held[key] -= quantity
+            else:
+                assert quantity == held[key]
+
+def test_seed_is_deterministic(seeded_app, runner):
+    with seeded_app.app_context():
+        first = transaction_rows()
+        StockTransaction.query.delete()
+        InvestmentAccount.query.delete()
+        User.query.delete()
+        db.session.commit()
+    runner.invoke(args=SEED_ARGS)
+    with seeded_app.app_context():
+        second = transaction_rows()
+    strip_ids = lambda rows: [row[1:] for row in rows]
+    assert strip_ids(first) == strip_ids(second)
+
+def test_seeded_user_stats(seeded_app, client):
+    with seeded_app.app_context():
+        account = InvestmentAccount.query.filter_by(taxable=True).first()
+        user_id = account.user_id
+        account_id = account.id
+    @seeded_app.login_manager.request_loader
+    def load_user_from_request(request):
+        return User.query.get(user_id)
+    response = client.get('/investment_account/%d/stats?include=acb'
+                          % account_id)
+    stats = json.loads(response.data)
+    assert stats['book_cost'].startswith('$')
+    assert stats['market_value']['total'].startswith('$')
+    assert len(stats['adjust_cost_base']) > 0
+
+def test_row_stream_reads_csv():
+    stream = RowStream(('VCN.TO', i) for i in range(3))
+    assert stream.read(5) == 'VCN.T'
+    assert stream.read() == 'O,0\r\nVCN.TO,1\r\nVCN.TO,2\r\n'
+    assert stream.read(5) == ''
+
+def test_make_symbol():
+    assert make_symbol(0) == 'AAA.TO'
+    assert make_symbol(1) == 'AAB'
+    assert make_symbol(26 ** 3) == 'BAAA'
+    assert len(set(make_symbol(i) for i in range(1000))) == 1000
+
+def test_price_history_weekdays():
+    generator = PortfolioGenerator(1, 1, 1, symbols=2, years=1,
+                                   end=date(2019, 12, 31))
+    assert all(day.weekday() < 5 for day in generator.prices.days)
+    assert len(list(generator.prices.rows())) == \
+        2 * len(generator.prices.days)
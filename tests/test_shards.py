@@ -0,0 +1,242 @@
+from datetime import date
+import json
+import pytest
+import threading
+import time
+from sqlalchemy import create_engine
+from flaskr import create_app, db, move_user_to_shard, shard_router
+from flaskr.model import (
+    HoldingSnapshot,
+    HoldingSnapshotState,
+    InvestmentAccount,
+    StockMarker,
+    StockTransaction,
+    StockTransactionType,
+    User,
+    UserShard
+)
+from flaskr.utils.shards import DEFAULT_SHARD, ShardEntry
+from tests.conftest import requires_postgres
+
+
+pytestmark = requires_postgres
+
+SHARD_URIS = {
+    'a': 'postgresql:///portfoliotest_shard_a',
+    'b': 'postgresql:///portfoliotest_shard_b'
+}
+
+stock_transaction_1 = dict(
+    transaction_type = StockTransactionType.buy,
+    stock_symbol = "VCN.TO",
+    cost_per_unit = 3141,
+    quantity = 100,
+    trade_fee = 999,
+    trade_date = date(2016, 4, 23),
+    user_id = 1
+)
+
+def create_shard_databases():
+    engine = create_engine('postgresql:///portfoliotest',
+                           isolation_level='AUTOCOMMIT')
+    try:
+        existing = set(row[0] for row in engine.execute(
+            'SELECT datname FROM pg_database'))
+        for uri in SHARD_URIS.values():
+            name = uri.rsplit('/', 1)[1]
+            if name not in existing:
+                engine.execute('CREATE DATABASE %s' % name)
+    finally:
+        engine.dispose()
+
+@pytest.fixture
+def app():
+    create_shard_databases()
+    app = create_app({
+        'TESTING': True,
+        'WTF_CSRF_ENABLED': False,
+        'SECRET_KEY': 'dev',
+        'SQLALCHEMY_DATABASE_URI': \
+            'postgresql:///portfoliotest',
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'SQLALCHEMY_SHARD_URIS': SHARD_URIS,
+        'SHARD_MAP_TTL': 0
+    })
+
+    with app.app_context():
+        tables = [User.__table__, InvestmentAccount.__table__,
+                  StockTransaction.__table__, HoldingSnapshot.__table__,
+                  HoldingSnapshotState.__table__]
+        for shard in SHARD_URIS:
+            db.Model.metadata.drop_all(bind=shard_router.engine(shard),
+                                       tables=tables)
+        db.drop_all()
+        db.create_all()
+        db.session.commit()
+    yield app
+    with app.app_context():
+        StockMarker.query.delete()
+        db.session.commit()
+
+@pytest.fixture
+def shard_setup(auth_app_user_1, runner):
+    app = auth_app_user_1
+    with app.app_context():
+        account = InvestmentAccount(name='TFSA', taxable=False, user_id=1)
+        db.session.add(account)
+        db.session.flush()
+        db.session.add(StockTransaction(account_id=account.id,
+                                        **stock_transaction_1))
+        db.session.add(StockTransaction(account_id=None,
+                                        **stock_transaction_1))
+        db.session.add(StockTransaction(**dict(stock_transaction_1,
+                                               user_id=2)))
+        db.session.commit()
+    for shard in SHARD_URIS:
+        result = runner.invoke(args=['shard', 'init', shard])
+        assert result.exit_code == 0
+    yield app
+
+def shard_counts(app, shard, user_id,
+                 tables=('investment_account', 'stock_transaction')):
+    with app.app_context():
+        engine = shard_router.engine(shard)
+        return tuple(engine.execute(
+            'SELECT count(*) FROM %s WHERE user_id = %d' % (table, user_id)
+        ).scalar() for table in tables)
+
+def move(runner, user_id, shard):
+    result = runner.invoke(args=['shard', 'move-user', str(user_id), shard,
+                                 '--wait', '0'])
+    assert result.exit_code == 0, result.output
+    return result
+
+def test_move_user(shard_setup, client, runner):
+    result = move(runner, 1, 'a')
+    assert 'Moved 1 accounts and 2 transactions of user 1 to a' in \
+        result.output
+    assert shard_counts(shard_setup, 'a', 1) == (1, 2)
+    assert shard_counts(shard_setup, 'default', 1) == (0, 0)
+    assert shard_counts(shard_setup, 'default', 2) == (0, 1)
+    with shard_setup.app_context():
+        assert UserShard.query.get(1).shard == 'a'
+        assert User.query.get(1).data_version == 2
+
+def test_reads_and_writes_use_shard(shard_setup, client, runner):
+    move(runner, 1, 'a')
+    accounts = client.get('/investment_account/all').get_json()
+    assert [account['name'] for account in accounts] == ['TFSA']
+    transactions = client.get('/transaction/all').get_json()
+    assert len(transactions) == 2
+    assert sorted(transaction['account_id'] is None
+                  for transaction in transactions) == [False, True]
+    assert [transaction['account_id'] for transaction in transactions
+            if transaction['account_id'] is not None] == [accounts[0]['id']]
+    response = client.post('/transaction/', data=json.dumps(dict(
+        transaction_type = 'sell',
+        stock_symbol = "XAW.TO",
+        cost_per_unit = "27.18",
+        quantity = 200,
+        trade_fee = "9.99",
+        trade_date = date(2016, 11, 11).isoformat(),
+        account_id = None,
+        user_id = 1
+    )))
+    assert response.get_json()['stock_symbol'] == 'XAW.TO'
+    assert shard_counts(shard_setup, 'a', 1) == (1, 3)
+    assert shard_counts(shard_setup, 'default', 1) == (0, 0)
+    assert client.get('/transaction/stats').status_code == 200
+
+def test_writes_rejected_while_moving(shard_setup, client):
+    with shard_setup.app_context():
+        db.session.add(UserShard(user_id=1, shard='default', moving_to='a'))
+        db.session.commit()
+    response = client.delete('/transaction/1')
+    assert response.status_code == 503
+    assert response.get_json()['error'] == 'shard_moving'
+    assert len(client.get('/transaction/all').get_json()) == 2
+    assert shard_counts(shard_setup, 'default', 1) == (1, 2)
+
+def test_move_between_shards_and_back(shard_setup, client, runner):
+    move(runner, 1, 'a')
+    move(runner, 1, 'b')
+    assert shard_counts(shard_setup, 'a', 1) == (0, 0)
+    assert shard_counts(shard_setup, 'b', 1) == (1, 2)
+    move(runner, 1, 'default')
+    assert shard_counts(shard_setup, 'b', 1) == (0, 0)
+    assert shard_counts(shard_setup, 'default', 1) == (1, 2)
+    with shard_setup.app_context():
+        assert shard_router.engine('b').execute(
+            'SELECT count(*) FROM portfolio_user').scalar() == 0
+    assert len(client.get('/transaction/all').get_json()) == 2
+
+def test_for_user_outside_requests(shard_setup, runner):
+    move(runner, 1, 'a')
+    with shard_setup.app_context():
+        assert StockTransaction.query.count() == 1
+        with shard_router.for_user(1):
+            assert StockTransaction.query.count() == 2
+            assert InvestmentAccount.query.one().name == 'TFSA'
+
+def test_move_unknown_shard(shard_setup, runner):
+    result = runner.invoke(args=['shard', 'move-user', '1', 'c'])
+    assert result.exit_code != 0
+    assert 'Unknown shard c' in result.output
+
+def test_snapshots_on_shard(shard_setup, client, runner):
+    result = runner.invoke(args=['snapshot', 'build'])
+    assert result.exit_code == 0, result.output
+    assert shard_counts(shard_setup, 'default', 1,
+                        ('holding_snapshot', 'holding_snapshot_state')) == \
+        (2, 1)
+    move(runner, 1, 'a')
+    assert shard_counts(shard_setup, 'default', 1,
+                        ('holding_snapshot', 'holding_snapshot_state')) == \
+        (0, 0)
+    result = runner.invoke(args=['snapshot', 'build'])
+    assert 'Built the snapshots of 1 users, wrote 2 rows' in result.output
+    assert shard_counts(shard_setup, 'a', 1,
+                        ('holding_snapshot', 'holding_snapshot_state')) == \
+        (2, 1)
+    acb = client.get('/investment_account/%d/acb?as_of=2016-04-23' %
+                     client.get('/investment_account/all').get_json()[0]['id'])
+    assert acb.get_json() == dict(adjust_cost_base = {})
+
+def test_generate_markers_scans_shards(shard_setup, runner):
+    move(runner, 1, 'a')
+    with shard_setup.app_context():
+        shard_router.engine('a').execute(
+            "UPDATE stock_transaction SET stock_symbol = 'xaw.to' "
+            "WHERE user_id = 1")
+    result = runner.invoke(args=['stock', 'generate'])
+    assert result.exit_code == 0, result.output
+    with shard_setup.app_context():
+        assert sorted(marker.stock_symbol for marker in
+                      StockMarker.query) == ['VCN.TO', 'XAW.TO']
+
+def test_stale_shard_map_reads_during_move(shard_setup, client, monkeypatch):
+    sleeps = []
+    reads = []
+    def read_with_stale_map():
+        # another process that still maps the user to the old shard
+        with shard_router.lock:
+            shard_router.entries[1] = ShardEntry(DEFAULT_SHARD, None,
+                                                 float('inf'))
+        reads.append(client.get('/transaction/stats').get_json())
+        with shard_setup.app_context():
+            reads.append(User.query.get(1).data_version)
+    def sleep(seconds):
+        sleeps.append(seconds)
+        if len(sleeps) == 2:
+            thread = threading.Thread(target=read_with_stale_map)
+            thread.start()
+            thread.join()
+    monkeypatch.setattr(time, 'sleep', sleep)
+    with shard_setup.app_context():
+        assert move_user_to_shard(1, 'a', 5) == (1, 2)
+        data_version = User.query.get(1).data_version
+    shard_router.invalidate(1)
+    assert sleeps == [5, 5]
+    assert reads[0] == client.get('/transaction/stats').get_json()
+    assert reads[0]['book_cost'] != '$0.00'
+    assert data_version > reads[1]
@@ -0,0 +1,135 @@
+import json
+import pytest
+import threading
+from flask import jsonify
+from flaskr.utils.single_flight import SingleFlight
+
+
+def start_waiters(flight, key, fn, count):
+    """
+    Starts count threads calling flight.do(key, fn) and returns them with the
+    list their results are appended to
+    """
+    results = []
+    def call():
+        try:
+            results.append(flight.do(key, fn))
+        except Exception as e:
+            results.append(e)
+    threads = [threading.Thread(target=call) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+def wait_for_waiters(flight, count):
+    while flight.stats()['coalesced'] < count:
+        threading.Event().wait(0.001)
+
+def test_concurrent_calls_share_result():
+    flight = SingleFlight()
+    release = threading.Event()
+    executions = []
+    def compute():
+        executions.append(1)
+        release.wait()
+        return 42
+    threads, results = start_waiters(flight, 'key', compute, 4)
+    wait_for_waiters(flight, 3)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert results == [42, 42, 42, 42]
+    assert len(executions) == 1
+    stats = flight.stats()
+    assert stats['executions'] == 1
+    assert stats['coalesced'] == 3
+    assert stats['coalesced_rate'] == 0.75
+    assert stats['in_flight'] == 0
+
+def test_error_shared_with_waiters():
+    flight = SingleFlight()
+    release = threading.Event()
+    def compute():
+        release.wait()
+        raise ValueError("bad data")
+    threads, results = start_waiters(flight, 'key', compute, 2)
+    wait_for_waiters(flight, 1)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(results) == 2
+    assert all(isinstance(result, ValueError) for result in results)
+
+def test_sequential_calls_recompute():
+    flight = SingleFlight()
+    assert flight.do('key', lambda: 1) == 1
+    assert flight.do('key', lambda: 2) == 2
+    assert flight.stats()['coalesced'] == 0
+
+def test_different_keys_not_coalesced():
+    flight = SingleFlight()
+    release = threading.Event()
+    threads_a, results_a = start_waiters(flight, 'a', release.wait, 1)
+    assert flight.do('b', lambda: 'b') == 'b'
+    release.set()
+    threads_a[0].join()
+    assert flight.stats()['executions'] == 2
+
+def test_waiter_timeout_computes_itself():
+    flight = SingleFlight(timeout=0.01)
+    release = threading.Event()
+    threads, results = start_waiters(flight, 'key', release.wait, 1)
+    while flight.stats()['in_flight'] == 0:
+        threading.Event().wait(0.001)
+    assert flight.do('key', lambda: 'own result') == 'own result'
+    release.set()
+    threads[0].join()
+
+def test_coalesced_view(app):
+    flight = SingleFlight()
+    release = threading.Event()
+    @flight.coalesced_view(lambda: 'stats')
+    def view():
+        release.wait()
+        return jsonify(dict(total = "$1.00"))
+    responses = []
+    def request():
+        with app.test_request_context():
+            responses.append(view())
+    threads = [threading.Thread(target=request) for i in range(2)]
+    for thread in threads:
+        thread.start()
+    wait_for_waiters(flight, 1)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(responses) == 2
+    for response in responses:
+        assert response.mimetype == 'application/json'
+        assert json.loads(response.get_data()) == dict(total = "$1.00")
+    assert flight.stats()['executions'] == 1
+
+def test_coalesced_view_null_not_shared(app):
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+    @flight.coalesced_view(lambda: 'stats')
+    def view():
+        calls.append(1)
+        if len(calls) == 1:
+            release.wait()
+            return jsonify(None)
+        return jsonify(dict(total = "$1.00"))
+    responses = []
+    def request():
+        with app.test_request_context():
+            responses.append(json.loads(view().get_data()))
+    threads = [threading.Thread(target=request) for i in range(2)]
+    for thread in threads:
+        thread.start()
+    wait_for_waiters(flight, 1)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert sorted(responses, key=str) == [None, dict(total = "$1.00")]
+    assert len(calls) == 2
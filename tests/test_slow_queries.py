@@ -0,0 +1,99 @@
+from datetime import date
+import pytest
+from flaskr import create_app, db, slow_queries
+from flaskr.model import (
+    StockTransaction,
+    StockTransactionType
+)
+from flaskr.utils.slow_queries import parameter_shape
+from tests.conftest import requires_postgres
+
+
+pytestmark = requires_postgres
+
+stock_transaction_1 = dict(
+    transaction_type = StockTransactionType.buy,
+    stock_symbol = "VCN.TO",
+    cost_per_unit = 3141,
+    quantity = 100,
+    trade_fee = 999,
+    trade_date = date(2016, 4, 23),
+    account_id = None,
+    user_id = 1
+)
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        'TESTING': True,
+        'WTF_CSRF_ENABLED': False,
+        'SECRET_KEY': 'dev',
+        'SQLALCHEMY_DATABASE_URI': \
+            'postgresql:///portfoliotest',
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'SLOW_QUERY_MS': 0,
+        'SLOW_QUERY_EXPLAIN_RATE': 1.0,
+        'SLOW_QUERY_LOG': str(tmp_path / 'slow_queries.jsonl')
+    })
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.commit()
+    yield app
+
+@pytest.fixture
+def slow_query_setup(auth_app_user_1):
+    auth_app = auth_app_user_1
+    try:
+        with auth_app.app_context():
+            db.session.add(StockTransaction(**stock_transaction_1))
+            db.session.commit()
+        yield auth_app
+    except Exception as e:
+        assert False
+    finally:
+        with auth_app.app_context():
+            StockTransaction.query.delete()
+            db.session.commit()
+
+def ledger_records():
+    slow_queries.drain()
+    return [record for record in slow_queries.read()
+            if record['route'] == 'stock_transaction_bp.get_all_transaction']
+
+def test_slow_select_explained(slow_query_setup, client):
+    client.get('/transaction/all')
+    records = ledger_records()
+    assert len(records) > 0
+    record = [record for record in records
+              if 'FROM stock_transaction' in record['statement']][0]
+    assert record['parameters'] == dict(user_id_1 = 'int')
+    assert 'actual time' in record['plan']
+    assert 'Buffers' in record['plan'] or 'Planning' in record['plan']
+
+def test_writes_not_explained(slow_query_setup, client):
+    client.delete('/transaction/1')
+    slow_queries.drain()
+    writes = [record for record in slow_queries.read()
+              if record['statement'].startswith('DELETE')]
+    assert len(writes) == 1
+    assert writes[0]['plan'] is None
+    with slow_query_setup.app_context():
+        assert StockTransaction.query.count() == 0
+
+def test_slow_queries_command(slow_query_setup, client, runner):
+    client.get('/transaction/all')
+    slow_queries.drain()
+    result = runner.invoke(args=['perf', 'slow-queries', '--plans',
+                                 '--sort', 'duration', '--limit', '100'])
+    assert result.exit_code == 0
+    assert 'stock_transaction_bp.get_all_transaction' in result.output
+    assert '| ' in result.output
+
+def test_parameter_shape():
+    assert parameter_shape(dict(user_id = 1, symbol = 'VCN.TO')) == \
+        dict(user_id = 'int', symbol = 'str')
+    assert parameter_shape((1, None)) == ['int', 'NoneType']
+    assert parameter_shape([dict(id = 1), dict(id = 2)], True) == \
+        dict(rows = 2, row = dict(id = 'int'))
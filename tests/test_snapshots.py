@@ -0,0 +1,150 @@
+from datetime import date
+import pytest
+from flaskr import db
+from flaskr.ledger import Ledger
+from flaskr.model import (
+    HoldingSnapshot,
+    HoldingSnapshotState,
+    InvestmentAccount,
+    StockPrice,
+    StockTransaction,
+    StockTransactionType,
+    User
+)
+from flaskr.snapshots import build_snapshots, snapshot_rows, stale_user_ids
+
+
+def transaction(transaction_type, quantity, cost_per_unit, trade_date,
+                account_id=1, stock_symbol="VCN.TO"):
+    return StockTransaction(
+        transaction_type = transaction_type,
+        stock_symbol = stock_symbol,
+        cost_per_unit = cost_per_unit,
+        quantity = quantity,
+        trade_fee = 999,
+        trade_date = trade_date,
+        account_id = account_id,
+        user_id = 1
+    )
+
+@pytest.fixture
+def snapshot_setup(auth_app_user_1):
+    auth_app = auth_app_user_1
+    try:
+        with auth_app.app_context():
+            db.session.add(InvestmentAccount(name="Taxable", taxable=True,
+                                             user_id=1))
+            db.session.add(StockPrice(stock_symbol="VCN.TO",
+                                      price_date=date(2020, 1, 1),
+                                      close_price=1000))
+            db.session.add(transaction(StockTransactionType.buy, 10, 1000,
+                                       date(2020, 1, 2)))
+            db.session.add(transaction(StockTransactionType.buy, 10, 1200,
+                                       date(2020, 1, 2)))
+            db.session.add(transaction(StockTransactionType.sell, 5, 1300,
+                                       date(2020, 1, 4)))
+            db.session.add(transaction(StockTransactionType.buy, 3, 2000,
+                                       date(2020, 1, 3), account_id=None,
+                                       stock_symbol="VAB.TO"))
+            db.session.commit()
+        yield auth_app
+    finally:
+        with auth_app.app_context():
+            HoldingSnapshot.query.delete()
+            HoldingSnapshotState.query.delete()
+            StockTransaction.query.delete()
+            InvestmentAccount.query.delete()
+            StockPrice.query.delete()
+            db.session.commit()
+
+def snapshots(app):
+    with app.app_context():
+        return [(row.snapshot_date.date(), row.account_id, row.stock_symbol,
+                 row.quantity, row.book_cost)
+                for row in HoldingSnapshot.query.order_by(
+                    HoldingSnapshot.snapshot_date,
+                    HoldingSnapshot.account_id)]
+
+def test_snapshot_rows(snapshot_setup):
+    with snapshot_setup.app_context():
+        rows = snapshot_rows(Ledger.load(1))
+    assert rows == [
+        (date(2020, 1, 2).toordinal(), 1, "VCN.TO", 20, 23998),
+        (date(2020, 1, 3).toordinal(), -1, "VAB.TO", 3, 6999),
+        (date(2020, 1, 4).toordinal(), 1, "VCN.TO", 15, 17998)
+    ]
+
+def test_build(snapshot_setup, runner):
+    result = runner.invoke(args=['snapshot', 'build'])
+    assert 'Built the snapshots of 2 users, wrote 3 rows' in result.output
+    assert snapshots(snapshot_setup) == [
+        (date(2020, 1, 2), 1, "VCN.TO", 20, 23998),
+        (date(2020, 1, 3), -1, "VAB.TO", 3, 6999),
+        (date(2020, 1, 4), 1, "VCN.TO", 15, 17998)
+    ]
+    with snapshot_setup.app_context():
+        assert stale_user_ids() == []
+    result = runner.invoke(args=['snapshot', 'build'])
+    assert 'Built the snapshots of 0 users, wrote 0 rows' in result.output
+
+def test_build_incremental(snapshot_setup):
+    with snapshot_setup.app_context():
+        build_snapshots(1)
+        build_snapshots(2)
+        db.session.add(transaction(StockTransactionType.buy, 1, 1000,
+                                   date(2020, 1, 6)))
+        User.bump_data_version(1)
+        db.session.commit()
+        assert stale_user_ids() == [1]
+        assert build_snapshots(1) == 1
+        db.session.add(transaction(StockTransactionType.buy, 1, 1000,
+                                   date(2020, 1, 3)))
+        User.bump_data_version(1)
+        db.session.commit()
+        assert build_snapshots(1) == 4
+        assert build_snapshots(1) == 0
+    assert [(row[0], row[3]) for row in snapshots(snapshot_setup)
+            if row[2] == "VCN.TO"] == [
+        (date(2020, 1, 2), 20),
+        (date(2020, 1, 3), 21),
+        (date(2020, 1, 4), 16),
+        (date(2020, 1, 6), 17)
+    ]
+
+def test_repair(snapshot_setup, runner):
+    with snapshot_setup.app_context():
+        build_snapshots(1)
+        HoldingSnapshot.query.update({HoldingSnapshot.quantity: 0})
+        db.session.commit()
+    result = runner.invoke(args=['snapshot', 'repair', '--user', '1'])
+    assert 'Repaired the snapshots of 1 users, wrote 3 rows' in result.output
+    assert [row[3] for row in snapshots(snapshot_setup)] == [20, 3, 15]
+
+def test_as_of_acb(snapshot_setup, client):
+    before = client.get('/investment_account/1/acb?as_of=2020-01-03')
+    with snapshot_setup.app_context():
+        build_snapshots(1)
+    after = client.get('/investment_account/1/acb?as_of=2020-01-03&built')
+    assert before.get_json() == after.get_json() == \
+        dict(adjust_cost_base = {'VCN.TO': '$239.98'})
+    assert client.get('/investment_account/1/acb?as_of=2020-01-01') \
+        .get_json() == dict(adjust_cost_base = {})
+    assert client.get('/investment_account/1/acb?as_of=2020-01-05') \
+        .get_json() == client.get('/investment_account/1/acb').get_json()
+
+def test_history_reads_fresh_snapshots(snapshot_setup, client):
+    url = '/investment_account/1/history?start=2020-01-03&end=2020-01-04'
+    with snapshot_setup.app_context():
+        build_snapshots(1)
+        HoldingSnapshot.query \
+            .filter(HoldingSnapshot.stock_symbol == "VCN.TO") \
+            .update({HoldingSnapshot.quantity: HoldingSnapshot.quantity * 2})
+        db.session.commit()
+    # the doubled quantities show the snapshots are read, not the ledger
+    assert [value['value'] for value in client.get(url).get_json()] == \
+        ['400', '300']
+    with snapshot_setup.app_context():
+        User.bump_data_version(1)
+        db.session.commit()
+    assert [value['value'] for value in client.get(url).get_json()] == \
+        ['200', '150']
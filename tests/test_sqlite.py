@@ -0,0 +1,119 @@
+from datetime import date
+import pytest
+import threading
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.pool import QueuePool
+from flaskr import CLOSE_KEY, DAILY_KEY, create_app, db, fetch_all_prices
+from flaskr.generators.transaction_aggregate import \
+    TransactionAggregateGenerator
+from flaskr.ledger import price_version_query
+from flaskr.model import (
+    StockMarker,
+    StockTransaction,
+    StockTransactionType,
+    User
+)
+from flaskr.utils.dialects import date_trunc
+
+
+@pytest.fixture
+def sqlite_app(tmp_path):
+    app = create_app({
+        'TESTING': True,
+        'WTF_CSRF_ENABLED': False,
+        'SECRET_KEY': 'dev',
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///%s' % (tmp_path / 'test.db'),
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'DATABASE_MAX_OVERFLOW': 5,
+        'SQLITE_POOL_SIZE': 4
+    })
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(email="newton@mathematicianlineage.com",
+                            password_hash=""))
+        db.session.commit()
+    yield app
+
+def test_pragmas(sqlite_app):
+    with sqlite_app.app_context():
+        def pragma(name):
+            return db.session.execute('PRAGMA %s' % name).scalar()
+        assert pragma('journal_mode') == 'wal'
+        assert pragma('synchronous') == 1
+        assert pragma('foreign_keys') == 1
+        assert pragma('busy_timeout') == 5000
+        assert pragma('mmap_size') == 256 * 1024 * 1024
+
+def test_connections_shared_between_threads(sqlite_app):
+    options = sqlite_app.config['SQLALCHEMY_ENGINE_OPTIONS']
+    assert options['poolclass'] is QueuePool
+    assert options['pool_size'] == 4
+    assert options['max_overflow'] == -1
+    assert options['connect_args'] == dict(check_same_thread = False)
+    with sqlite_app.app_context():
+        engine = db.get_engine(sqlite_app)
+    connections = []
+    def connect():
+        connection = engine.connect()
+        connections.append(connection.connection.connection)
+        connection.close()
+    for i in range(2):
+        thread = threading.Thread(target=connect)
+        thread.start()
+        thread.join()
+    connect()
+    # the connection one thread checked in is reused by the others
+    assert connections[0] is connections[1] is connections[2]
+    held = [engine.connect() for i in range(6)]
+    assert len(set(id(connection.connection.connection)
+                   for connection in held)) == 6
+    for connection in held:
+        connection.close()
+
+def test_aggregate_by_month(sqlite_app):
+    with sqlite_app.app_context():
+        for day in (date(2016, 4, 23), date(2016, 4, 2), date(2017, 1, 5)):
+            db.session.add(StockTransaction(
+                transaction_type = StockTransactionType.dividend,
+                stock_symbol = "VCN.TO",
+                cost_per_unit = 100,
+                quantity = 10,
+                trade_fee = 0,
+                trade_date = day,
+                user_id = 1
+            ))
+        db.session.commit()
+        rows = TransactionAggregateGenerator(1, ['month'], ['count']).next()
+        assert rows == [dict(month = '2016-04-01', count = 2),
+                        dict(month = '2017-01-01', count = 1)]
+        rows = TransactionAggregateGenerator(1, ['year', 'type'],
+                                             ['quantity']).next()
+        assert rows == [
+            dict(year = '2016-01-01', type = 'dividend', quantity = 20),
+            dict(year = '2017-01-01', type = 'dividend', quantity = 10)
+        ]
+
+def test_date_trunc_compiles_per_dialect():
+    expression = date_trunc('month', StockTransaction.trade_date)
+    assert str(expression.compile(dialect=sqlite.dialect())) == \
+        "datetime(stock_transaction.trade_date, 'start of month')"
+    assert str(expression.compile(dialect=postgresql.dialect())) == \
+        'date_trunc(%(date_trunc_1)s, stock_transaction.trade_date)'
+    with pytest.raises(ValueError):
+        date_trunc('week', StockTransaction.trade_date)
+
+def test_price_version_changes_on_refetch(sqlite_app):
+    def provider(close):
+        return lambda stock_symbol: {DAILY_KEY: {
+            '2020-01-02': {CLOSE_KEY: close},
+            '2020-01-03': {CLOSE_KEY: close}
+        }}
+    def price_version():
+        return db.session.query(price_version_query(db.session)).scalar()
+    with sqlite_app.app_context():
+        db.session.add(StockMarker(stock_symbol="VCN.TO", exists=None))
+        db.session.commit()
+        fetch_all_prices(provider('10.00'), 0)
+        first = price_version()
+        fetch_all_prices(provider('11.00'), 0)
+        assert price_version() > first
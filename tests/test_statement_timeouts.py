@@ -0,0 +1,108 @@
+from flask import Blueprint, jsonify
+import json
+import pytest
+from flaskr import create_app, db
+from flaskr.utils.database import apply_pool_options
+from tests.conftest import requires_postgres
+
+
+pytestmark = requires_postgres
+
+slow_bp = Blueprint('slow_bp', __name__, url_prefix='/slow')
+
+@slow_bp.route('/sleep', methods=['GET'])
+def sleep():
+    db.session.execute('SELECT pg_sleep(0.5)')
+    return jsonify('done')
+
+@slow_bp.route('/allowed', methods=['GET'])
+def allowed():
+    db.session.execute('SELECT pg_sleep(0.05)')
+    return jsonify(db.session.execute('SHOW statement_timeout').scalar())
+
+@slow_bp.route('/timeout', methods=['GET'])
+def timeout():
+    return jsonify(db.session.execute('SHOW statement_timeout').scalar())
+
+@pytest.fixture
+def app():
+    app = create_app({
+        'TESTING': True,
+        'WTF_CSRF_ENABLED': False,
+        'SECRET_KEY': 'dev',
+        'SQLALCHEMY_DATABASE_URI': \
+            'postgresql:///portfoliotest',
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'DATABASE_POOL_SIZE': 3,
+        'DATABASE_MAX_OVERFLOW': 2,
+        'DATABASE_POOL_PRE_PING': True,
+        'STATEMENT_TIMEOUT': 2000,
+        'STATEMENT_TIMEOUTS': {
+            'slow_bp': 20,
+            'slow_bp.allowed': 1000,
+            'stock_transaction_bp.get_transaction_stats': 1500,
+            'investment_account_bp.create_investment_account': 50
+        }
+    })
+    app.register_blueprint(slow_bp)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.commit()
+    yield app
+
+def test_blueprint_budget_cancels_statement(app, client):
+    response = client.get('/slow/sleep')
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    assert response.get_json()['error'] == 'statement_timeout'
+
+def test_endpoint_budget_wins_over_blueprint(app, client):
+    response = client.get('/slow/allowed')
+    assert response.status_code == 200
+    assert response.get_json() == '1s'
+
+def test_budget_set_per_transaction(app, client):
+    assert client.get('/slow/timeout').get_json() == '20ms'
+    assert client.get('/slow/sleep').status_code == 503
+    assert client.get('/slow/timeout').get_json() == '20ms'
+
+def test_default_budget(auth_app_user_1, client):
+    response = client.get('/transaction/stats')
+    assert response.status_code == 200
+
+def test_write_route_timeout_is_503(auth_app_user_1, client):
+    with auth_app_user_1.app_context():
+        connection = db.engine.connect()
+    transaction = connection.begin()
+    try:
+        connection.execute('LOCK TABLE investment_account')
+        response = client.post('/investment_account', data=json.dumps(dict(
+            name = 'TFSA',
+            taxable = False
+        )))
+    finally:
+        transaction.rollback()
+        connection.close()
+    assert response.status_code == 503
+    assert response.get_json()['error'] == 'statement_timeout'
+
+def test_no_budget_outside_requests(app):
+    with app.app_context():
+        assert db.session.execute('SHOW statement_timeout').scalar() == '0'
+
+def test_pool_options(app):
+    engine_options = app.config['SQLALCHEMY_ENGINE_OPTIONS']
+    assert engine_options == dict(pool_size = 3, max_overflow = 2,
+                                  pool_pre_ping = True)
+    with app.app_context():
+        assert db.get_engine(app).pool.size() == 3
+
+def test_engine_options_win():
+    config = dict(SQLALCHEMY_ENGINE_OPTIONS = dict(pool_size = 10),
+                  DATABASE_POOL_SIZE = 3,
+                  DATABASE_POOL_RECYCLE = 300)
+    apply_pool_options(config)
+    assert config['SQLALCHEMY_ENGINE_OPTIONS'] == dict(pool_size = 10,
+                                                       pool_recycle = 300)
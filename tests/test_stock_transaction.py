@@ -6,6 +6,7 @@ from flaskr.model import (
     StockTransaction,
     StockTransactionType
 )
+from sqlalchemy import event
 
 
 stock_transaction_1 = dict(
@@ -92,6 +93,28 @@ def test_get_all_transactions(stock_transaction_setup, auth_app_user_2, client):
     json_data = json.loads(response.data)
     assert len(json_data) == 1
 
+def test_get_all_transactions_without_entities(stock_transaction_setup,
+                                               client):
+    with stock_transaction_setup.app_context():
+        db.session.add(StockTransaction(**stock_transaction_2))
+        db.session.commit()
+        expected = [dict(transaction) for transaction in
+                    StockTransaction.query.filter_by(user_id=1)
+                        .order_by(StockTransaction.id)]
+    loaded = []
+    def count_load(target, context):
+        loaded.append(target)
+    event.listen(StockTransaction, 'load', count_load)
+    try:
+        response = client.get('/transaction/all')
+        export = client.get('/transaction/export')
+    finally:
+        event.remove(StockTransaction, 'load', count_load)
+    assert json.loads(response.data) == expected
+    assert export.data.decode().splitlines()[1] == \
+        'buy,VCN.TO,31.41,100,9.99,2016-04-23'
+    assert loaded == []
+
 
 def test_create_transaction(stock_transaction_setup, client):
     response = client.post('/transaction/', data=json.dumps(dict(
@@ -0,0 +1,117 @@
+from datetime import date
+import json
+import pytest
+from flaskr import db
+from flaskr.model import (
+    InvestmentAccount,
+    StockTransaction,
+    StockTransactionType
+)
+
+
+investment_account_1 = dict(
+    name = "TFSA",
+    taxable = False,
+    user_id = 1
+)
+
+stock_transaction_1 = dict(
+    transaction_type = StockTransactionType.buy,
+    stock_symbol = "VCN.TO",
+    cost_per_unit = 3141,
+    quantity = 100,
+    trade_fee = 999,
+    trade_date = date(2016, 4, 23),
+    account_id = 1,
+    user_id = 1
+)
+
+stock_transaction_2 = dict(
+    transaction_type = StockTransactionType.buy,
+    stock_symbol = "VAB.TO",
+    cost_per_unit = 2601,
+    quantity = 200,
+    trade_fee = 999,
+    trade_date = date(2016, 4, 29),
+    account_id = None,
+    user_id = 1
+)
+
+stock_transaction_3 = dict(
+    transaction_type = StockTransactionType.sell,
+    stock_symbol = "VCN.TO",
+    cost_per_unit = 3300,
+    quantity = 50,
+    trade_fee = 995,
+    trade_date = date(2016, 8, 23),
+    account_id = 1,
+    user_id = 1
+)
+
+stock_transaction_4 = dict(
+    transaction_type = StockTransactionType.buy,
+    stock_symbol = "ZPR.TO",
+    cost_per_unit = 992,
+    quantity = 500,
+    trade_fee = 999,
+    trade_date = date(2016, 12, 9),
+    account_id = None,
+    user_id = 2
+)
+
+@pytest.fixture
+def aggregate_setup(auth_app_user_1):
+    auth_app = auth_app_user_1
+    try:
+        with auth_app.app_context():
+            db.session.add(InvestmentAccount(**investment_account_1))
+            db.session.add(StockTransaction(**stock_transaction_1))
+            db.session.add(StockTransaction(**stock_transaction_2))
+            db.session.add(StockTransaction(**stock_transaction_3))
+            db.session.add(StockTransaction(**stock_transaction_4))
+            db.session.commit()
+        yield auth_app
+    except Exception as e:
+        assert False
+    finally:
+        with auth_app.app_context():
+            StockTransaction.query.delete()
+            InvestmentAccount.query.delete()
+            db.session.commit()
+
+def test_aggregate_totals(aggregate_setup, client):
+    response = client.get('/transaction/aggregate')
+    json_data = json.loads(response.data)
+    assert len(json_data) == 1
+    assert json_data[0]['count'] == 3
+    assert json_data[0]['quantity'] == 350
+    assert json_data[0]['gross_amount'] == "9993"
+    assert json_data[0]['fees'] == "29.93"
+
+def test_aggregate_by_symbol(aggregate_setup, client):
+    response = client.get('/transaction/aggregate?group_by=symbol'
+                          '&metrics=count,quantity')
+    json_data = json.loads(response.data)
+    assert json_data == [
+        dict(symbol = "VAB.TO", count = 1, quantity = 200),
+        dict(symbol = "VCN.TO", count = 2, quantity = 150)
+    ]
+
+def test_aggregate_by_month_and_type(aggregate_setup, client):
+    response = client.get('/transaction/aggregate?group_by=month,type'
+                          '&metrics=gross_amount')
+    json_data = json.loads(response.data)
+    assert json_data == [
+        dict(month = "2016-04-01", type = "buy", gross_amount = "8343"),
+        dict(month = "2016-08-01", type = "sell", gross_amount = "1650")
+    ]
+
+def test_aggregate_by_account(aggregate_setup, client):
+    response = client.get('/transaction/aggregate?group_by=account,year'
+                          '&metrics=count&account_id=1')
+    json_data = json.loads(response.data)
+    assert json_data == [dict(account = 1, year = "2016-01-01", count = 2)]
+
+def test_aggregate_unknown_dimension(aggregate_setup, client):
+    response = client.get('/transaction/aggregate?group_by=colour')
+    assert json.loads(response.data) is None
@@ -0,0 +1,111 @@
+import json
+import pytest
+import time
+from flaskr import db, user_cache
+from flaskr.model import User, load_user
+from flaskr.utils.user_cache import CachedUser, UserCache
+
+
+some_user_email = "gauss@mathematicianlineage.com"
+totally_secure_password = "least squares"
+
+@pytest.fixture
+def cache_setup(app):
+    @app.login_manager.request_loader
+    def load_user_from_request(request):
+        return None
+    try:
+        with app.app_context():
+            user = User(email=some_user_email, password_hash="")
+            user.set_password(totally_secure_password)
+            db.session.add(user)
+            db.session.commit()
+        yield app
+    except Exception as e:
+        assert False
+    finally:
+        with app.app_context():
+            User.query.delete()
+            db.session.commit()
+
+def test_cache_hit(cache_setup):
+    with cache_setup.app_context():
+        first = load_user("1")
+        second = load_user("1")
+        assert first is second
+        assert first.email == some_user_email
+        stats = user_cache.stats()
+        assert stats['hits'] == 1
+        assert stats['misses'] == 1
+        assert stats['hit_rate'] == 0.5
+
+def test_cached_user_read_only(cache_setup):
+    with cache_setup.app_context():
+        user = load_user("1")
+        assert isinstance(user, CachedUser)
+        with pytest.raises(AttributeError):
+            user.email = "someone@else.com"
+
+def test_cache_missing_user(cache_setup):
+    with cache_setup.app_context():
+        assert load_user("999") is None
+        assert user_cache.stats()['size'] == 0
+
+def test_cache_invalidated_on_email_change(cache_setup):
+    with cache_setup.app_context():
+        assert load_user("1").email == some_user_email
+        user = User.query.get(1)
+        user.email = "carl@mathematicianlineage.com"
+        db.session.commit()
+        assert load_user("1").email == "carl@mathematicianlineage.com"
+
+def test_cache_invalidated_on_password_change(cache_setup):
+    with cache_setup.app_context():
+        load_user("1")
+        user = User.query.get(1)
+        user.set_password("new password")
+        db.session.commit()
+        assert user_cache.stats()['size'] == 0
+
+def test_cache_invalidated_after_commit(cache_setup):
+    with cache_setup.app_context():
+        load_user("1")
+        user = User.query.get(1)
+        user.email = "carl@mathematicianlineage.com"
+        db.session.flush()
+        assert user_cache.stats()['size'] == 1
+        db.session.rollback()
+        assert load_user("1").email == some_user_email
+        user = User.query.get(1)
+        user.email = "carl@mathematicianlineage.com"
+        db.session.flush()
+        db.session.commit()
+        assert user_cache.stats()['size'] == 0
+
+def test_cache_expiry():
+    cache = UserCache(ttl=0.01, max_size=10)
+    loads = []
+    loader = lambda user_id: loads.append(user_id) or CachedUser(user_id, "")
+    cache.get(1, loader)
+    time.sleep(0.02)
+    cache.get(1, loader)
+    assert loads == [1, 1]
+
+def test_cache_size_bound():
+    cache = UserCache(ttl=60, max_size=2)
+    loader = lambda user_id: CachedUser(user_id, "")
+    cache.get(1, loader)
+    cache.get(2, loader)
+    cache.get(1, loader)
+    cache.get(3, loader)
+    assert list(cache.entries.keys()) == [1, 3]
+
+def test_logged_in_requests_use_cache(cache_setup, client):
+    client.post('/auth/login', data=dict(
+        email = some_user_email,
+        password = totally_secure_password
+    ))
+    client.get('/auth/details')
+    response = client.get('/auth/details')
+    assert json.loads(response.data)['email'] == some_user_email
+    assert user_cache.stats()['hits'] >= 1
@@ -0,0 +1,176 @@
+from datetime import date
+import pytest
+from flaskr import db, ledger
+from flaskr.generators import value_history
+from flaskr.model import (
+    InvestmentAccount,
+    StockPrice,
+    StockTransaction,
+    StockTransactionType
+)
+
+
+stock_prices = [
+    ("VCN.TO", date(2020, 1, 1), 1000),
+    ("VAB.TO", date(2020, 1, 2), 2000),
+    ("VCN.TO", date(2020, 1, 3), 1100),
+    ("VCN.TO", date(2020, 1, 6), 1200)
+]
+
+stock_transactions = [
+    dict(
+        transaction_type = StockTransactionType.buy,
+        stock_symbol = "VCN.TO",
+        cost_per_unit = 1000,
+        quantity = 10,
+        trade_fee = 999,
+        trade_date = date(2020, 1, 2),
+        account_id = 1,
+        user_id = 1
+    ),
+    dict(
+        transaction_type = StockTransactionType.buy,
+        stock_symbol = "VAB.TO",
+        cost_per_unit = 2000,
+        quantity = 5,
+        trade_fee = 999,
+        trade_date = date(2020, 1, 3),
+        account_id = None,
+        user_id = 1
+    ),
+    dict(
+        transaction_type = StockTransactionType.sell,
+        stock_symbol = "VCN.TO",
+        cost_per_unit = 1100,
+        quantity = 4,
+        trade_fee = 999,
+        trade_date = date(2020, 1, 5),
+        account_id = 1,
+        user_id = 1
+    ),
+    dict(
+        transaction_type = StockTransactionType.dividend,
+        stock_symbol = "VCN.TO",
+        cost_per_unit = 10,
+        quantity = 6,
+        trade_fee = 0,
+        trade_date = date(2020, 1, 6),
+        account_id = 1,
+        user_id = 1
+    )
+]
+
+@pytest.fixture
+def value_history_setup(auth_app_user_1):
+    auth_app = auth_app_user_1
+    try:
+        with auth_app.app_context():
+            db.session.add(InvestmentAccount(name="TFSA", taxable=False,
+                                             user_id=1))
+            for stock_symbol, price_date, close_price in stock_prices:
+                db.session.add(StockPrice(stock_symbol=stock_symbol,
+                                          price_date=price_date,
+                                          close_price=close_price))
+            for stock_transaction in stock_transactions:
+                db.session.add(StockTransaction(**stock_transaction))
+            db.session.commit()
+        yield auth_app
+    finally:
+        with auth_app.app_context():
+            StockTransaction.query.delete()
+            InvestmentAccount.query.delete()
+            StockPrice.query.delete()
+            db.session.commit()
+
+def values(response):
+    return [(value['date'], value['value']) for value in response.get_json()]
+
+def test_account_history_daily(value_history_setup, client):
+    response = client.get('/investment_account/1/history'
+                          '?start=2020-01-01&end=2020-01-06')
+    assert values(response) == [
+        ('2020-01-01', '0'),
+        ('2020-01-02', '100'),
+        ('2020-01-03', '110'),
+        ('2020-01-04', '110'),
+        ('2020-01-05', '66'),
+        ('2020-01-06', '72')
+    ]
+
+def test_portfolio_history_daily(value_history_setup, client):
+    response = client.get('/transaction/history'
+                          '?start=2020-01-01&end=2020-01-06')
+    assert values(response) == [
+        ('2020-01-01', '0'),
+        ('2020-01-02', '100'),
+        ('2020-01-03', '210'),
+        ('2020-01-04', '210'),
+        ('2020-01-05', '166'),
+        ('2020-01-06', '172')
+    ]
+
+def test_history_price_before_start(value_history_setup, client):
+    response = client.get('/investment_account/1/history'
+                          '?start=2020-01-04&end=2020-01-04')
+    assert values(response) == [('2020-01-04', '110')]
+
+def test_history_default_start(value_history_setup, client):
+    response = client.get('/transaction/history?end=2020-01-03')
+    assert values(response) == [
+        ('2020-01-02', '100'),
+        ('2020-01-03', '210')
+    ]
+
+def test_history_weekly(value_history_setup, client):
+    response = client.get('/transaction/history'
+                          '?start=2020-01-01&end=2020-01-06&interval=week')
+    assert values(response) == [
+        ('2020-01-05', '166'),
+        ('2020-01-06', '172')
+    ]
+
+def test_history_monthly(value_history_setup, client):
+    response = client.get('/transaction/history'
+                          '?start=2019-12-30&end=2020-01-02&interval=month')
+    assert values(response) == [
+        ('2019-12-31', '0'),
+        ('2020-01-02', '100')
+    ]
+
+def test_history_other_user(value_history_setup, auth_app_user_2, client):
+    response = client.get('/transaction/history'
+                          '?start=2020-01-05&end=2020-01-06')
+    assert values(response) == [('2020-01-05', '0'), ('2020-01-06', '0')]
+
+def test_history_bad_arguments(value_history_setup, client):
+    assert client.get('/transaction/history?interval=hour').get_json() is None
+    assert client.get('/transaction/history'
+                      '?start=2020-01-06&end=2020-01-01').get_json() is None
+    assert client.get('/transaction/history?start=jan').get_json() is None
+
+def test_history_too_many_points(value_history_setup, client):
+    value_history_setup.config['HISTORY_MAX_POINTS'] = 6
+    assert len(client.get('/transaction/history'
+                          '?start=2020-01-01&end=2020-01-06').get_json()) == 6
+    assert client.get('/transaction/history'
+                      '?start=2020-01-01&end=2020-01-07').get_json() is None
+    assert client.get('/investment_account/1/history'
+                      '?start=2019-12-01&end=2020-05-06&interval=month') \
+        .get_json() is not None
+    assert client.get('/investment_account/1/history'
+                      '?start=2019-12-01&end=2020-06-06&interval=month') \
+        .get_json() is None
+
+def test_history_cached_until_end_changes(value_history_setup, client,
+                                          monkeypatch):
+    class Today(date):
+        day_ordinal = date(2020, 1, 4).toordinal()
+        @classmethod
+        def today(cls):
+            return date.fromordinal(cls.day_ordinal)
+    monkeypatch.setattr(ledger, 'date', Today)
+    monkeypatch.setattr(value_history, 'date', Today)
+    url = '/transaction/history?start=2020-01-03'
+    assert values(client.get(url))[-1] == ('2020-01-04', '210')
+    Today.day_ordinal += 1
+    assert values(client.get(url))[-1] == ('2020-01-05', '166')